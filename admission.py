@@ -0,0 +1,136 @@
+"""
+Admission control for the local model, shared by every LocalMind process.
+
+Dashboard renders, scheduler jobs and interactive sessions all talk to the
+same model server. Before generating, each request takes one of
+LOCALMIND_MAX_GENERATIONS slots; slots are byte-range locks on one shared
+lock file, so the cap holds across processes and a crashed process releases
+its slots automatically.
+
+Requests have a priority class: interactive, batch or background. A request
+is not admitted while a higher class is waiting, and the last slot is kept
+for interactive requests, so a background refresh never stalls a live
+debug turn for long. Each process has a default class: interactive, unless
+its entry point picks another (the dashboard runs as batch, scheduler jobs
+as background) or LOCALMIND_PRIORITY overrides it.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; only in-process limits apply
+    fcntl = None
+
+PRIORITIES = ("interactive", "batch", "background")
+
+# Lock file layout: byte N marks "a class-N request is waiting" (held shared
+# by every waiting process); the generation slots start at _SLOT_BASE.
+_SLOT_BASE = 16
+_POLL = 0.05  # seconds between admission attempts
+
+_lock = threading.Lock()
+_fd = None
+_held = set()                         # slot numbers held by this process
+_waiting = [0] * len(PRIORITIES)      # waiting requests in this process, per class
+_default = config.PRIORITY if config.PRIORITY in PRIORITIES else "interactive"  # see set_priority()
+
+
+def set_priority(priority):
+    """Set the default priority class for this process's requests."""
+    global _default
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown priority {priority!r} (expected one of {', '.join(PRIORITIES)})")
+    _default = priority
+
+
+def _file():
+    global _fd
+    if _fd is None:
+        _fd = os.open(config.ADMISSION_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    return _fd
+
+
+def _higher_waiting(rank):
+    """True if a request of a more important class is queued in any process."""
+    for higher in range(rank):
+        if _waiting[higher]:
+            return True
+        if fcntl is None:
+            continue
+        # Safe to probe: this process holds no marker for this class
+        try:
+            fcntl.lockf(_file(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, higher)
+        except OSError:
+            return True
+        fcntl.lockf(_file(), fcntl.LOCK_UN, 1, higher)
+    return False
+
+
+def _try_acquire(rank):
+    """Take a free slot for a request of class `rank`, or return None."""
+    cap = max(1, config.MAX_GENERATIONS)
+    # Lower classes leave the last slot free for interactive requests
+    usable = cap if rank == 0 or cap == 1 else cap - 1
+    with _lock:
+        if _higher_waiting(rank):
+            return None
+        for slot in range(usable):
+            if slot in _held:
+                continue
+            if fcntl is not None:
+                try:
+                    fcntl.lockf(_file(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, _SLOT_BASE + slot)
+                except OSError:
+                    continue
+            _held.add(slot)
+            return slot
+    return None
+
+
+def _release(slot):
+    with _lock:
+        _held.discard(slot)
+        if fcntl is not None:
+            fcntl.lockf(_file(), fcntl.LOCK_UN, 1, _SLOT_BASE + slot)
+
+
+def _mark_waiting(rank, waiting):
+    with _lock:
+        _waiting[rank] += 1 if waiting else -1
+        if fcntl is None:
+            return
+        if waiting and _waiting[rank] == 1:
+            fcntl.lockf(_file(), fcntl.LOCK_SH, 1, rank)
+        elif not waiting and _waiting[rank] == 0:
+            fcntl.lockf(_file(), fcntl.LOCK_UN, 1, rank)
+
+
+@asynccontextmanager
+async def admitted(priority=None):
+    """
+    Wait for a generation slot and hold it for the duration of the block.
+    Yields the time spent queueing, in seconds.
+    """
+    priority = priority or _default
+    rank = PRIORITIES.index(priority)
+    started = time.monotonic()
+    slot = _try_acquire(rank)
+    if slot is None:
+        _mark_waiting(rank, True)
+        try:
+            while slot is None:
+                await asyncio.sleep(_POLL)
+                slot = _try_acquire(rank)
+        finally:
+            _mark_waiting(rank, False)
+    try:
+        yield time.monotonic() - started
+    finally:
+        _release(slot)
+
@@ -1,10 +1,14 @@
-from model import query
+from model import print_stream
+import prompt_budget
+import routing
 
 def run_agent(goal):
     """
     Intelligent multi-step agent with adaptive planning.
     """
     print("\n[ AGENT MODE - INTELLIGENT PLANNING]\n")
+    # The goal is repeated in every step, so keep it to a quarter of the window
+    goal = prompt_budget.fit(goal, prompt_budget.input_budget(routing.model_for("agent")) // 4, "planning toward this goal")
     
     # STEP 1: Deep analysis of user problem and goal
     understanding_prompt = f"""Analyze this goal in depth:
@@ -21,8 +25,7 @@ Provide:
 Be specific, not generic."""
     
     print(" Analyzing goal in depth...\n")
-    understanding = query(understanding_prompt)
-    print(understanding)
+    understanding = print_stream(understanding_prompt, caller="agent")
     print("\n" + "="*70 + "\n")
     
     # STEP 2: Comprehensive action plan
@@ -43,8 +46,7 @@ Provide 5-7 concrete steps with:
 Order by dependencies. Make each step independent."""
     
     print(" Creating comprehensive plan...\n")
-    plan = query(planning_prompt)
-    print(plan)
+    plan = print_stream(planning_prompt, caller="agent")
     print("\n" + "="*70 + "\n")
     
     # STEP 3: Deep execution guidance for Step 1
@@ -66,8 +68,7 @@ For STEP 1 only:
 Be VERY specific and practical."""
     
     print(" Step 1 execution plan (detailed)...\n")
-    execution = query(execution_prompt)
-    print(execution)
+    execution = print_stream(execution_prompt, caller="agent")
     print("\n" + "="*70 + "\n")
     
     # STEP 4: Smart continuation planning
@@ -90,8 +91,7 @@ Provide:
 6. Final tips for success"""
     
     print(" Continuation guidance...\n")
-    continuation = query(continuation_prompt)
-    print(continuation)
+    print_stream(continuation_prompt, caller="agent")
     print("\n" + "="*70)
     print("\n PLANNING COMPLETE - Ready to execute Step 1")
     print("   After completion, return for Step 2 details")
@@ -0,0 +1,242 @@
+"""
+Tiered retention for brain.db logs.
+
+Rows older than the retention window are moved, a batch at a time, into
+one append-only archive segment per month (LOCALMIND_ARCHIVE_DIR/
+YYYY-MM.jsonl.gz). Each batch is appended as its own gzip member and
+synced before its rows are deleted from logs, so a crash can at worst
+archive a row twice (readers skip repeated ids) or leave a torn member
+(readers skip it; the next run cuts it off), never lose a row. Space is
+handed back with incremental vacuum rather than a full VACUUM, and each
+batch holds the write lock only briefly, so CLI sessions keep working
+while it runs.
+
+Archived rows stay reachable: rows() streams them back for analytics and
+search() scans them for `brain search --archive`.
+"""
+import gzip
+import json
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+
+import config
+import db
+import memory
+
+_SEGMENT = re.compile(r"^(\d{4}-\d{2})\.jsonl\.gz$")
+_GZIP_MAGIC = b"\x1f\x8b\x08"
+_COLUMNS = ("id", "timestamp", "ts", "mode", "prompt", "response", "focus", "clarity", "stress")
+
+
+def _segment_path(month):
+    return os.path.join(config.ARCHIVE_DIR, f"{month}.jsonl.gz")
+
+
+def segments():
+    """Archived months, oldest first, as (month, path)."""
+    if not os.path.isdir(config.ARCHIVE_DIR):
+        return []
+    names = sorted(n for n in os.listdir(config.ARCHIVE_DIR) if _SEGMENT.match(n))
+    return [(_SEGMENT.match(n).group(1), os.path.join(config.ARCHIVE_DIR, n)) for n in names]
+
+
+def _append(month, records):
+    """Append records to a month's segment as one gzip member and sync it."""
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    with open(_segment_path(month), "ab") as f:
+        f.write(gzip.compress(data, compresslevel=9))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def ensure_incremental_vacuum(conn=None):
+    """
+    Switch brain.db to incremental auto-vacuum. Databases created since
+    db.connect() set it start that way; an older one needs a single full
+    VACUUM to convert.
+    Returns True if the conversion ran now.
+    """
+    conn = conn or db.connect()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def archive_older_than(days_to_keep, batch=None, pause=None):
+    """
+    Move logs rows older than days_to_keep into monthly segments.
+    Returns the number of rows archived.
+    """
+    batch = batch or config.ARCHIVE_BATCH
+    pause = config.ARCHIVE_PAUSE if pause is None else pause
+    cutoff = memory.epoch(datetime.now()) - int(days_to_keep * 86400)
+    memory.flush()
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    conn = db.connect()
+
+    archived = 0
+    checked = set()
+    while True:
+        rows = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM log_entries WHERE ts < ? ORDER BY id LIMIT ?",
+            (cutoff, batch)
+        ).fetchall()
+        if not rows:
+            break
+        by_month = {}
+        for row in rows:
+            record = dict(zip(_COLUMNS, row))
+            by_month.setdefault((record["timestamp"] or "0000-00")[:7], []).append(record)
+        for month, records in by_month.items():
+            if month not in checked:
+                _truncate_torn(_segment_path(month))  # a crash may have left half a batch
+                checked.add(month)
+            _append(month, records)
+
+        ids = [row[0] for row in rows]
+        with db.transaction() as conn:
+            conn.execute(f"DELETE FROM logs WHERE id IN ({','.join('?' * len(ids))})", ids)
+        archived += len(rows)
+        time.sleep(pause)  # let interactive writers in between batches
+
+    if archived:
+        with db.transaction() as conn:
+            memory.delete_orphan_blobs(conn)
+        # Each step frees pages; fetchall() runs it to completion
+        conn.execute("PRAGMA incremental_vacuum").fetchall()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return archived
+
+
+def _members(data):
+    """
+    Yield (end offset, text) for each complete gzip member in data. A member
+    cut short by a crash mid-append is skipped by resyncing on the next
+    gzip header, so batches appended after it stay readable.
+    """
+    pos = 0
+    while pos < len(data):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # one gzip member
+        try:
+            text = decompressor.decompress(data[pos:])
+        except zlib.error:
+            text = None
+        if text is None or not decompressor.eof:
+            pos = data.find(_GZIP_MAGIC, pos + 1)
+            if pos < 0:
+                return
+            continue
+        pos = len(data) - len(decompressor.unused_data)
+        yield pos, text
+
+
+def _truncate_torn(path):
+    """Cut a segment back to the end of its last complete member before appending to it."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r+b") as f:
+        data = f.read()
+        end = 0
+        for end, _ in _members(data):
+            pass
+        if end < len(data):
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _read_segment(path):
+    """Yield the records of one segment; torn members are skipped."""
+    with open(path, "rb") as raw:
+        data = raw.read()
+    for _, text in _members(data):
+        for line in text.decode("utf-8").splitlines():
+            if line:
+                yield json.loads(line)
+
+
+def _in_range(months, since, until):
+    """Segments that can hold records between since and until, as (month, path)."""
+    first = since.strftime("%Y-%m") if since else None
+    last = until.strftime("%Y-%m") if until else None
+    return [(m, p) for m, p in months if not (first and m < first) and not (last and m > last)]
+
+
+def _filtered(path, since, until, mode):
+    low = memory.epoch(since) if since else None
+    high = memory.epoch(until) if until else None
+    for record in rows_in(path):
+        ts = record.get("ts") or 0
+        if mode and record["mode"] != mode:
+            continue
+        if (low is not None and ts < low) or (high is not None and ts >= high):
+            continue
+        yield record
+
+
+def rows(since=None, until=None, mode=None):
+    """
+    Stream archived records (dicts with the logs columns), oldest month
+    first. since/until are datetimes; each record appears once.
+    """
+    for _, path in _in_range(segments(), since, until):
+        yield from _filtered(path, since, until, mode)
+
+
+def _snippet(text, terms, width):
+    """A window of text around the first matched term, matches marked like memory.search."""
+    text = " ".join((text or "").split())
+    lower = text.lower()
+    hits = [lower.find(t) for t in terms if lower.find(t) >= 0]
+    start = max(0, min(hits) - width // 3) if hits else 0
+    window = text[start:start + width]
+    for term in terms:
+        window = re.sub(re.escape(term), lambda m: f"{memory.MATCH_START}{m.group(0)}{memory.MATCH_END}",
+                        window, flags=re.IGNORECASE)
+    return ("..." if start else "") + window + ("..." if start + width < len(text) else "")
+
+
+def search(text, mode=None, since=None, until=None):
+    """
+    Scan the archives for records containing every word of text, newest
+    month first and best match first within a month. Yields tuples shaped
+    like memory.search() results (score: matched occurrences, negated).
+    """
+    terms = [w.rstrip("*").lower() for w in text.split() if w.rstrip("*")]
+    if not terms:
+        return
+    for _, path in reversed(_in_range(segments(), since, until)):
+        matches = []
+        for record in _filtered(path, since, until, mode):
+            body = f"{record['prompt'] or ''}\n{record['response'] or ''}".lower()
+            counts = [body.count(t) for t in terms]
+            if all(counts):
+                matches.append((-sum(counts), record))
+        matches.sort(key=lambda m: m[0])
+        for score, r in matches:
+            yield (r["id"], r["timestamp"], r["mode"], _snippet(r["prompt"], terms, 90),
+                   _snippet(r["response"], terms, 180), score)
+
+
+def summary():
+    """Per-month archive analytics: (month, entries, compressed bytes, top modes)."""
+    results = []
+    for month, path in segments():
+        modes = Counter(r["mode"] for r in rows_in(path))
+        results.append((month, sum(modes.values()), os.path.getsize(path), modes.most_common(3)))
+    return results
+
+
+def rows_in(path):
+    """Distinct records of one segment file."""
+    seen = set()
+    for record in _read_segment(path):
+        if record["id"] not in seen:
+            seen.add(record["id"])
+            yield record
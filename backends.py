@@ -0,0 +1,483 @@
+"""
+Inference backends.
+
+Each backend turns generate / chat / stream requests into calls on one
+inference server and normalises the replies, so modes never deal with a
+particular server's API:
+
+- OllamaBackend: Ollama's REST API (/api/generate, /api/chat, /api/ps)
+- OpenAIBackend: an OpenAI-compatible local server such as llama.cpp's
+  llama-server (/v1/completions, /v1/chat/completions)
+- FakeBackend: deterministic in-process replies with configurable latency,
+  for benchmarking the dashboard, agent and sysmon without a model
+
+The backend is chosen with LOCALMIND_BACKEND (ollama, openai or fake).
+All methods are coroutines and run on model.py's background event loop.
+Every reply comes with an `info` dict that uses Ollama's metadata names
+(prompt_eval_count, eval_count, eval_duration, ...) whatever the backend.
+prompt_eval_count counts only the prompt tokens actually evaluated; tokens
+served from a KV/prompt cache are reported as prompt_reused when known.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from contextlib import asynccontextmanager
+
+import config
+
+
+class BackendError(Exception):
+    """Raised when the inference server cannot be reached or returns an error."""
+
+
+class _Response:
+    """Status, headers and a lazily read body of one HTTP/1.1 response."""
+
+    def __init__(self, reader, status, headers, timeout):
+        self.reader = reader
+        self.status = status
+        self.headers = headers
+        self.timeout = timeout
+        self.complete = False
+        self.will_close = headers.get("connection", "").lower() == "close"
+
+    async def _read(self, op):
+        try:
+            return await asyncio.wait_for(op, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"no data from the server for {self.timeout:.0f}s") from None
+
+    async def chunks(self):
+        """Yield the body as it arrives, handling chunked and sized bodies."""
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await self._read(self.reader.readline())
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip optional trailers up to the terminating blank line
+                    while (await self._read(self.reader.readline())).strip():
+                        pass
+                    break
+                data = await self._read(self.reader.readexactly(size + 2))
+                yield data[:-2]
+        elif "content-length" in self.headers:
+            remaining = int(self.headers["content-length"])
+            while remaining > 0:
+                data = await self._read(self.reader.read(min(remaining, 65536)))
+                if not data:
+                    raise BackendError("connection closed mid-response")
+                remaining -= len(data)
+                yield data
+        else:
+            self.will_close = True
+            while True:
+                data = await self._read(self.reader.read(65536))
+                if not data:
+                    break
+                yield data
+        self.complete = True
+
+    async def read(self):
+        return b"".join([chunk async for chunk in self.chunks()])
+
+    async def lines(self):
+        """Yield complete newline-terminated lines of the body."""
+        buffer = b""
+        async for chunk in self.chunks():
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line
+        if buffer:
+            yield buffer
+
+
+class AsyncConnectionPool:
+    """
+    Pool of keep-alive HTTP connections to one host, used from one event loop.
+    At most `size` requests are in flight at once; idle connections are reused.
+    """
+
+    def __init__(self, host, size):
+        self.host = host
+        self.size = size
+        self._idle = []
+        self._slots = None
+
+    async def _open(self, timeout):
+        hostname, port = self.host.rsplit(":", 1)
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(hostname, int(port)), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"connecting to {self.host} timed out") from None
+        except OSError as e:
+            raise BackendError(f"cannot reach {self.host}: {e}") from e
+
+    async def _send(self, reader, writer, method, path, body, timeout):
+        head = (
+            f"{method} {path} HTTP/1.1\r\n"
+            f"Host: {self.host}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode("latin-1")
+        writer.write(head + body)
+        await writer.drain()
+        try:
+            status_line = await asyncio.wait_for(reader.readline(), timeout)
+            if not status_line:
+                raise ConnectionResetError("server closed the connection")
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"no response from the server within {timeout:.0f}s") from None
+        return _Response(reader, status, headers, timeout)
+
+    @asynccontextmanager
+    async def request(self, method, path, payload, timeout):
+        """
+        Send a request with an optional JSON payload and yield the open _Response.
+        The connection goes back to the pool only if the body was fully read;
+        on cancellation or error it is closed, which aborts the generation.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        async with self._slots:
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await self._open(timeout)
+            while True:
+                try:
+                    resp = await self._send(reader, writer, method, path, body, timeout)
+                    break
+                except TimeoutError:
+                    writer.close()
+                    raise
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+                    writer.close()
+                    # The server may have dropped an idle keep-alive connection;
+                    # retry once on a fresh socket before giving up.
+                    if reused:
+                        reused = False
+                        reader, writer = await self._open(timeout)
+                        continue
+                    raise BackendError(f"bad response from {self.host}: {e}") from e
+                except BaseException:
+                    writer.close()
+                    raise
+
+            try:
+                if resp.status != 200:
+                    detail = (await resp.read()).decode("utf-8", "replace")
+                    try:
+                        detail = json.loads(detail).get("error", detail)
+                    except (ValueError, AttributeError):
+                        pass
+                    raise BackendError(f"HTTP {resp.status}: {str(detail)[:200]}")
+                yield resp
+            finally:
+                if resp.complete and not resp.will_close:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+
+    def post(self, path, payload, timeout):
+        return self.request("POST", path, payload, timeout)
+
+    def close(self):
+        """Close every idle connection."""
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class Backend:
+    """Interface every inference backend implements."""
+
+    name = "base"
+    # True if stream() accepts the conversation state returned in info["context"]
+    supports_context = False
+
+    async def generate(self, prompt, model, options, timeout, keep_alive):
+        """Return (text, info) for a single completion."""
+        raise NotImplementedError
+
+    async def chat(self, messages, model, options, timeout, keep_alive):
+        """Return (text, info) for a chat completion."""
+        raise NotImplementedError
+
+    async def stream(self, prompt, model, options, timeout, keep_alive, context=None):
+        """
+        Async-yield (token, None) pairs, then ("", info) once generation ends.
+        `context` continues a previous reply's info["context"] (if supported).
+        """
+        raise NotImplementedError
+        yield
+
+    async def embed(self, texts, model, timeout):
+        """Return one embedding (list of floats) per text."""
+        raise BackendError(f"the {self.name} backend does not provide embeddings")
+
+    async def loaded_models(self, timeout):
+        """Return dicts with at least "name" for every model held in memory."""
+        return []
+
+    async def preload(self, model, keep_alive, timeout):
+        """Load a model without generating; returns the server's info dict."""
+        return {}
+
+
+async def _read_json(resp):
+    data = await resp.read()
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise BackendError(f"invalid JSON from server: {data[:100]!r}") from e
+
+
+class OllamaBackend(Backend):
+    """Ollama's native REST API over a keep-alive connection pool."""
+
+    name = "ollama"
+    supports_context = True
+
+    def __init__(self, host, pool_size):
+        self.pool = AsyncConnectionPool(host, pool_size)
+
+    def _payload(self, model, options, keep_alive, **fields):
+        payload = {"model": model, "stream": False, **fields}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        options = dict(options or {})
+        if "format" in options:
+            payload["format"] = options.pop("format")  # a request field, not a model option
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def _post(self, path, payload, timeout):
+        async with self.pool.post(path, payload, timeout) as resp:
+            return await _read_json(resp)
+
+    async def generate(self, prompt, model, options, timeout, keep_alive):
+        data = await self._post("/api/generate", self._payload(model, options, keep_alive, prompt=prompt), timeout)
+        return data.get("response", ""), data
+
+    async def chat(self, messages, model, options, timeout, keep_alive):
+        data = await self._post("/api/chat", self._payload(model, options, keep_alive, messages=messages), timeout)
+        return data.get("message", {}).get("content", ""), data
+
+    async def stream(self, prompt, model, options, timeout, keep_alive, context=None):
+        payload = self._payload(model, options, keep_alive, prompt=prompt, stream=True)
+        if context:
+            # Ollama continues from these tokens without evaluating them again
+            payload["context"] = context
+        async with self.pool.post("/api/generate", payload, timeout) as resp:
+            async for line in resp.lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise BackendError(str(data["error"])[:200])
+                if data.get("response"):
+                    yield data["response"], None
+                if data.get("done"):
+                    if context:
+                        data["prompt_reused"] = len(context)
+                    yield "", data
+
+    async def embed(self, texts, model, timeout):
+        data = await self._post("/api/embed", {"model": model, "input": list(texts)}, timeout)
+        if "error" in data:
+            raise BackendError(str(data["error"])[:200])
+        return data.get("embeddings", [])
+
+    async def loaded_models(self, timeout):
+        async with self.pool.request("GET", "/api/ps", None, timeout) as resp:
+            return (await _read_json(resp)).get("models", [])
+
+    async def preload(self, model, keep_alive, timeout):
+        payload = {"model": model, "stream": False}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return await self._post("/api/generate", payload, timeout)
+
+
+class OpenAIBackend(Backend):
+    """
+    OpenAI-compatible completion server (llama.cpp's llama-server, vLLM, ...).
+    Such servers keep their model loaded, so residency calls are no-ops.
+    """
+
+    name = "openai"
+
+    # Ollama option names -> OpenAI request fields
+    OPTION_FIELDS = {
+        "num_predict": "max_tokens",
+        "temperature": "temperature",
+        "top_p": "top_p",
+        "stop": "stop",
+        "seed": "seed",
+    }
+
+    def __init__(self, host, pool_size):
+        self.pool = AsyncConnectionPool(host, pool_size)
+
+    def _payload(self, model, options, **fields):
+        payload = {"model": model, **fields}
+        for key, value in (options or {}).items():
+            if key in self.OPTION_FIELDS:
+                payload[self.OPTION_FIELDS[key]] = value
+        if (options or {}).get("format") == "json":
+            payload["response_format"] = {"type": "json_object"}
+        return payload
+
+    @staticmethod
+    def _info(data):
+        usage = data.get("usage") or {}
+        timings = data.get("timings") or {}
+        info = {
+            "prompt_eval_count": usage.get("prompt_tokens"),
+            "eval_count": usage.get("completion_tokens"),
+        }
+        # Prompt-cache hits: llama.cpp evaluates only timings.prompt_n tokens
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is None and "prompt_n" in timings and usage.get("prompt_tokens") is not None:
+            cached = usage["prompt_tokens"] - timings["prompt_n"]
+        if cached is not None:
+            info["prompt_reused"] = cached
+            if info["prompt_eval_count"] is not None:
+                info["prompt_eval_count"] -= cached
+        # llama.cpp reports its own timings in milliseconds
+        if "prompt_ms" in timings:
+            info["prompt_eval_duration"] = timings["prompt_ms"] * 1e6
+        if "predicted_ms" in timings:
+            info["eval_duration"] = timings["predicted_ms"] * 1e6
+        return {k: v for k, v in info.items() if v is not None}
+
+    async def _post(self, path, payload, timeout):
+        async with self.pool.post(path, payload, timeout) as resp:
+            data = await _read_json(resp)
+        if "error" in data:
+            raise BackendError(str(data["error"])[:200])
+        return data
+
+    async def generate(self, prompt, model, options, timeout, keep_alive):
+        data = await self._post("/v1/completions", self._payload(model, options, prompt=prompt), timeout)
+        choices = data.get("choices") or [{}]
+        return choices[0].get("text", ""), self._info(data)
+
+    async def chat(self, messages, model, options, timeout, keep_alive):
+        data = await self._post("/v1/chat/completions", self._payload(model, options, messages=messages), timeout)
+        choices = data.get("choices") or [{}]
+        return (choices[0].get("message") or {}).get("content", ""), self._info(data)
+
+    async def stream(self, prompt, model, options, timeout, keep_alive, context=None):
+        payload = self._payload(model, options, prompt=prompt, stream=True)
+        info = {}
+        async with self.pool.post("/v1/completions", payload, timeout) as resp:
+            # Server-sent events: "data: {...}" lines, ended by "data: [DONE]"
+            async for line in resp.lines():
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                body = line[5:].strip()
+                if body == b"[DONE]":
+                    continue
+                data = json.loads(body)
+                if "error" in data:
+                    raise BackendError(str(data["error"])[:200])
+                info.update(self._info(data))
+                choices = data.get("choices") or [{}]
+                token = choices[0].get("text") or ""
+                if token:
+                    yield token, None
+        yield "", info
+
+    async def embed(self, texts, model, timeout):
+        data = await self._post("/v1/embeddings", {"model": model, "input": list(texts)}, timeout)
+        return [item["embedding"] for item in sorted(data.get("data", []), key=lambda d: d.get("index", 0))]
+
+    async def loaded_models(self, timeout):
+        async with self.pool.request("GET", "/v1/models", None, timeout) as resp:
+            return [{"name": m.get("id", "")} for m in (await _read_json(resp)).get("data", [])]
+
+
+class FakeBackend(Backend):
+    """
+    Deterministic in-process backend. Replies are derived from a hash of the
+    prompt and arrive after `latency` seconds, one token every
+    `token_latency` seconds, so throughput can be measured without a model.
+    Like a real server it keeps the last prompt and reply as a prompt cache:
+    a prompt that extends them only counts its new part as evaluated.
+    """
+
+    name = "fake"
+
+    WORDS = ("system", "disk", "cache", "focus", "check", "review", "error", "step",
+             "plan", "clean", "memory", "log", "update", "kernel", "usage", "trend")
+
+    def __init__(self, latency=0.0, token_latency=0.0, tokens=32):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self._cached = ""
+
+    def _reply(self, text, options=None):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        count = min(self.tokens, (options or {}).get("num_predict") or self.tokens)
+        words = [self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(count)]
+        return [w + " " for w in words]
+
+    def _info(self, prompt, tokens):
+        shared = len(os.path.commonprefix([self._cached, prompt]))
+        self._cached = prompt + "".join(tokens)
+        return {
+            "prompt_eval_count": (len(prompt) - shared) // 4,
+            "prompt_reused": shared // 4,
+            "eval_count": len(tokens),
+            "prompt_eval_duration": self.latency * 1e9,
+            "eval_duration": self.token_latency * len(tokens) * 1e9,
+        }
+
+    async def generate(self, prompt, model, options, timeout, keep_alive):
+        tokens = self._reply(prompt, options)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        return "".join(tokens).strip(), self._info(prompt, tokens)
+
+    async def chat(self, messages, model, options, timeout, keep_alive):
+        return await self.generate(json.dumps(messages), model, options, timeout, keep_alive)
+
+    async def stream(self, prompt, model, options, timeout, keep_alive, context=None):
+        await asyncio.sleep(self.latency)
+        tokens = self._reply(prompt, options)
+        for token in tokens:
+            await asyncio.sleep(self.token_latency)
+            yield token, None
+        yield "", self._info(prompt, tokens)
+
+    async def embed(self, texts, model, timeout):
+        await asyncio.sleep(self.latency)
+        # Deterministic unit-free vectors; similar only when texts are equal
+        return [[b / 255 - 0.5 for b in hashlib.sha256(t.encode("utf-8")).digest()] for t in texts]
+
+    async def loaded_models(self, timeout):
+        return [{"name": config.MODEL, "expires_at": ""}]
+
+
+def create(name=None):
+    """Build the backend named by LOCALMIND_BACKEND (or `name`)."""
+    name = (name or config.BACKEND).lower()
+    if name == "ollama":
+        return OllamaBackend(config.OLLAMA_HOST, config.POOL_SIZE)
+    if name == "openai":
+        return OpenAIBackend(config.OPENAI_HOST, config.POOL_SIZE)
+    if name == "fake":
+        return FakeBackend(config.FAKE_LATENCY, config.FAKE_TOKEN_LATENCY)
+    raise ValueError(f"unknown backend {name!r} (expected ollama, openai or fake)")
@@ -3,12 +3,17 @@ import importlib
 import json
 from pathlib import Path
 from datetime import datetime, timedelta
-import sqlite3
-import subprocess
 import os
 
-from model import query
+from model import query, print_stream
+import archive
+import config
+import db
 import memory
+import prompt_budget
+import rollups
+import routing
+import vector_memory
 
 memory.init()
 
@@ -23,45 +28,46 @@ AVAILABLE_MODES = [
     "weekly",
     "agent",
     "sysmon",
-    "cleanup"
+    "cleanup",
+    "stats",
+    "search",
+    "recall",
+    "archive",
+    "rollups"
 ]
 
+# Modes whose prompts can quote relevant past answers (LOCALMIND_RECALL_CONTEXT=1)
+RECALL_MODES = ("plan", "debug", "code")
+
 
 def cleanup_old_logs(days_to_keep=7):
-    """Delete logs older than specified days and clear Ollama history"""
-    cutoff_date = (datetime.now() - timedelta(days=days_to_keep)).isoformat()
-    
-    conn = sqlite3.connect("brain.db")
-    c = conn.cursor()
-    
-    # Get count of logs to be deleted
-    c.execute("SELECT COUNT(*) FROM logs WHERE timestamp < ?", (cutoff_date,))
-    count = c.fetchone()[0]
-    
+    """
+    Move logs older than specified days into the monthly archive (see
+    archive.py) and hand the freed space back to the filesystem.
+    """
+    conn = db.connect()
+    if archive.ensure_incremental_vacuum(conn):
+        print("✓ Database switched to incremental vacuum (one-time full VACUUM)")
+
+    count = archive.archive_older_than(days_to_keep)
     if count == 0:
         print("No old logs to clean up.")
         return
-    
-    # Delete old logs
-    c.execute("DELETE FROM logs WHERE timestamp < ?", (cutoff_date,))
-    conn.commit()
-    
-    # Vacuum to reclaim space
-    c.execute("VACUUM")
-    conn.close()
-    
-    print(f"✓ Deleted {count} log entries older than {days_to_keep} days")
-    print(f"✓ Database optimized and space reclaimed")
-    
-    # Clear Ollama model cache/history
-    try:
-        subprocess.run(["ollama", "list"], capture_output=True, timeout=5)
-        print("✓ Ollama cache remains available for inference")
-    except Exception as e:
-        print(f"Note: Could not verify Ollama status: {e}")
-    
-    print("\nCleanup complete. Your brain database is fresh and lean!")
 
+    print(f"✓ Archived {count} log entries older than {days_to_keep} days to {config.ARCHIVE_DIR}")
+    print(f"✓ Freed space reclaimed incrementally")
+    print("\nCleanup complete. Older entries remain searchable with: brain search <words> --archive")
+
+
+def show_archive():
+    """List archive segments with their entry counts and most used modes."""
+    segments = archive.summary()
+    if not segments:
+        print("Nothing archived yet.")
+        return
+    for month, entries, size, modes in segments:
+        top = ", ".join(f"{mode} {count}" for mode, count in modes)
+        print(f"{month}  {entries:6d} entries  {size / 1024:8.1f} KiB  ({top})")
 
 
 def handle_codefile(filepath):
@@ -73,60 +79,37 @@ def handle_codefile(filepath):
 
     content = path.read_text()
 
-    prompt = f"""
+    prompt = prompt_budget.build(lambda text: f"""
 You are reviewing this file.
 Explain issues, improvements, and structure clearly.
 
 File Content:
-{content}
-"""
+{text}
+""", content, purpose=f"a code review of {path.name}", model=routing.model_for("codefile"))
 
-    response = query(prompt)
-    print(response)
-    memory.save("codefile", filepath, response)
+    response = print_stream(prompt, caller="codefile")
+    memory.save("codefile", filepath, response, sync=True)
 
 
 #weekly summary mde
 def weekly_summary():
-    conn = sqlite3.connect("brain.db")
-    c = conn.cursor()
-
-    last_week = (datetime.now() - timedelta(days=7)).isoformat()
-
-    c.execute("""
-        SELECT mode, prompt, response, focus, clarity, stress
-        FROM logs
-        WHERE timestamp > ?
-        ORDER BY timestamp
-    """, (last_week,))
-
-    rows = c.fetchall()
-    conn.close()
+    week = rollups.totals(rollups.since_day(7))
 
-    if not rows:
+    if not week["entries"]:
         print("No logs from the past week.")
         return
 
     from rich.console import Console
     from rich.panel import Panel
-    from collections import defaultdict
     
     console = Console()
     
-    # Extract metrics
-    focus_vals = [r[3] for r in rows if r[3] is not None]
-    clarity_vals = [r[4] for r in rows if r[4] is not None]
-    stress_vals = [r[5] for r in rows if r[5] is not None]
-
-    # Count by mode
-    mode_counts = defaultdict(int)
-    for mode, _, _, _, _, _ in rows:
-        mode_counts[mode] += 1
+    mode_counts = week["modes"]
 
     # Calculate averages
-    avg_focus = round(sum(focus_vals)/len(focus_vals), 1) if focus_vals else 0
-    avg_clarity = round(sum(clarity_vals)/len(clarity_vals), 1) if clarity_vals else 0
-    avg_stress = round(sum(stress_vals)/len(stress_vals), 1) if stress_vals else 0
+    avg_focus = round(week["avg_focus"], 1) if week["avg_focus"] is not None else 0
+    avg_clarity = round(week["avg_clarity"], 1) if week["avg_clarity"] is not None else 0
+    avg_stress = round(week["avg_stress"], 1) if week["avg_stress"] is not None else 0
 
     # Build activity summary
     activities_summary = "\n".join([
@@ -165,7 +148,7 @@ def weekly_summary():
 
 [bold cyan]ACTIVITY BREAKDOWN[/bold cyan]
 {activities_summary}
-Total entries: {len(rows)}
+Total entries: {week['entries']}
 
 [bold cyan]KEY OBSERVATIONS[/bold cyan]
 """
@@ -191,9 +174,196 @@ Total entries: {len(rows)}
     console.print(Panel(assessment, border_style="cyan"))
 
 
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def parse_window(text):
+    """Parse a time window like '24h', '7d' or '3' (days) into a timedelta."""
+    text = text.strip().lower()
+    if text.endswith("h"):
+        return timedelta(hours=float(text[:-1]))
+    if text.endswith("d"):
+        text = text[:-1]
+    return timedelta(days=float(text))
+
+
+def llm_stats(window=timedelta(days=7)):
+    """Show LLM latency percentiles per calling mode/panel over a time window."""
+    rows = memory.llm_calls_since(datetime.now() - window)
+
+    if not rows:
+        print("No LLM calls recorded in this window.")
+        return
+
+    from rich.console import Console
+    from rich.table import Table
+    from collections import defaultdict
+
+    by_caller = defaultdict(list)
+    for row in rows:
+        by_caller[row[0]].append(row)
+
+    table = Table(title=f"[bold]LLM Calls - last {window}[/bold]", show_header=True)
+    table.add_column("Caller", style="magenta")
+    table.add_column("Calls", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p95", justify="right")
+    table.add_column("p99", justify="right")
+    table.add_column("TTFT p50", justify="right")
+    table.add_column("Tok/s", justify="right")
+    table.add_column("Queue p95", justify="right")
+    table.add_column("Timeouts", justify="right", style="yellow")
+    table.add_column("Errors", justify="right", style="red")
+
+    for caller, calls in sorted(by_caller.items(), key=lambda x: len(x[1]), reverse=True):
+        latencies = [c[1] for c in calls if c[4] == "ok" and c[1] is not None]
+        ttfts = [c[2] for c in calls if c[4] == "ok" and c[2] is not None]
+        speeds = [c[3] for c in calls if c[4] == "ok" and c[3]]
+        waits = [c[5] or 0.0 for c in calls]
+        fmt = lambda v: f"{v:.1f}s"
+        table.add_row(
+            caller,
+            str(len(calls)),
+            fmt(percentile(latencies, 50)) if latencies else "-",
+            fmt(percentile(latencies, 95)) if latencies else "-",
+            fmt(percentile(latencies, 99)) if latencies else "-",
+            fmt(percentile(ttfts, 50)) if ttfts else "-",
+            f"{sum(speeds) / len(speeds):.1f}" if speeds else "-",
+            fmt(percentile(waits, 95)),
+            str(sum(1 for c in calls if c[4] == "timeout")),
+            str(sum(1 for c in calls if c[4] == "error")),
+        )
+
+    Console().print(table)
+
+
+def parse_when(text):
+    """A point in time from a window ('7d', '24h' ago) or an ISO date ('2024-05-01')."""
+    try:
+        return datetime.now() - parse_window(text)
+    except ValueError:
+        return datetime.fromisoformat(text)
+
+
+def search_logs(args, per_page=10):
+    """
+    Full-text search of past prompts and responses, best match first.
+    args: search words plus optional --mode MODE, --since WHEN, --until WHEN,
+    --per-page N, and --archive to continue into archived months after the
+    live results.
+    Results are shown a page at a time.
+    """
+    from rich.console import Console
+    from rich.markup import escape
+
+    words, filters = [], {}
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in ("--mode", "--since", "--until", "--per-page") and args:
+            filters[arg[2:]] = args.pop(0)
+        elif arg == "--archive":
+            filters["archive"] = True
+        else:
+            words.append(arg)
+    try:
+        since = parse_when(filters["since"]) if "since" in filters else None
+        until = parse_when(filters["until"]) if "until" in filters else None
+    except ValueError:
+        print("Dates are windows like 7d / 24h or ISO dates like 2024-05-01.")
+        return
+    try:
+        per_page = int(filters.get("per-page", per_page))
+    except ValueError:
+        per_page = 0
+    if per_page < 1:
+        print("--per-page must be a whole number of at least 1.")
+        return
+    if not words:
+        print("Usage: brain search <words> [--mode MODE] [--since 7d] [--until 2024-05-01] [--per-page N] [--archive]")
+        return
+
+    console = Console()
+
+    def highlight(snippet):
+        text = escape((snippet or "").replace("\n", " "))
+        return text.replace(memory.MATCH_START, "[bold yellow]").replace(memory.MATCH_END, "[/bold yellow]")
+
+    text = " ".join(words)
+
+    def results():
+        offset = 0
+        while True:
+            page = list(memory.search(text, filters.get("mode"), since, until, per_page, offset))
+            yield from page
+            if len(page) < per_page:
+                break
+            offset += per_page
+        if filters.get("archive"):
+            yield from archive.search(text, filters.get("mode"), since, until)
+
+    shown = 0
+    stream = results()
+    for _, timestamp, mode, prompt, response, _ in stream:
+        if shown and shown % per_page == 0 and sys.stdin.isatty():
+            if input("-- more (Enter), q to quit -- ").strip().lower() == "q":
+                return
+        console.print(f"[dim]{timestamp[:16].replace('T', ' ')}[/dim] [magenta]{mode}[/magenta]")
+        console.print(f"  [bold]>[/bold] {highlight(prompt)}")
+        console.print(f"    {highlight(response)}")
+        shown += 1
+    if not shown:
+        print("No matches.")
+
+
+def recall_logs(args, k=5):
+    """
+    Show the past interactions closest in meaning to the given text.
+    args: words plus optional --mode MODE, -k N, or --rebuild alone.
+    """
+    from rich.console import Console
+    from rich.markup import escape
+
+    if not vector_memory.available():
+        print("Vector memory needs numpy (pip install numpy) and LOCALMIND_VECTOR_MEMORY enabled.")
+        return
+    if args == ["--rebuild"]:
+        print(f"✓ Indexed {vector_memory.update(rebuild=True)} entries")
+        return
+
+    words, mode = [], None
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--mode" and args:
+            mode = args.pop(0)
+        elif arg == "-k" and args and args[0].isdigit():
+            k = int(args.pop(0))
+        else:
+            words.append(arg)
+    if not words:
+        print("Usage: brain recall <text> [--mode MODE] [-k N]   |   brain recall --rebuild")
+        return
+
+    results = vector_memory.recall(" ".join(words), k, mode)
+    if not results:
+        print("Nothing similar in memory yet.")
+        return
+    console = Console()
+    for _, timestamp, mode, prompt, response, score in results:
+        console.print(f"[cyan]{score:.2f}[/cyan] [dim]{timestamp[:16].replace('T', ' ')}[/dim] [magenta]{mode}[/magenta]")
+        console.print(f"  [bold]>[/bold] {escape((prompt or '')[:160])}")
+        console.print(f"    {escape(' '.join((response or '').split())[:300])}")
+
+
 #agent mode, still needs work.i hate this personally,might even delete
 def run_agent(goal):
     print("\n--- AGENT START ---\n")
+    goal = prompt_budget.fit(goal, prompt_budget.input_budget(routing.model_for("agent")) // 4, "planning toward this goal")
 
     plan_prompt = f"""
 Break this goal into 3 concrete steps.
@@ -201,24 +371,24 @@ Break this goal into 3 concrete steps.
 Goal:
 {goal}
 """
-    plan = query(plan_prompt)
-    print("PLAN:\n", plan)
+    print("PLAN:")
+    plan = print_stream(plan_prompt, caller="agent")
 
     execute_prompt = f"""
 Execute step 1 from this plan:
 
 {plan}
 """
-    execution = query(execute_prompt)
-    print("\nEXECUTION:\n", execution)
+    print("\nEXECUTION:")
+    execution = print_stream(execute_prompt, caller="agent")
 
     review_prompt = f"""
 Review this output critically and suggest improvements:
 
 {execution}
 """
-    review = query(review_prompt)
-    print("\nREVIEW:\n", review)
+    print("\nREVIEW:")
+    review = print_stream(review_prompt, caller="agent")
 
     memory.save("agent", goal, review)
 
@@ -271,6 +441,39 @@ def main():
         cleanup_old_logs(days)
         return
 
+    # LLM latency stats
+    if mode == "stats":
+        window = timedelta(days=7)
+        if len(sys.argv) > 2:
+            try:
+                window = parse_window(sys.argv[2])
+            except ValueError:
+                print("Usage: brain stats [window]")
+                print("Example: brain stats 24h  (or 7d, default 7 days)")
+                return
+        llm_stats(window)
+        return
+
+    # Full-text search of past sessions
+    if mode == "search":
+        search_logs(sys.argv[2:])
+        return
+
+    # Archived history
+    if mode == "archive":
+        show_archive()
+        return
+
+    # Recompute the activity rollups from logs and the archive
+    if mode == "rollups":
+        print(f"Rollups rebuilt: {rollups.rebuild()} days of activity.")
+        return
+
+    # Semantic recall of past sessions
+    if mode == "recall":
+        recall_logs(sys.argv[2:])
+        return
+
     # Agent mode
     if mode == "agent":
         if len(sys.argv) < 3:
@@ -296,13 +499,18 @@ def main():
 
     message = " ".join(sys.argv[2:])
     module = importlib.import_module(f"modes.{mode}")
-    prompt = module.build_prompt(message)
-
-    response = query(prompt)
+    render = module.build_prompt
+    if config.RECALL_CONTEXT and mode in RECALL_MODES:
+        past = vector_memory.context_block(message)
+        render = lambda text: module.build_prompt(text) + past
+    prompt = prompt_budget.build(render, message, purpose=f"the {mode} request",
+                                 model=routing.model_for(mode))
 
     focus = clarity = stress = None
 
     if mode == "journal":
+        # Journal replies are JSON, so they are parsed whole rather than streamed
+        response = query(prompt, caller=mode)
         try:
             parsed = json.loads(response)
             focus = parsed.get("focus")
@@ -312,9 +520,10 @@ def main():
         except Exception:
             print(response)
     else:
-        print(response)
+        response = print_stream(prompt, caller=mode)
 
-    memory.save(mode, message, response, focus, clarity, stress)
+    # Interactive: committed before the command returns
+    memory.save(mode, message, response, focus, clarity, stress, sync=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""
+Runtime configuration for LocalMind.
+Every setting can be overridden with a LOCALMIND_<NAME> environment variable.
+"""
+import os
+
+
+def _env(name, default, cast=str):
+    """Read LOCALMIND_<name> from the environment, falling back to default."""
+    value = os.environ.get(f"LOCALMIND_{name}")
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+def _host(value, default_port):
+    """Normalise a server address to host:port."""
+    host = value.split("://", 1)[-1].rstrip("/")
+    if host.startswith("0.0.0.0"):
+        host = "127.0.0.1" + host[len("0.0.0.0"):]
+    if ":" not in host:
+        host += f":{default_port}"
+    return host
+
+
+def _ollama_host():
+    """Resolve host:port of the Ollama server (honours Ollama's own OLLAMA_HOST)."""
+    return _host(_env("OLLAMA_HOST", os.environ.get("OLLAMA_HOST", "127.0.0.1:11434")), 11434)
+
+
+# --- LLM ---
+BACKEND = _env("BACKEND", "ollama")     # ollama | openai (llama.cpp server etc.) | fake
+MODEL = _env("MODEL", "qwen-lite")          # main model: code, debugging, planning
+SMALL_MODEL = _env("SMALL_MODEL", MODEL)    # fast model for short summaries (see routing.py)
+ROUTES_FILE = _env("ROUTES", "")            # optional JSON file overriding routing.ROUTES
+OLLAMA_HOST = _ollama_host()
+OPENAI_HOST = _host(_env("OPENAI_HOST", "127.0.0.1:8080"), 8080)
+POOL_SIZE = _env("POOL_SIZE", 4, int)   # max concurrent requests to the server (match OLLAMA_NUM_PARALLEL)
+TIMEOUT = _env("TIMEOUT", 120, float)   # seconds; upper bound for adaptive timeouts
+ADAPTIVE_TIMEOUT = _env("ADAPTIVE_TIMEOUT", True, lambda v: v.lower() not in ("0", "false", "no"))
+TIMEOUT_MIN = _env("TIMEOUT_MIN", 15, float)      # adaptive timeouts never go below this
+TIMEOUT_FACTOR = _env("TIMEOUT_FACTOR", 3, float)  # timeout = factor x recent p95 latency
+BREAKER_FAILURES = _env("BREAKER_FAILURES", 3, int)      # consecutive failures that open the circuit
+BREAKER_COOLDOWN = _env("BREAKER_COOLDOWN", 60, float)   # seconds before a probe call is allowed
+NUM_CTX = _env("NUM_CTX", 0, int)                  # context window; 0 = per-model size in prompt_budget
+OUTPUT_RESERVE = _env("OUTPUT_RESERVE", 512, int)  # tokens kept free for the reply
+KEEP_ALIVE = _env("KEEP_ALIVE", "30m")  # how long Ollama keeps the model loaded after a call
+PIN_HOURS = _env("PIN_HOURS", "")       # e.g. "9-18": keep the model loaded all day in this window
+MAX_GENERATIONS = _env("MAX_GENERATIONS", POOL_SIZE, int)  # concurrent generations across all processes
+PRIORITY = _env("PRIORITY", "")  # interactive | batch | background; empty = per entry point
+PATCH_FIXES = _env("PATCH_FIXES", True, lambda v: v.lower() not in ("0", "false", "no"))  # debug fixes as diffs
+FUSED_DASHBOARD = _env("FUSED_DASHBOARD", False, lambda v: v.lower() in ("1", "true", "yes"))
+SHOW_TIMING = _env("SHOW_TIMING", False, lambda v: v.lower() in ("1", "true", "yes"))
+
+# --- Fake backend (LOCALMIND_BACKEND=fake) ---
+FAKE_LATENCY = _env("FAKE_LATENCY", 0.05, float)              # seconds before the first token
+FAKE_TOKEN_LATENCY = _env("FAKE_TOKEN_LATENCY", 0.005, float)  # seconds per token
+
+# --- Database ---
+DB = _env("DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "brain.db"))
+# Lock file shared by every process for the MAX_GENERATIONS slots (admission.py)
+ADMISSION_FILE = _env("ADMISSION_FILE", os.path.join(os.path.dirname(DB), "llm_admission.lock"))
+DB_BUSY_TIMEOUT = _env("DB_BUSY_TIMEOUT", 10, float)  # seconds a writer waits for the lock
+DB_CACHE_MB = _env("DB_CACHE_MB", 16, float)          # page cache per connection
+DB_MMAP_MB = _env("DB_MMAP_MB", 128, float)           # memory-mapped I/O window
+BLOB_MIN_BYTES = _env("BLOB_MIN_BYTES", 512, int)    # bodies this large are stored compressed in blobs
+# "group": queue log/telemetry rows and commit them in groups (write-behind);
+# "sync": commit every row before returning
+DURABILITY = _env("DURABILITY", "group")
+WRITE_BATCH = _env("WRITE_BATCH", 64, int)            # rows per group commit
+WRITE_DELAY = _env("WRITE_DELAY", 0.5, float)         # max seconds a row waits in the queue
+
+# --- Retention (brain cleanup / scheduler.py) ---
+ARCHIVE_DIR = _env("ARCHIVE_DIR", os.path.splitext(DB)[0] + ".archive")
+ARCHIVE_BATCH = _env("ARCHIVE_BATCH", 500, int)        # rows moved per short write transaction
+ARCHIVE_PAUSE = _env("ARCHIVE_PAUSE", 0.05, float)     # seconds between batches, for interactive writers
+
+# --- Vector memory (semantic recall, needs numpy) ---
+VECTOR_MEMORY = _env("VECTOR_MEMORY", True, lambda v: v.lower() not in ("0", "false", "no"))
+VECTOR_DIR = _env("VECTOR_DIR", os.path.splitext(DB)[0] + ".vectors")
+VECTOR_DTYPE = _env("VECTOR_DTYPE", "int8")           # int8 | float16
+EMBED_MODEL = _env("EMBED_MODEL", "")                 # backend embedding model; empty = hashed TF-IDF
+RECALL_CONTEXT = _env("RECALL_CONTEXT", False, lambda v: v.lower() in ("1", "true", "yes"))  # add past answers to plan/debug/code
+RECALL_MIN_SCORE = _env("RECALL_MIN_SCORE", 0.25, float)  # cosine similarity needed to be injected
+
+# --- Response cache ---
+CACHE_ENABLED = _env("CACHE", True, lambda v: v.lower() not in ("0", "false", "no"))
+CACHE_DB = _env("CACHE_DB", os.path.join(os.path.dirname(DB), "llm_cache.db"))  # claims use CACHE_DB + ".inflight"
+CACHE_TTL = _env("CACHE_TTL", 24 * 3600, float)             # seconds
+CACHE_MAX_BYTES = _env("CACHE_MAX_MB", 20, float) * 1024 * 1024
@@ -3,19 +3,30 @@ from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
 from rich.progress import Progress
-import sqlite3
-from datetime import datetime, timedelta
-from collections import defaultdict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import json
 
-from dashboard_insights import smart_insights
-from dashboard_trends import visual_trends
-from dashboard_analytics import llm_interaction_analytics
-from dashboard_timeline import system_health_timeline
-from dashboard_alert import print_top_system_alert
+import admission
+import config
+import dashboard_analytics
+import dashboard_fused
+import dashboard_insights
+import dashboard_timeline
+import memory
+import residency
+import rollups
+from log_rows import LogRows
+from dashboard_insights import build_smart_insights
+from dashboard_trends import build_visual_trends
+from dashboard_analytics import build_llm_interaction_analytics
+from dashboard_timeline import build_system_health_timeline
+from dashboard_alert import build_top_system_alert
 
 
 console = Console()
+# Dashboard generations yield to interactive sessions sharing the model
+admission.set_priority(config.PRIORITY or "batch")
 
 # --- SYSTEM STATUS (from sysmon) ---
 
@@ -76,39 +87,79 @@ def print_system_status(status):
     console.print(Panel(sys_table, border_style="red", padding=(1, 2)))
 
 
-conn = sqlite3.connect("brain.db")
-c = conn.cursor()
-
-# gettin all logs from the past
-last_week = (datetime.now() - timedelta(days=7)).isoformat()
-c.execute("""
-    SELECT timestamp, mode, prompt, response, focus, clarity, stress
-    FROM logs
-    WHERE timestamp > ?
-    ORDER BY timestamp DESC
-""", (last_week,))
-
-rows = c.fetchall()
-conn.close()
-
-if not rows:
+def run_panels(builders):
+    """
+    Build LLM-backed panels concurrently and print them in the given order.
+    `builders` is a list of (build_fn, args) pairs; each build_fn returns a
+    renderable or None. At most config.POOL_SIZE generations run at once.
+    """
+    with ThreadPoolExecutor(max_workers=config.POOL_SIZE) as pool:
+        futures = [pool.submit(build, *args) for build, args in builders]
+        for future in futures:
+            renderable = future.result()
+            if renderable is not None:
+                console.print(renderable)
+
+
+def llm_panels(status, include_alert=True):
+    """
+    The independent LLM-backed panels, in display order.
+    With LOCALMIND_FUSED_DASHBOARD=1 their texts are first requested in one
+    fused call; panels whose field is missing from it ask on their own.
+    """
+    disk_percentages = [d['percent_used'] for d in status.get('disk', []) if 'percent_used' in d]
+    fused = {}
+    if config.FUSED_DASHBOARD:
+        trend_data = {
+            "focus": focus_vals[-7:], "clarity": clarity_vals[-7:],
+            "stress": stress_vals[-7:], "disk": disk_percentages[-7:],
+        }
+        fused = dashboard_fused.fused_insights(status, rows, trend_data, include_alert)
+    panels = []
+    if include_alert and status.get('errors'):
+        panels.append((build_top_system_alert, (status['errors'], fused.get("alert"))))
+    panels += [
+        (build_smart_insights, (rows, status, fused.get("error_summary"))),
+        (build_visual_trends, (focus_vals, clarity_vals, stress_vals, disk_percentages, fused.get("trends"))),
+        (build_llm_interaction_analytics, (rows, fused.get("topics"), fused.get("pattern"))),
+        (build_system_health_timeline, (rows, status, fused.get("timeline"), rollups.hours(week_start_day))),
+    ]
+    return panels
+
+
+# Start loading the model now so it is resident by the time the LLM panels run
+# (panels use the small model, see routing.py)
+residency.warm_up(config.SMALL_MODEL)
+
+memory.init()
+
+# gettin all logs from the past week (whole days, matching the rollups),
+# only the columns the panels and the recent table use; no prompt or response text
+RECENT_COLUMNS = ("timestamp", "mode", "prompt_length")
+week_start_day = rollups.since_day(7)
+last_week = memory.epoch(datetime.fromisoformat(week_start_day))
+rows = LogRows(last_week, RECENT_COLUMNS + dashboard_insights.COLUMNS + dashboard_analytics.COLUMNS
+               + dashboard_timeline.COLUMNS + dashboard_fused.COLUMNS)
+
+# Counts and averages come from the daily rollups rather than from rows
+week = rollups.totals(week_start_day)
+
+if not week["entries"]:
     console.print("[red]No logs from the past week.[/red]")
     exit()
 
-# Extract metrics
-focus_vals = [r[4] for r in rows if r[4] is not None]
-clarity_vals = [r[5] for r in rows if r[5] is not None]
-stress_vals = [r[6] for r in rows if r[6] is not None]
+# Daily averages, oldest first, for the trend lines
+days = rollups.daily(week_start_day)
+focus_vals = [round(d[2], 1) for d in days if d[2] is not None]
+clarity_vals = [round(d[3], 1) for d in days if d[3] is not None]
+stress_vals = [round(d[4], 1) for d in days if d[4] is not None]
 
-# Count by mode
-mode_counts = defaultdict(int)
-for _, mode, _, _, _, _, _ in rows:
-    mode_counts[mode] += 1
+mode_counts = week["modes"]
 
 # Calculate averages
-avg_focus = round(sum(focus_vals)/len(focus_vals), 1) if focus_vals else 0
-avg_clarity = round(sum(clarity_vals)/len(clarity_vals), 1) if clarity_vals else 0
-avg_stress = round(sum(stress_vals)/len(stress_vals), 1) if stress_vals else 0
+avg_focus = round(week["avg_focus"], 1) if week["avg_focus"] is not None else 0
+avg_clarity = round(week["avg_clarity"], 1) if week["avg_clarity"] is not None else 0
+avg_stress = round(week["avg_stress"], 1) if week["avg_stress"] is not None else 0
 
 # Health indicators
 def get_health_color(value, invert=False):
@@ -138,9 +189,9 @@ console.print("[bold cyan]    PERSONAL AI DASHBOARD[/bold cyan]")
 console.print("[bold cyan]═══════════════════════════════════════[/bold cyan]\n")
 
 # Time period
-week_start = (datetime.now() - timedelta(days=7)).strftime("%B %d")
+week_start = datetime.fromisoformat(week_start_day).strftime("%B %d")
 week_end = datetime.now().strftime("%B %d, %Y")
-console.print(f"[dim]Report Period: {week_start} - {week_end} | Total Interactions: {len(rows)}[/dim]\n")
+console.print(f"[dim]Report Period: {week_start} - {week_end} | Total Interactions: {week['entries']}[/dim]\n")
 
 # --- WOW FACTOR FEATURES (Primary) ---
 
@@ -149,22 +200,10 @@ console.print(f"[dim]Report Period: {week_start} - {week_end} | Total Interactio
 status = get_system_status()
 print_system_status(status)
 
-# 1a. Top System Alert (LLM-powered)
-if status.get('errors'):
-    print_top_system_alert(status['errors'])
-
-# 2. Smart Insights & Recommendations
-smart_insights(rows, status)
-
-# 3. Visual Trends & Anomalies
-disk_percentages = [d['percent_used'] for d in status.get('disk', []) if 'percent_used' in d]
-visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages)
-
-# 4. LLM Interaction Analytics
-llm_interaction_analytics(rows)
-
-# 5. System Health Timeline
-system_health_timeline(rows, status)
+# 1a. Top System Alert, 2. Smart Insights, 3. Visual Trends,
+# 4. LLM Interaction Analytics, 5. System Health Timeline (all LLM-powered,
+# generated concurrently and printed in this order)
+run_panels(llm_panels(status))
 
 # --- SECONDARY: Cognitive Health Assessment (optional) ---
 console.print("\n[bold yellow]Secondary: Cognitive Health (Optional)[/bold yellow]")
@@ -201,10 +240,13 @@ recent_table.add_column("Time", style="dim")
 recent_table.add_column("Mode", style="magenta")
 recent_table.add_column("Prompt", style="white")
 
-for timestamp, mode, prompt, _, _, _, _ in rows[:5]:
-    ts = datetime.fromisoformat(timestamp).strftime("%m/%d %H:%M")
-    prompt_preview = (prompt[:40] + "...") if len(prompt) > 40 else prompt
-    recent_table.add_row(ts, mode, prompt_preview)
+recent = rows[:5]
+previews = rows.text("prompt", recent, chars=40)
+for row in recent:
+    ts = datetime.fromisoformat(row.timestamp).strftime("%m/%d %H:%M")
+    prompt = previews[row.id] or ""
+    prompt_preview = (prompt + "...") if row.prompt_length > 40 else prompt
+    recent_table.add_row(ts, row.mode, prompt_preview)
 
 console.print(Panel(recent_table, border_style="green", padding=(1, 2)))
 
@@ -219,11 +261,7 @@ def weekly():
     # All primary features
     status = get_system_status()
     print_system_status(status)
-    smart_insights(rows, status)
-    disk_percentages = [d['percent_used'] for d in status.get('disk', []) if 'percent_used' in d]
-    visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages)
-    llm_interaction_analytics(rows)
-    system_health_timeline(rows, status)
+    run_panels(llm_panels(status, include_alert=False))
     
     # Secondary: Cognitive health
     console.print("\n[bold yellow]Secondary: Cognitive Health (Optional)[/bold yellow]")
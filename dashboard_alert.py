@@ -1,10 +1,21 @@
 from rich.panel import Panel
 from rich.console import Console
+from collections import Counter
 from model import query
 
-def top_system_alert(error_log):
+def _fallback_alert(error_log):
+    """Rule-based alert used when the model is unavailable: the most repeated entry."""
+    lines = [line.strip() for line in error_log.splitlines() if line.strip()]
+    if not lines:
+        return "No error entries to review."
+    # Drop the journal's "date host unit[pid]:" prefix so repeats group together
+    message, count = Counter(line.split(": ", 1)[-1] for line in lines).most_common(1)[0]
+    return f"{message}\n(Most frequent error entry, {count}x this boot. Model unavailable, so this is not ranked by severity.)"
+
+def top_system_alert(error_log, alert=None):
     """
     Use the local LLM to analyze system error logs and return the most important entry and why.
+    `alert` is an answer already generated elsewhere (the fused dashboard prompt).
     """
     if not error_log or not isinstance(error_log, str):
         return None
@@ -17,6 +28,8 @@ def top_system_alert(error_log):
             "No action is required unless you observe related functional issues. "
             "If desired, check for BIOS or firmware updates, but this is optional."
         )
+    if alert is not None:
+        return alert.strip()
     prompt = f"""
 You are a Linux system assistant. Here are recent system error log entries (from journalctl -p err -b):
 
@@ -24,11 +37,18 @@ You are a Linux system assistant. Here are recent system error log entries (from
 
 From these, which single log entry is the most important and requires user attention? Quote the entry and explain why in one sentence. If none are important, say so.
 """
-    response = query(prompt)
+    response = query(prompt, caller="dashboard.alert", fallback=_fallback_alert(error_log))
     return response.strip()
 
-def print_top_system_alert(error_log):
-    alert = top_system_alert(error_log)
+def build_top_system_alert(error_log, alert=None):
+    """Return the Top System Alert panel, or None when there is nothing to show."""
+    alert = top_system_alert(error_log, alert)
     if alert:
+        return Panel(alert, border_style="red", title="Top System Alert")
+    return None
+
+def print_top_system_alert(error_log):
+    panel = build_top_system_alert(error_log)
+    if panel:
         console = Console()
-        console.print(Panel(alert, border_style="red", title="Top System Alert"))
+        console.print(panel)
@@ -1,38 +1,86 @@
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
+from rich.text import Text
 from collections import Counter
 import re
-from model import query
+from model import query_all
 
-def llm_interaction_analytics(rows):
-    """Generate LLM interaction analytics: topics, streaks, response lengths, common questions."""
-    console = Console()
-    
+# Row columns this panel reads (see log_rows.py); prompt text is fetched per shown row
+COLUMNS = ("mode", "prompt_length", "response_length")
+
+_STOPWORDS = {"about", "after", "could", "there", "their", "these", "which", "would", "should", "where", "while", "using", "what's"}
+
+def _fallback_topics(prompts):
+    """Three most frequent longer words, used when the model is unavailable."""
+    words = Counter(
+        w for p in prompts for w in re.findall(r"[a-z][a-z'_-]{4,}", p.lower()) if w not in _STOPWORDS
+    )
+    return ", ".join(w for w, _ in words.most_common(3)) or "N/A"
+
+def _fallback_pattern(prompt_lengths, response_lengths, modes):
+    """Plain usage summary, used when the model is unavailable."""
+    mode, count = Counter(modes).most_common(1)[0]
+    avg_prompt = sum(prompt_lengths) // len(prompt_lengths)
+    avg_response = sum(response_lengths) // len(response_lengths) if response_lengths else 0
+    return f"Mostly {mode} sessions ({count}x); prompts average {avg_prompt} chars, responses {avg_response} chars."
+
+def build_llm_interaction_analytics(rows, topics=None, pattern=None):
+    """
+    Return the LLM interaction analytics panel: topics, streaks, response lengths, common questions.
+    `rows` is a log_rows.LogRows with COLUMNS, newest first.
+    `topics` and `pattern` are answers already generated elsewhere (the fused dashboard prompt).
+    """
     if not rows:
-        console.print("[dim]No LLM interactions to analyze.[/dim]")
-        return
+        return Text("No LLM interactions to analyze.", style="dim")
     
     analytics_table = Table(title="[bold]LLM Interaction Analytics[/bold]", show_header=True)
     analytics_table.add_column("Metric", style="cyan")
     analytics_table.add_column("Value", style="green")
     
-    # Extract data
-    prompts = [r[2] for r in rows if r[2]]
-    responses = [r[3] for r in rows if r[3]]
-    modes = [r[1] for r in rows]
+    # Extract data; prompt text only for the rows shown or sent to the model
+    asked = [r for r in rows if r.prompt_length]
+    response_lengths = [r.response_length for r in rows if r.response_length]
+    modes = [r.mode for r in rows]
+    sample, recent = asked[:10], asked[-5:]
+    shortest = min(asked, key=lambda r: r.prompt_length) if asked else None
+    longest = max(asked, key=lambda r: r.prompt_length) if asked else None
+    prompts = rows.text("prompt", sample + recent + ([shortest, longest] if asked else []))
+    sample_prompts = [prompts[r.id] or "" for r in sample]
     
+    # Both LLM questions are independent, so they are sent together on the
+    # model's own event loop and their answers go in the table below.
+    calls = {}
+
     # Most asked topics 
-    if prompts:
-        prompt_sample = "\n".join(prompts[:10])  # Sample of prompts
+    if asked and topics is None:
+        prompt_sample = "\n".join(sample_prompts)  # Sample of prompts
         topic_prompt = (
             "Analyze these recent LLM prompts and identify 3 main topics or themes the user is focused on. "
             "Be specific and concise. Return only the 3 topics as a comma-separated list.\n\n"
             f"{prompt_sample}"
         )
-        topics_str = query(topic_prompt).strip()
+        calls["topics"] = dict(prompt=topic_prompt, caller="dashboard.topics",
+                               fallback=_fallback_topics(sample_prompts))
+
+    # Conversation pattern insights (LLM-powered)
+    if len(asked) > 0 and pattern is None:
+        pattern_prompt = (
+            "Looking at this user's conversation history (prompts and responses), "
+            "what is their typical conversation pattern or style? Be concise (1-2 sentences).\n\n"
+            "Recent prompts:"
+            + "\n".join([f"- {(prompts[r.id] or '')[:80]}" for r in recent])
+            + "\n\nRecent responses (lengths):" 
+            + ", ".join([str(n) for n in response_lengths[-5:]])
+        )
+        calls["pattern"] = dict(prompt=pattern_prompt, caller="dashboard.pattern",
+                                fallback=_fallback_pattern([r.prompt_length for r in asked], response_lengths, modes))
+    answers = dict(zip(calls, query_all(list(calls.values())))) if calls else {}
+
+    if topics is not None:
+        topics_str = topics.strip()
     else:
-        topics_str = "N/A"
+        topics_str = answers["topics"].strip() if "topics" in answers else "N/A"
     analytics_table.add_row("Top Topics", topics_str)
     
     # Longest conversation streak (consecutive same mode)
@@ -48,7 +96,7 @@ def llm_interaction_analytics(rows):
         analytics_table.add_row("Longest Streak", f"{max_streak} sessions")
     
     # Average response length
-    avg_response_len = round(sum(len(r) for r in responses) / len(responses), 0) if responses else 0
+    avg_response_len = round(sum(response_lengths) / len(response_lengths), 0) if response_lengths else 0
     analytics_table.add_row("Avg Response Length", f"{int(avg_response_len)} chars")
     
     # Most common question type (by mode)
@@ -56,28 +104,25 @@ def llm_interaction_analytics(rows):
     most_common_mode = mode_counts.most_common(1)[0][0] if mode_counts else "N/A"
     analytics_table.add_row("Primary Focus", f"{most_common_mode} ({mode_counts[most_common_mode]}x)")
     
-    # Conversation pattern insights (LLM-powered)
-    if len(prompts) > 0:
-        pattern_prompt = (
-            "Looking at this user's conversation history (prompts and responses), "
-            "what is their typical conversation pattern or style? Be concise (1-2 sentences).\n\n"
-            "Recent prompts:"
-            + "\n".join([f"- {p[:80]}" for p in prompts[-5:]])
-            + "\n\nRecent responses (lengths):" 
-            + ", ".join([str(len(r)) for r in responses[-5:]])
-        )
-        pattern_str = query(pattern_prompt).strip()
-        analytics_table.add_row("Conversation Pattern", pattern_str)
+    if pattern is not None:
+        analytics_table.add_row("Conversation Pattern", pattern.strip())
+    elif "pattern" in answers:
+        analytics_table.add_row("Conversation Pattern", answers["pattern"].strip())
     
     # Shortest and longest prompts
-    shortest_prompt = min(prompts, key=len) if prompts else "N/A"
-    longest_prompt = max(prompts, key=len) if prompts else "N/A"
+    shortest_prompt = (prompts[shortest.id] or "") if shortest else "N/A"
+    longest_prompt = (prompts[longest.id] or "") if longest else "N/A"
     analytics_table.add_row("Shortest Question", shortest_prompt[:50] + ("..." if len(shortest_prompt) > 50 else ""))
     analytics_table.add_row("Longest Question", longest_prompt[:50] + ("..." if len(longest_prompt) > 50 else ""))
     
     # Total interactions
     analytics_table.add_row("Total Interactions", str(len(rows)))
     
-    console.print(Panel(analytics_table, border_style="magenta", padding=(1, 2)))
+    return Panel(analytics_table, border_style="magenta", padding=(1, 2))
+
+def llm_interaction_analytics(rows):
+    """Generate LLM interaction analytics: topics, streaks, response lengths, common questions."""
+    console = Console()
+    console.print(build_llm_interaction_analytics(rows))
 
 # For integration: import and call llm_interaction_analytics(rows) in dashboard.py
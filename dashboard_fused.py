@@ -0,0 +1,111 @@
+"""
+Fused dashboard prompt: one model call for every LLM-backed panel.
+
+The separate panel prompts repeat the same system and usage snapshot, and
+each pays its own prefill and round-trip. Here the snapshot is sent once
+and the model answers with a JSON object holding one field per panel.
+Each field is validated on its own; a missing or malformed field is left
+out, so that panel falls back to its own prompt.
+
+Enable with LOCALMIND_FUSED_DASHBOARD=1.
+"""
+import json
+import re
+from collections import Counter
+
+from model import query
+
+# Field name -> what the model should put in it
+FIELDS = {
+    "alert": "the single most important error entry, quoted, and why it matters, in one sentence (or say none are important)",
+    "error_summary": "a 2-3 sentence technical summary of the error log, separating harmless noise from real problems",
+    "trends": "3-4 specific observations about trends and anomalies in the weekly metrics, one per line",
+    "topics": "the 3 main topics of the recent prompts, as one comma-separated line",
+    "pattern": "the user's typical conversation pattern or style, in 1-2 sentences",
+    "timeline": "a 1-2 sentence actionable recommendation for system performance given the snapshot",
+}
+
+# Row columns the snapshot reads (see log_rows.py); prompt text is fetched for the sample only
+COLUMNS = ("mode", "prompt_length", "response_length")
+
+_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def wanted_fields(status, rows, trend_data, include_alert=True):
+    """The fields whose panels will actually ask the model something."""
+    fields = []
+    if status.get('errors'):
+        if include_alert and "ACPI Error: AE_ALREADY_EXISTS" not in status['errors']:
+            fields.append("alert")
+        fields.append("error_summary")
+    if any(trend_data.values()):
+        fields.append("trends")
+    if any(r.prompt_length for r in rows):
+        fields += ["topics", "pattern"]
+    fields.append("timeline")
+    return fields
+
+
+def build_prompt(fields, status, rows, trend_data):
+    errors = (status.get('errors') or "").splitlines()
+    caches = status.get('caches') or []
+
+    snapshot = [
+        f"Disk usage %: {[d.get('percent_used', 'N/A') for d in status.get('disk', [])]}",
+        f"Largest cache: {caches[0].get('size_human', 'N/A') if caches else 'N/A'}",
+        f"Recent errors: {len(errors)} entries",
+    ]
+    if errors and ("alert" in fields or "error_summary" in fields):
+        snapshot.append("Error log (journalctl -p err -b, first 30 lines):\n" + "\n".join(errors[:30]))
+    if "trends" in fields:
+        snapshot += [f"{name.capitalize()} (last 7): {values}" for name, values in trend_data.items()]
+    if "topics" in fields or "pattern" in fields:
+        sample = [r for r in rows if r.prompt_length][:10]
+        prompts = rows.text("prompt", sample, chars=80)
+        response_lengths = [r.response_length for r in rows if r.response_length]
+        snapshot.append(f"Modes used: {dict(Counter(r.mode for r in rows).most_common(5))}")
+        snapshot.append("Recent prompts:\n" + "\n".join(f"- {prompts[r.id] or ''}" for r in sample))
+        snapshot.append(f"Recent response lengths: {', '.join(str(n) for n in response_lengths[-5:])}")
+
+    spec = "\n".join(f'  "{name}": {FIELDS[name]}' for name in fields)
+    return (
+        "You are a Linux system and productivity assistant writing a weekly dashboard.\n\n"
+        "SNAPSHOT:\n" + "\n".join(snapshot) + "\n\n"
+        "Reply with ONLY a JSON object with these string fields:\n" + spec + "\n\n"
+        "Be specific to the snapshot and avoid generic statements."
+    )
+
+
+def parse(response, fields):
+    """
+    Return {field: text} for every field that came back as usable text.
+    Invalid JSON or bad fields are dropped rather than raising.
+    """
+    match = _OBJECT.search(response or "")
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    results = {}
+    for name in fields:
+        value = data.get(name)
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            value = (", " if name == "topics" else "\n").join(value)
+        if isinstance(value, str) and value.strip():
+            results[name] = value.strip()
+    return results
+
+
+def fused_insights(status, rows, trend_data, include_alert=True):
+    """
+    Ask for every panel's text in one call; returns {field: text} for the valid fields.
+    `rows` is a log_rows.LogRows with COLUMNS.
+    """
+    fields = wanted_fields(status, rows, trend_data, include_alert)
+    response = query(build_prompt(fields, status, rows, trend_data), caller="dashboard.fused", fallback="")
+    return parse(response, fields)
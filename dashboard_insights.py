@@ -5,11 +5,17 @@ import re
 from itertools import groupby
 from model import query
 
-def smart_insights(rows, system_status):
-    console = Console()
+# Row columns this panel reads (see log_rows.py)
+COLUMNS = ("timestamp", "mode")
+
+def build_smart_insights(rows, system_status, error_summary=None):
+    """
+    Return the Smart Insights & Recommendations panel.
+    `error_summary` is an answer already generated elsewhere (the fused dashboard prompt).
+    """
     insights = []
     # Productivity suggestion
-    times = [r[0] for r in rows]
+    times = [r.timestamp for r in rows]
     hours = [int(re.search(r'T (\d+):', t).group(1)) if re.search(r'T (\d+):', t) else 0 for t in times]
     if hours:
         peak_hour = max(set(hours), key=hours.count)
@@ -23,7 +29,9 @@ def smart_insights(rows, system_status):
     # Error summary using LLM for intelligent analysisor intelligent analysis
     if 'errors' in system_status and isinstance(system_status['errors'], str):
         err_lines = system_status['errors'].splitlines()
-        if len(err_lines) > 0:
+        if error_summary is not None:
+            insights.append(error_summary.strip())
+        elif len(err_lines) > 0:
             # Limit to first 30 lines for brevity
             err_context = "\n".join(err_lines[:30])
             prompt = (
@@ -34,15 +42,22 @@ def smart_insights(rows, system_status):
                 "Distinguish between common harmless errors and real problems. "
                 "Keep it to 2-3 sentences. Avoid generic statements."
             )
-            summary = query(prompt).strip()
+            messages = Counter(line.split(": ", 1)[-1].strip() for line in err_lines if line.strip())
+            top, count = messages.most_common(1)[0] if messages else ("none", 0)
+            fallback = f"{len(err_lines)} error entries this boot; most frequent ({count}x): {top}"
+            summary = query(prompt, caller="dashboard.insights", fallback=fallback).strip()
             if summary:
                 insights.append(summary)
     # LLM streak
-    modes = [r[1] for r in rows]
+    modes = [r.mode for r in rows]
     streak = max([len(list(g)) for k, g in groupby(modes)]) if modes else 0
     if streak > 3:
         insights.append(f"Longest mode streak: {streak} sessions.")
     # Motivational nudge
     if not insights:
         insights.append("Keep up the good work! No major issues detected.")
-    console.print(Panel("\n".join(insights), border_style="blue", title="Smart Insights & Recommendations"))
+    return Panel("\n".join(insights), border_style="blue", title="Smart Insights & Recommendations")
+
+def smart_insights(rows, system_status):
+    console = Console()
+    console.print(build_smart_insights(rows, system_status))
@@ -4,10 +4,27 @@ from rich.table import Table
 from datetime import datetime
 from model import query
 
-def system_health_timeline(rows, system_status):
-    """Correlate system events (errors, disk/cache spikes) with LLM usage patterns."""
-    console = Console()
-    
+# Row columns this panel reads (see log_rows.py)
+COLUMNS = ("timestamp",)
+
+def _fallback_recommendation(system_status, error_count):
+    """Rule-based recommendation used when the model is unavailable."""
+    fullest = max((d.get('percent_used', 0) for d in system_status.get('disk', [])), default=0)
+    if fullest > 90:
+        return f"A disk is {fullest}% full - clear caches and old logs first."
+    if error_count > 50:
+        return f"{error_count} errors this boot - review journalctl -p err -b before tuning anything else."
+    if system_status.get('caches'):
+        largest = system_status['caches'][0]
+        return f"Largest cache is {largest.get('path', '?')} ({largest.get('size_human', '?')}) - clean it if space gets tight."
+    return "No pressing issues - disk, errors and caches look normal."
+
+def build_system_health_timeline(rows, system_status, recommendation=None, hours=None):
+    """
+    Return the panel correlating system events (errors, disk/cache spikes) with LLM usage patterns.
+    `recommendation` is an answer already generated elsewhere (the fused dashboard prompt).
+    `hours` maps hour of day to interactions (rollups.hours); counted from rows when omitted.
+    """
     timeline_table = Table(title="[bold]System Health & LLM Correlation[/bold]", show_header=True)
     timeline_table.add_column("Metric", style="cyan")
     timeline_table.add_column("Status", style="green")
@@ -75,24 +92,24 @@ def system_health_timeline(rows, system_status):
         )
     
     # Correlate with LLM usage
-    if rows:
+    if hours is None and rows:
         # Count interactions by time of day
         hours = {}
-        for timestamp, mode, _, _, _, _, _ in rows:
+        for row in rows:
             try:
-                hour = datetime.fromisoformat(timestamp).hour
+                hour = datetime.fromisoformat(row.timestamp).hour
                 hours[hour] = hours.get(hour, 0) + 1
             except:
                 pass
-        
-        if hours:
-            peak_hour = max(hours, key=hours.get)
-            peak_count = hours[peak_hour]
-            timeline_table.add_row(
-                "Peak Activity",
-                f"[bold cyan]{peak_hour}:00 ({peak_count} sessions)[/bold cyan]",
-                "Most productive time"
-            )
+
+    if hours:
+        peak_hour = max(hours, key=hours.get)
+        peak_count = hours[peak_hour]
+        timeline_table.add_row(
+            "Peak Activity",
+            f"[bold cyan]{peak_hour}:00 ({peak_count} sessions)[/bold cyan]",
+            "Most productive time"
+        )
     
     # LLM-powered system health correlation and recommendations
     health_data = {
@@ -101,21 +118,29 @@ def system_health_timeline(rows, system_status):
         "cache_size": system_status.get('caches', [{}])[0].get('size_human', 'N/A') if system_status.get('caches') else 'N/A'
     }
     
-    correlation_prompt = (
-        "Analyze this system health snapshot and provide a brief, actionable recommendation "
-        "for optimizing system performance given the current state.\\n\\n"
-        f"Disk usage: {health_data['disk_status']}\\n"
-        f"Recent errors: {health_data['error_count']}\\n"
-        f"Largest cache: {health_data['cache_size']}\\n\\n"
-        "Provide 1-2 sentences with specific, practical advice. Avoid generic statements."
-    )
-    recommendation = query(correlation_prompt).strip()
+    if recommendation is None:
+        correlation_prompt = (
+            "Analyze this system health snapshot and provide a brief, actionable recommendation "
+            "for optimizing system performance given the current state.\\n\\n"
+            f"Disk usage: {health_data['disk_status']}\\n"
+            f"Recent errors: {health_data['error_count']}\\n"
+            f"Largest cache: {health_data['cache_size']}\\n\\n"
+            "Provide 1-2 sentences with specific, practical advice. Avoid generic statements."
+        )
+        recommendation = query(correlation_prompt, caller="dashboard.timeline",
+                               fallback=_fallback_recommendation(system_status, health_data['error_count']))
+    recommendation = recommendation.strip()
     timeline_table.add_row(
         "[bold]LLM Recommendation[/bold]",
         recommendation,
         "Action"
     )
     
-    console.print(Panel(timeline_table, border_style="blue", padding=(1, 2)))
+    return Panel(timeline_table, border_style="blue", padding=(1, 2))
+
+def system_health_timeline(rows, system_status):
+    """Correlate system events (errors, disk/cache spikes) with LLM usage patterns."""
+    console = Console()
+    console.print(build_system_health_timeline(rows, system_status))
 
 # For integration: import and call system_health_timeline(rows, system_status) in dashboard.py
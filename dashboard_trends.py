@@ -23,10 +23,22 @@ def get_sparkline(values, width=30):
     
     return spark
 
-def visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages):
-    """Display visual trends with LLM-powered interpretation and anomaly detection."""
-    console = Console()
-    
+def _fallback_trends(trend_data):
+    """Plain per-metric averages and direction, used when the model is unavailable."""
+    observations = []
+    for name, values in trend_data.items():
+        if not values:
+            continue
+        change = values[-1] - values[0]
+        direction = "rising" if change > 0 else "falling" if change < 0 else "flat"
+        observations.append(f"{name.capitalize()}: avg {sum(values) / len(values):.0f}, {direction} ({values[0]} → {values[-1]})")
+    return "\n".join(observations)
+
+def build_visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages, llm_insights=None):
+    """
+    Return the visual trends panel with LLM-powered interpretation and anomaly detection.
+    `llm_insights` is an answer already generated elsewhere (the fused dashboard prompt).
+    """
     trends_table = Table(title="[bold]Weekly Trends & Insights[/bold]", show_header=False, box=None)
     
     # Prepare trend data for LLM analysis
@@ -38,7 +50,9 @@ def visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages):
     }
     
     # LLM-powered trend analysis
-    if any(trend_data.values()):
+    if llm_insights is not None:
+        trends_table.add_row("[bold]LLM Insights[/bold]", llm_insights.strip())
+    elif any(trend_data.values()):
         trend_prompt = (
             "Analyze these weekly metrics and provide insight on patterns and anomalies.\\n\\n"
             f"Focus scores: {trend_data['focus']}\\n"
@@ -47,7 +61,7 @@ def visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages):
             f"Disk usage %: {trend_data['disk']}\\n\\n"
             "Provide 3-4 concise observations about trends and any anomalies. Be specific, not generic."
         )
-        llm_insights = query(trend_prompt).strip()
+        llm_insights = query(trend_prompt, caller="dashboard.trends", fallback=_fallback_trends(trend_data)).strip()
         trends_table.add_row("[bold]LLM Insights[/bold]", llm_insights)
     
     # Visual sparklines for quick reference
@@ -69,6 +83,11 @@ def visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages):
         color = "red" if disk_percentages[-1] > 85 else "yellow" if disk_percentages[-1] > 70 else "green"
         trends_table.add_row(f"[bold {color}]Disk%[/bold {color}]", sparkline)
     
-    console.print(Panel(trends_table, border_style="cyan", padding=(1, 2)))
+    return Panel(trends_table, border_style="cyan", padding=(1, 2))
+
+def visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages):
+    """Display visual trends with LLM-powered interpretation and anomaly detection."""
+    console = Console()
+    console.print(build_visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages))
 
 # For integration: import and call visual_trends(focus_vals, clarity_vals, stress_vals, disk_percentages) in dashboard.py
@@ -0,0 +1,275 @@
+"""
+Long-lived SQLite connections shared by everything that touches brain.db
+(and the response cache).
+
+Opening a connection per operation re-reads the schema and, in the default
+rollback journal, makes every writer lock the whole file, so concurrent
+CLI runs see "database is locked". Here each thread keeps one connection
+per database file, opened once in WAL mode with a busy timeout and larger
+page cache and mmap window.
+
+Use connect() for reads and `with transaction() as conn:` for writes.
+WriteBehind queues writes and commits them in groups, one fsync per
+group instead of one per row.
+
+Benchmark: python db.py bench [rows]
+"""
+import atexit
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+
+_local = threading.local()
+_all = []  # every connection opened, so they can be closed at exit
+_all_lock = threading.Lock()
+_setups = {}  # path -> schema setup run once per new connection
+
+
+def _configure(conn):
+    conn.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT * 1000)}")
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        # auto_vacuum can only be chosen before the first page is written,
+        # and switching to WAL writes the header: new files hand freed
+        # pages back with incremental_vacuum instead of a full VACUUM
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    # WAL keeps commits durable across crashes with NORMAL; only a power
+    # loss can drop the last transactions
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{int(config.DB_CACHE_MB * 1024)}")
+    conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_MB * 1024 * 1024)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def register_setup(path, setup):
+    """Run setup(conn) on every new connection to path (e.g. CREATE TABLE IF NOT EXISTS)."""
+    _setups[path] = setup
+
+
+def connect(path=None):
+    """This thread's connection to path (config.DB by default), opened on first use."""
+    path = path or config.DB
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=config.DB_BUSY_TIMEOUT)
+        _configure(conn)
+        setup = _setups.get(path)
+        if setup:
+            setup(conn)
+            conn.commit()
+        connections[path] = conn
+        with _all_lock:
+            _all.append(conn)
+    return conn
+
+
+@contextmanager
+def transaction(path=None):
+    """Yield this thread's connection; commit on success, roll back on error."""
+    conn = connect(path)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+@atexit.register
+def close_all():
+    """Close every connection (run automatically at exit)."""
+    with _all_lock:
+        connections, _all[:] = list(_all), []
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _local.__dict__.clear()
+
+
+class WriteBehind:
+    """
+    Buffered writer: queued writes are committed together once `batch`
+    are pending or `delay` seconds after the first one was queued, whichever
+    comes first. Pending writes are flushed at exit and on SIGTERM/SIGHUP;
+    a SIGKILL or power loss can drop at most the last `delay` seconds.
+    A write is one statement, or several queued with write_many() that
+    always commit together.
+    A group that fails to commit (e.g. "database is locked") stays queued
+    and is retried; after `retries` failures in a row its writes are
+    committed one by one and only those that still fail are dropped.
+    """
+
+    def __init__(self, path=None, batch=64, delay=0.5, retries=5):
+        self.path = path
+        self.batch = batch
+        self.delay = delay
+        self._pending = []
+        self._lock = threading.Lock()        # guards _pending
+        self._flush_lock = threading.Lock()  # keeps groups in queue order
+        self._wake = threading.Condition(self._lock)
+        self.retries = retries
+        self._thread = None
+        atexit.register(self.flush)
+        # The first write usually comes from a worker thread, where signal
+        # handlers cannot be installed, so do it now
+        _flush_on_signals()
+
+    def write(self, sql, params=(), sync=False):
+        """Queue one statement; with sync=True commit it (and everything before it) now."""
+        self.write_many([(sql, params)], sync)
+
+    def write_many(self, statements, sync=False):
+        """Queue (sql, params) statements that commit in the same transaction or not at all."""
+        with self._lock:
+            self._pending.append(tuple(statements))
+            if self._thread is None:
+                self._start()
+            # Wake the writer when a group starts (it then waits `delay`
+            # for the group to fill) and again when the group is full
+            if len(self._pending) in (1, self.batch):
+                self._wake.notify()
+        if sync:
+            self.flush()
+
+    def flush(self):
+        """Commit everything queued so far in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                with transaction(self.path) as conn:
+                    for statements in pending:
+                        for sql, params in statements:
+                            conn.execute(sql, params)
+            except sqlite3.Error:
+                with self._lock:
+                    self._pending[:0] = pending  # keep them, in order, for the retry
+                raise
+
+    def _flush_each(self):
+        """Commit queued writes one at a time, dropping only those that fail."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            for statements in pending:
+                try:
+                    with transaction(self.path) as conn:
+                        for sql, params in statements:
+                            conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    print(f"[brain.db write dropped: {e}]", file=sys.stderr)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._thread.start()
+        _flush_on_signals()
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wake.wait()
+                # Give the group `delay` seconds to fill up unless it is already full
+                if len(self._pending) < self.batch:
+                    self._wake.wait(self.delay)
+            try:
+                self.flush()
+                failures = 0
+            except sqlite3.Error as e:
+                failures += 1
+                if failures < self.retries:
+                    print(f"[brain.db write failed, retrying: {e}]", file=sys.stderr)
+                    time.sleep(min(self.delay * 2 ** failures, 10))
+                    continue
+                # Keeps failing: probably one bad statement, so isolate it
+                self._flush_each()
+                failures = 0
+
+
+def _exit_on_signal(signum, frame):
+    sys.exit(128 + signum)  # runs the atexit flushes
+
+
+def _flush_on_signals():
+    """Turn SIGTERM/SIGHUP into a normal exit so queued writes are flushed."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for name in ("SIGTERM", "SIGHUP"):
+        signum = getattr(signal, name, None)
+        # Leave handlers installed by the application alone
+        if signum is not None and signal.getsignal(signum) == signal.SIG_DFL:
+            signal.signal(signum, _exit_on_signal)
+
+
+def _bench_rows(n):
+    return [(f"2024-01-01T00:00:{i % 60:02d}", "bench", "prompt " * 20, "response " * 200) for i in range(n)]
+
+
+def benchmark(n=2000):
+    """
+    Inserts/sec for the old pattern (connect, insert, commit, close per row,
+    rollback journal), one managed WAL connection committing per row, and
+    WriteBehind group commits.
+    """
+    rows = _bench_rows(n)
+    schema = "CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, timestamp TEXT, mode TEXT, prompt TEXT, response TEXT)"
+    insert = "INSERT INTO logs (timestamp, mode, prompt, response) VALUES (?, ?, ?, ?)"
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        before = os.path.join(tmp, "before.db")
+        conn = sqlite3.connect(before)
+        conn.execute(schema)
+        conn.close()
+        start = time.perf_counter()
+        for row in rows:
+            conn = sqlite3.connect(before)
+            conn.execute(insert, row)
+            conn.commit()
+            conn.close()
+        results["per-operation connection"] = n / (time.perf_counter() - start)
+
+        after = os.path.join(tmp, "after.db")
+        register_setup(after, lambda c: c.execute(schema))
+        start = time.perf_counter()
+        for row in rows:
+            with transaction(after) as conn:
+                conn.execute(insert, row)
+        results["managed WAL connection"] = n / (time.perf_counter() - start)
+
+        writer = WriteBehind(after)
+        start = time.perf_counter()
+        for row in rows:
+            writer.write(insert, row)
+        writer.flush()
+        results["write-behind group commit"] = n / (time.perf_counter() - start)
+        close_all()
+        del _setups[after]
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["bench"]:
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+        for name, rate in benchmark(count).items():
+            print(f"{name:27} {rate:10.0f} inserts/sec")
+    else:
+        print("Usage: python db.py bench [rows]")
@@ -0,0 +1,150 @@
+"""
+Adaptive timeouts and a circuit breaker for model calls.
+
+Timeouts come from the latencies recorded in brain.db's llm_calls table:
+a call may take LOCALMIND_TIMEOUT_FACTOR times the recent p95 latency of
+calls with a similar prompt size, within [LOCALMIND_TIMEOUT_MIN,
+LOCALMIND_TIMEOUT]. Until enough calls of a size class are recorded the
+fixed LOCALMIND_TIMEOUT applies.
+
+The circuit breaker opens after LOCALMIND_BREAKER_FAILURES consecutive
+timeouts or errors. While open, calls fail at once with CircuitOpenError,
+so dashboard panels show their deterministic fallback instead of each
+waiting out a timeout. After LOCALMIND_BREAKER_COOLDOWN seconds a single
+probe call is let through; its outcome closes or re-opens the circuit.
+Recent outcomes are read back from llm_calls on first use, so a process
+started while the backend is down begins with the circuit open (or with a
+single probe once the cooldown has passed).
+"""
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import config
+import memory
+from backends import BackendError
+
+# Prompt size classes, in estimated tokens
+SIZE_CLASSES = (256, 1024, 4096, float("inf"))
+MIN_SAMPLES = 10
+_REFRESH = 60  # seconds before re-reading percentiles from brain.db
+
+
+# Calls that do not go through the breaker and whose outcome it ignores:
+# a failed warm-up says nothing about whether generations will work
+UNCOUNTED_CALLERS = ("residency.preload",)
+
+
+class CircuitOpenError(BackendError):
+    """Raised instead of calling a backend that keeps failing."""
+
+
+def size_class(prompt_tokens):
+    """Return the (low, high) token range the prompt size falls in."""
+    low = 0
+    for high in SIZE_CLASSES:
+        if prompt_tokens < high:
+            return low, high
+        low = high
+    return low, SIZE_CLASSES[-1]
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * 95 // 100) - 1)]
+
+
+_timeouts = {}
+_timeouts_lock = threading.Lock()
+
+
+def timeout_for(prompt):
+    """Seconds a call with this prompt may take before it counts as timed out."""
+    if not config.ADAPTIVE_TIMEOUT:
+        return config.TIMEOUT
+    low, high = size_class(len(prompt) // 4)
+    now = time.monotonic()
+    with _timeouts_lock:
+        cached = _timeouts.get(low)
+    if cached and now - cached[1] < _REFRESH:
+        return cached[0]
+
+    try:
+        samples = memory.recent_llm_latencies(low, high)
+    except sqlite3.Error:
+        samples = []
+    if len(samples) < MIN_SAMPLES:
+        timeout = config.TIMEOUT
+    else:
+        timeout = min(config.TIMEOUT, max(config.TIMEOUT_MIN, _p95(samples) * config.TIMEOUT_FACTOR))
+    with _timeouts_lock:
+        _timeouts[low] = (timeout, now)
+    return timeout
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker shared by every call in this process."""
+
+    FAILURES = ("timeout", "error")
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self._lock = threading.Lock()
+        self._seeded = False
+
+    def _seed(self):
+        """Start open if the latest recorded calls (from any process) all failed recently."""
+        self._seeded = True
+        try:
+            recent = memory.recent_llm_outcomes(self.threshold, UNCOUNTED_CALLERS)
+        except sqlite3.Error:
+            return
+        if len(recent) < self.threshold or any(o not in self.FAILURES for _, o in recent):
+            return
+        try:
+            age = (datetime.now() - datetime.fromisoformat(recent[0][0])).total_seconds()
+        except (TypeError, ValueError):
+            return
+        # Past the cooldown this leaves the circuit half-open: one probe first
+        self.failures = self.threshold
+        self.opened_at = time.monotonic() - age
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go to the backend now."""
+        with self._lock:
+            if not self._seeded:
+                self._seed()
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = self.cooldown - (now - self.opened_at)
+            # A probe that never reported back (cancelled while queued) expires too
+            probing = self.probe_started is not None and now - self.probe_started < self.cooldown
+            if remaining > 0 or probing:
+                raise CircuitOpenError(
+                    f"model backend unavailable after {self.failures} failed calls; "
+                    f"retrying in {max(remaining, 0):.0f}s"
+                )
+            self.probe_started = now  # half-open: this call is the probe
+
+    def record(self, outcome):
+        """Feed one finished call's outcome ("ok", "timeout", "error", "cancelled")."""
+        with self._lock:
+            self.probe_started = None
+            if outcome == "cancelled":
+                return
+            if outcome in self.FAILURES:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+            else:
+                self.failures = 0
+                self.opened_at = None
+
+
+breaker = CircuitBreaker(config.BREAKER_FAILURES, config.BREAKER_COOLDOWN)
@@ -0,0 +1,175 @@
+"""
+Persistent cache of LLM responses.
+Entries are keyed by a hash of model, prompt and generation options, expire
+after a TTL and are evicted least-recently-used once the cache outgrows its
+size budget.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import config
+import db
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process claims are skipped
+    fcntl = None
+
+# Claims on in-flight keys are byte-range locks on one shared file, striped
+# by key hash so the file never grows. POSIX locks belong to the process,
+# so claims on a stripe are counted here and the lock is released with the
+# last of them.
+_CLAIM_STRIPES = 256
+_claim_fd = None
+_claims = Counter()
+_claims_lock = threading.Lock()
+
+
+def _create_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT,
+            size INTEGER,
+            created REAL,
+            last_used REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+db.register_setup(config.CACHE_DB, _create_schema)
+
+
+def make_key(model, prompt, options=None):
+    """Stable hash of everything that influences the generated text."""
+    raw = json.dumps({"model": model, "prompt": prompt, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _bump(conn, name):
+    conn.execute(
+        "INSERT INTO counters (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,)
+    )
+
+
+def get(key, ttl=None, count=True):
+    """
+    Return the cached response for key, or None on a miss or expired entry.
+    Pass count=False to peek without touching the hit/miss counters.
+    """
+    ttl = config.CACHE_TTL if ttl is None else ttl
+    now = time.time()
+    with db.transaction(config.CACHE_DB) as conn:
+        row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row and now - row[1] <= ttl:
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            if count:
+                _bump(conn, "hits")
+            return row[0]
+        if row:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        if count:
+            _bump(conn, "misses")
+        return None
+
+
+def put(key, model, response):
+    """Store a response and evict least-recently-used entries over the size budget."""
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    with db.transaction(config.CACHE_DB) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, response, size, now, now)
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > config.CACHE_MAX_BYTES:
+            victims = []
+            for old_key, old_size in conn.execute(
+                "SELECT key, size FROM responses WHERE key != ? ORDER BY last_used", (key,)
+            ):
+                if total <= config.CACHE_MAX_BYTES:
+                    break
+                victims.append((old_key,))
+                total -= old_size
+            conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (len(victims),)
+            )
+
+
+def _claim_offset(key):
+    return int(key[:8], 16) % _CLAIM_STRIPES
+
+
+def try_claim(key):
+    """
+    Mark key as being generated by this process.
+    Returns False while another process holds the claim, so the caller can
+    wait for that result to land in the cache instead of generating it twice.
+    """
+    global _claim_fd
+    if fcntl is None:
+        return True
+    stripe = _claim_offset(key)
+    with _claims_lock:
+        if _claims[stripe]:
+            # This process already holds the stripe, so no other process can
+            _claims[stripe] += 1
+            return True
+        if _claim_fd is None:
+            _claim_fd = os.open(config.CACHE_DB + ".inflight", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(_claim_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, stripe)
+        except OSError:
+            return False
+        _claims[stripe] = 1
+        return True
+
+
+def release_claim(key):
+    """Release a claim taken with try_claim() (once per successful call)."""
+    if fcntl is None or _claim_fd is None:
+        return
+    stripe = _claim_offset(key)
+    with _claims_lock:
+        if not _claims[stripe]:
+            return
+        _claims[stripe] -= 1
+        if not _claims[stripe]:
+            del _claims[stripe]
+            fcntl.lockf(_claim_fd, fcntl.LOCK_UN, 1, stripe)
+
+
+def stats():
+    """Return hit/miss/eviction counters plus current entry count and size."""
+    conn = db.connect(config.CACHE_DB)
+    result = {"hits": 0, "misses": 0, "evictions": 0}
+    result.update(dict(conn.execute("SELECT name, value FROM counters")))
+    result["entries"], result["bytes"] = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+    ).fetchone()
+    return result
+
+
+def clear():
+    """Drop every cached response (counters are kept)."""
+    with db.transaction(config.CACHE_DB) as conn:
+        conn.execute("DELETE FROM responses")
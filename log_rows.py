@@ -0,0 +1,75 @@
+"""
+Column-projected access to the logs of a time window, for the dashboard.
+
+Panels declare the columns they need (a COLUMNS tuple in each panel
+module); the dashboard loads the union of them in one query. Prompt and
+response text is never part of that query: panels get their lengths
+instead, and fetch the text with LogRows.text() only for the rows they
+actually show, so memory and query time do not grow with response size.
+
+Lengths of bodies kept in the blobs table are their UTF-8 size in bytes,
+read from the blobs row without decompressing it.
+"""
+from collections import namedtuple
+
+import db
+import memory
+
+_LENGTH = "COALESCE(length(logs.{0}), (SELECT size FROM blobs WHERE hash = logs.{0}_hash), 0)"
+
+# Column name -> SQL expression over logs
+COLUMNS = {
+    "id": "logs.id",
+    "timestamp": "logs.timestamp",
+    "mode": "logs.mode",
+    "focus": "logs.focus",
+    "clarity": "logs.clarity",
+    "stress": "logs.stress",
+    "prompt_length": _LENGTH.format("prompt"),
+    "response_length": _LENGTH.format("response"),
+}
+TEXT = ("prompt", "response")
+
+
+class LogRows:
+    """
+    Logs rows with ts >= since, newest first, holding only the requested
+    columns (plus id). Indexing and iteration yield namedtuples.
+    """
+
+    def __init__(self, since, columns):
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown log columns: {', '.join(sorted(unknown))}")
+        self.columns = tuple(dict.fromkeys(("id",) + tuple(columns)))
+        row = namedtuple("LogRow", self.columns)
+        memory.flush()
+        cursor = db.connect().execute(
+            f"SELECT {', '.join(COLUMNS[c] for c in self.columns)} FROM logs WHERE ts >= ? ORDER BY ts DESC",
+            (since,)
+        )
+        self._rows = [row._make(r) for r in cursor]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __getitem__(self, index):
+        return self._rows[index]
+
+    def text(self, column, rows, chars=None):
+        """
+        {id: prompt or response text} for the given rows only, cut to the
+        first `chars` characters when given.
+        """
+        if column not in TEXT:
+            raise ValueError(f"Not a text column: {column}")
+        ids = list({r.id for r in rows})
+        if not ids:
+            return {}
+        value = f"substr({column}, 1, {int(chars)})" if chars else column
+        return dict(db.connect().execute(
+            f"SELECT id, {value} FROM log_entries WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall())
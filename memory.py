@@ -1,11 +1,99 @@
-import sqlite3
+"""
+brain.db access: the logs and llm_calls tables and their schema migrations.
+
+Large prompt and response bodies live compressed in the blobs table; read
+logs through the log_entries view to get the full text back.
+
+The schema version lives in SQLite's user_version. To change the schema,
+append a function to MIGRATIONS; it runs once, inside a write transaction
+together with the version bump, so a failed or concurrent migration never
+leaves a half-applied schema behind.
+
+Writes go through a write-behind queue and are committed in groups (see
+db.WriteBehind). Pass sync=True, or set LOCALMIND_DURABILITY=sync, to
+commit before returning. Reads here flush the queue first so they see
+this process's own writes.
+"""
 from datetime import datetime
+import hashlib
+import sqlite3
+import zlib
 
-DB = "brain.db"
+import config
+import db
 
-def init():
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
+DB = config.DB
+
+
+def _inflate(data):
+    """SQL inflate(blob): the text stored compressed in a blobs row."""
+    return None if data is None else zlib.decompress(data).decode("utf-8")
+
+
+def _register_functions(conn):
+    conn.create_function("inflate", 1, _inflate, deterministic=True)
+
+
+# Every connection to brain.db can read the log_entries view
+db.register_setup(DB, _register_functions)
+
+_writer = db.WriteBehind(batch=config.WRITE_BATCH, delay=config.WRITE_DELAY)
+
+
+def _write(sql, params, sync=None):
+    _writer.write(sql, params, sync=config.DURABILITY == "sync" if sync is None else sync)
+
+
+def _write_many(statements, sync=None):
+    _writer.write_many(statements, sync=config.DURABILITY == "sync" if sync is None else sync)
+
+
+def flush():
+    """Commit every queued write now."""
+    _writer.flush()
+
+
+def _store_body(execute, text):
+    """
+    Return (inline text, blob hash) for a body: small ones stay inline,
+    large ones are written to blobs through execute(sql, params) once.
+    """
+    if text is None:
+        return None, None
+    raw = text.encode("utf-8")
+    if len(raw) < config.BLOB_MIN_BYTES:
+        return text, None
+    digest = hashlib.sha256(raw).hexdigest()
+    execute(
+        "INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)",
+        (digest, zlib.compress(raw, 6), len(raw))
+    )
+    return None, digest
+
+
+def delete_orphan_blobs(conn):
+    """Remove blobs no logs row refers to any more; returns how many."""
+    return conn.execute("""
+        DELETE FROM blobs WHERE hash NOT IN (
+            SELECT prompt_hash FROM logs WHERE prompt_hash IS NOT NULL
+            UNION SELECT response_hash FROM logs WHERE response_hash IS NOT NULL
+        )
+    """).rowcount
+
+
+def epoch(when=None):
+    """Integer Unix time for a datetime (default now), as stored in the ts columns."""
+    return int((when or datetime.now()).timestamp())
+
+
+def _iso_to_epoch(value):
+    try:
+        return epoch(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _base_schema(c):
     c.execute("""
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -18,23 +106,366 @@ def init():
             stress INTEGER
         )
     """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS llm_calls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            caller TEXT,
+            model TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            ttft REAL,
+            latency REAL,
+            tokens_per_sec REAL,
+            outcome TEXT,
+            queue_wait REAL
+        )
+    """)
+    # Databases created before queue_wait existed
+    columns = [row[1] for row in c.execute("PRAGMA table_info(llm_calls)")]
+    if "queue_wait" not in columns:
+        c.execute("ALTER TABLE llm_calls ADD COLUMN queue_wait REAL")
+
+
+def _epoch_timestamps(c):
+    """Add integer epoch ts columns next to the ISO timestamps, and index them."""
+    for table in ("logs", "llm_calls"):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN ts INTEGER")
+        c.execute(f"UPDATE {table} SET ts = iso_to_epoch(timestamp)")
+    c.execute("CREATE INDEX idx_logs_ts ON logs (ts)")
+    c.execute("CREATE INDEX idx_logs_mode_ts ON logs (mode, ts)")
+    c.execute("CREATE INDEX idx_llm_calls_ts ON llm_calls (ts)")
+
+
+def _full_text_index(c):
+    """FTS5 index over prompt and response, kept in sync with logs by triggers."""
+    c.execute("""
+        CREATE VIRTUAL TABLE logs_fts USING fts5(
+            prompt, response,
+            content='logs', content_rowid='id',
+            tokenize='porter unicode61', prefix='2 3'
+        )
+    """)
+    c.execute("""
+        CREATE TRIGGER logs_fts_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts (rowid, prompt, response) VALUES (new.id, new.prompt, new.response);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER logs_fts_delete AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts (logs_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, old.response);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER logs_fts_update AFTER UPDATE OF prompt, response ON logs BEGIN
+            INSERT INTO logs_fts (logs_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, old.response);
+            INSERT INTO logs_fts (rowid, prompt, response) VALUES (new.id, new.prompt, new.response);
+        END
+    """)
+    c.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+
+
+# Full text of a logs row's prompt/response, whether inline or in blobs
+_PROMPT = "COALESCE({0}.prompt, inflate((SELECT data FROM blobs WHERE hash = {0}.prompt_hash)))"
+_RESPONSE = "COALESCE({0}.response, inflate((SELECT data FROM blobs WHERE hash = {0}.response_hash)))"
+
+
+def _blob_bodies(c):
+    """
+    Move large prompt/response bodies into blobs: zlib-compressed, keyed by
+    SHA-256 so identical bodies are stored once. logs keeps NULL and the
+    hash; the log_entries view (and the full-text index) see the text.
+    """
+    c.execute("""
+        CREATE TABLE blobs (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    c.execute("ALTER TABLE logs ADD COLUMN prompt_hash TEXT")
+    c.execute("ALTER TABLE logs ADD COLUMN response_hash TEXT")
+    for trigger in ("logs_fts_insert", "logs_fts_delete", "logs_fts_update"):
+        c.execute(f"DROP TRIGGER {trigger}")
+    c.execute("DROP TABLE logs_fts")
+
+    ids = [row[0] for row in c.execute(
+        "SELECT id FROM logs WHERE length(prompt) >= ? OR length(response) >= ?",
+        (config.BLOB_MIN_BYTES, config.BLOB_MIN_BYTES)
+    )]
+    for start in range(0, len(ids), 500):
+        marks = ",".join("?" * len(ids[start:start + 500]))
+        rows = c.execute(f"SELECT id, prompt, response FROM logs WHERE id IN ({marks})", ids[start:start + 500]).fetchall()
+        for row_id, prompt, response in rows:
+            prompt, prompt_hash = _store_body(c.execute, prompt)
+            response, response_hash = _store_body(c.execute, response)
+            c.execute(
+                "UPDATE logs SET prompt = ?, prompt_hash = ?, response = ?, response_hash = ? WHERE id = ?",
+                (prompt, prompt_hash, response, response_hash, row_id)
+            )
+
+    c.execute(f"""
+        CREATE VIEW log_entries AS
+        SELECT id, timestamp, ts, mode, {_PROMPT.format("logs")} AS prompt,
+               {_RESPONSE.format("logs")} AS response, focus, clarity, stress
+        FROM logs
+    """)
+    c.execute("""
+        CREATE VIRTUAL TABLE logs_fts USING fts5(
+            prompt, response,
+            content='log_entries', content_rowid='id',
+            tokenize='porter unicode61', prefix='2 3'
+        )
+    """)
+    new = f"{_PROMPT.format('new')}, {_RESPONSE.format('new')}"
+    old = f"{_PROMPT.format('old')}, {_RESPONSE.format('old')}"
+    c.execute(f"""
+        CREATE TRIGGER logs_fts_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts (rowid, prompt, response) VALUES (new.id, {new});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER logs_fts_delete AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts (logs_fts, rowid, prompt, response) VALUES ('delete', old.id, {old});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER logs_fts_update AFTER UPDATE OF prompt, response, prompt_hash, response_hash ON logs BEGIN
+            INSERT INTO logs_fts (logs_fts, rowid, prompt, response) VALUES ('delete', old.id, {old});
+            INSERT INTO logs_fts (rowid, prompt, response) VALUES (new.id, {new});
+        END
+    """)
+    c.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+
+
+# Local day and hour of a logs row, and its response size wherever it is stored
+ROLLUP_DAY = "date({0}.ts, 'unixepoch', 'localtime')"
+ROLLUP_HOUR = "CAST(strftime('%H', {0}.ts, 'unixepoch', 'localtime') AS INTEGER)"
+ROLLUP_BYTES = "COALESCE(length(CAST({0}.response AS BLOB)), (SELECT size FROM blobs WHERE hash = {0}.response_hash), 0)"
+
+
+def _rollups(c):
+    """
+    Daily (day, mode) and hourly (day, hour, mode) rollups of logs, updated
+    by a trigger on every insert. They are not reduced when rows are
+    archived, so they summarise the whole history (see rollups.py).
+    """
+    c.execute("""
+        CREATE TABLE rollup_daily (
+            day TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            focus_sum REAL NOT NULL DEFAULT 0, focus_n INTEGER NOT NULL DEFAULT 0,
+            clarity_sum REAL NOT NULL DEFAULT 0, clarity_n INTEGER NOT NULL DEFAULT 0,
+            stress_sum REAL NOT NULL DEFAULT 0, stress_n INTEGER NOT NULL DEFAULT 0,
+            response_bytes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, mode)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        CREATE TABLE rollup_hourly (
+            day TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            mode TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            response_bytes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, hour, mode)
+        ) WITHOUT ROWID
+    """)
+    c.execute(f"""
+        CREATE TRIGGER logs_rollup_insert AFTER INSERT ON logs WHEN new.ts IS NOT NULL BEGIN
+            INSERT INTO rollup_daily (day, mode, entries, focus_sum, focus_n, clarity_sum, clarity_n,
+                                      stress_sum, stress_n, response_bytes)
+            VALUES ({ROLLUP_DAY.format("new")}, COALESCE(new.mode, ''), 1,
+                    COALESCE(new.focus, 0), new.focus IS NOT NULL,
+                    COALESCE(new.clarity, 0), new.clarity IS NOT NULL,
+                    COALESCE(new.stress, 0), new.stress IS NOT NULL,
+                    {ROLLUP_BYTES.format("new")})
+            ON CONFLICT (day, mode) DO UPDATE SET
+                entries = entries + 1,
+                focus_sum = focus_sum + excluded.focus_sum, focus_n = focus_n + excluded.focus_n,
+                clarity_sum = clarity_sum + excluded.clarity_sum, clarity_n = clarity_n + excluded.clarity_n,
+                stress_sum = stress_sum + excluded.stress_sum, stress_n = stress_n + excluded.stress_n,
+                response_bytes = response_bytes + excluded.response_bytes;
+            INSERT INTO rollup_hourly (day, hour, mode, entries, response_bytes)
+            VALUES ({ROLLUP_DAY.format("new")}, {ROLLUP_HOUR.format("new")}, COALESCE(new.mode, ''), 1,
+                    {ROLLUP_BYTES.format("new")})
+            ON CONFLICT (day, hour, mode) DO UPDATE SET
+                entries = entries + 1,
+                response_bytes = response_bytes + excluded.response_bytes;
+        END
+    """)
+    fill_rollups(c)
+
+
+def fill_rollups(c):
+    """Add every logs row to the (empty) rollup tables."""
+    c.execute(f"""
+        INSERT INTO rollup_daily (day, mode, entries, focus_sum, focus_n, clarity_sum, clarity_n,
+                                  stress_sum, stress_n, response_bytes)
+        SELECT {ROLLUP_DAY.format("logs")}, COALESCE(mode, ''), COUNT(*),
+               TOTAL(focus), COUNT(focus), TOTAL(clarity), COUNT(clarity), TOTAL(stress), COUNT(stress),
+               SUM({ROLLUP_BYTES.format("logs")})
+        FROM logs WHERE ts IS NOT NULL GROUP BY 1, 2
+    """)
+    c.execute(f"""
+        INSERT INTO rollup_hourly (day, hour, mode, entries, response_bytes)
+        SELECT {ROLLUP_DAY.format("logs")}, {ROLLUP_HOUR.format("logs")}, COALESCE(mode, ''), COUNT(*),
+               SUM({ROLLUP_BYTES.format("logs")})
+        FROM logs WHERE ts IS NOT NULL GROUP BY 1, 2, 3
+    """)
+
+
+# Applied in order; the schema version is the number of migrations applied
+MIGRATIONS = [
+    _base_schema,
+    _epoch_timestamps,
+    _full_text_index,
+    _blob_bodies,
+    _rollups,
+]
+
+
+def schema_version(conn=None):
+    return (conn or db.connect()).execute("PRAGMA user_version").fetchone()[0]
+
+
+def init():
+    """Bring brain.db up to the latest schema version."""
+    conn = db.connect()
+    if schema_version(conn) >= len(MIGRATIONS):
+        return
+    conn.create_function("iso_to_epoch", 1, _iso_to_epoch)
     conn.commit()
-    conn.close()
+    # BEGIN IMMEDIATE takes the write lock first, so concurrent processes
+    # migrate one at a time and the loser sees the new version below
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        c = conn.cursor()
+        for version in range(schema_version(conn), len(MIGRATIONS)):
+            MIGRATIONS[version](c)
+            c.execute(f"PRAGMA user_version = {version + 1}")
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+def save(mode, prompt, response, focus=None, clarity=None, stress=None, sync=None):
+    """
+    Log one interaction. sync=True commits before returning (default:
+    LOCALMIND_DURABILITY) and also adds it to the vector memory.
+    """
+    now = datetime.now()
+    sync = config.DURABILITY == "sync" if sync is None else sync
+    # Blob rows commit in the same transaction as the logs row that refers
+    # to them, so orphan cleanup can never drop a body that is still queued
+    statements = []
+    store = lambda sql, params: statements.append((sql, params))
+    prompt, prompt_hash = _store_body(store, prompt)
+    response, response_hash = _store_body(store, response)
+    statements.append((
+        "INSERT INTO logs (timestamp, ts, mode, prompt, prompt_hash, response, response_hash, focus, clarity, stress) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (now.isoformat(), epoch(now), mode, prompt, prompt_hash, response, response_hash, focus, clarity, stress)
+    ))
+    _write_many(statements, sync)
+    if sync and config.VECTOR_MEMORY:
+        import vector_memory
+        try:
+            vector_memory.update()
+        except (OSError, ValueError) as e:
+            print(f"[Vector memory not updated: {e}]")
 
-def save(mode, prompt, response, focus=None, clarity=None, stress=None):
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
+# Snippet markers; callers swap them for their own highlighting
+MATCH_START, MATCH_END = "\x02", "\x03"
+
+
+def match_expression(text):
+    """
+    Turn free text into an FTS5 query: every word must match, `word*`
+    matches a prefix, and punctuation can never cause a syntax error.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search(text, mode=None, since=None, until=None, limit=20, offset=0):
+    """
+    Full-text search over prompts and responses, best BM25 match first
+    (prompt matches weigh double). since/until are datetimes.
+    Yields (id, timestamp, mode, prompt_snippet, response_snippet, score).
+    """
+    expression = match_expression(text)
+    if not expression:
+        return
+    flush()
+    where, params = ["logs_fts MATCH ?"], [expression]
+    if mode:
+        where.append("logs.mode = ?")
+        params.append(mode)
+    if since:
+        where.append("logs.ts >= ?")
+        params.append(epoch(since))
+    if until:
+        where.append("logs.ts < ?")
+        params.append(epoch(until))
+    c = db.connect().cursor()
     c.execute(
-        "INSERT INTO logs (timestamp, mode, prompt, response, focus, clarity, stress) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (datetime.now().isoformat(), mode, prompt, response, focus, clarity, stress)
+        f"SELECT logs.id, logs.timestamp, logs.mode, "
+        f"snippet(logs_fts, 0, '{MATCH_START}', '{MATCH_END}', '...', 12), "
+        f"snippet(logs_fts, 1, '{MATCH_START}', '{MATCH_END}', '...', 24), "
+        f"bm25(logs_fts, 2.0, 1.0) AS score "
+        f"FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid "
+        f"WHERE {' AND '.join(where)} ORDER BY score LIMIT ? OFFSET ?",
+        params + [limit, offset]
     )
-    conn.commit()
-    conn.close()
+    yield from c
 
-def search(keyword):
-    conn = sqlite3.connect(DB)
-    c = conn.cursor()
-    c.execute("SELECT timestamp, prompt FROM logs WHERE prompt LIKE ?", ('%'+keyword+'%',))
+def record_llm_call(caller, model, prompt_tokens, completion_tokens, ttft, latency, tokens_per_sec, outcome, queue_wait=0.0):
+    """Store one LLM call's telemetry (latencies in seconds; queue_wait is time spent waiting for admission)."""
+    now = datetime.now()
+    _write(
+        "INSERT INTO llm_calls (timestamp, ts, caller, model, prompt_tokens, completion_tokens, ttft, latency, tokens_per_sec, outcome, queue_wait) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (now.isoformat(), epoch(now), caller, model, prompt_tokens, completion_tokens, ttft, latency, tokens_per_sec, outcome, queue_wait)
+    )
+
+def llm_calls_since(cutoff):
+    """Return (caller, latency, ttft, tokens_per_sec, outcome, queue_wait) rows newer than cutoff (a datetime)."""
+    flush()
+    c = db.connect().cursor()
+    c.execute(
+        "SELECT caller, latency, ttft, tokens_per_sec, outcome, queue_wait FROM llm_calls WHERE ts > ?",
+        (epoch(cutoff),)
+    )
+    results = c.fetchall()
+    return results
+
+def recent_llm_latencies(min_tokens, max_tokens, limit=200):
+    """Latencies (seconds) of the most recent successful LLM calls whose prompt size falls in [min_tokens, max_tokens)."""
+    flush()
+    c = db.connect().cursor()
+    c.execute(
+        "SELECT latency FROM llm_calls WHERE outcome = 'ok' AND latency IS NOT NULL "
+        "AND prompt_tokens >= ? AND prompt_tokens < ? ORDER BY id DESC LIMIT ?",
+        (min_tokens, max_tokens, limit)
+    )
+    results = [row[0] for row in c.fetchall()]
+    return results
+
+def recent_llm_outcomes(limit, exclude_callers=()):
+    """Return (timestamp, outcome) of the latest LLM calls, newest first."""
+    flush()
+    c = db.connect().cursor()
+    marks = ",".join("?" * len(exclude_callers))
+    c.execute(
+        f"SELECT timestamp, outcome FROM llm_calls WHERE caller NOT IN ({marks}) ORDER BY id DESC LIMIT ?",
+        (*exclude_callers, limit)
+    )
     results = c.fetchall()
-    conn.close()
     return results
@@ -1,36 +1,618 @@
-import subprocess
-import tempfile
-import os
-
-MODEL = "qwen-lite"
-
-def query(prompt):
-    """
-    Query ollama with a prompt using file-based input to avoid subprocess issues.
-    """
-    # Write prompt to temp file to avoid stdin buffering issues
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as f:
-        f.write(prompt)
-        temp_path = f.name
-    
-    try:
-        # Use shell with file redirection instead of stdin
-        cmd = f"cat {temp_path} | ollama run {MODEL} 2>/dev/null"
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=120
-        )
-        return result.stdout if result.stdout else ""
-    except subprocess.TimeoutExpired:
-        return "[Response timed out]"
-    except Exception as e:
-        return f"[Error: {str(e)[:100]}]"
+"""
+LLM wrapper around the local inference server.
+
+Every call goes to the backend picked by LOCALMIND_BACKEND (see backends.py):
+Ollama's REST API by default, an OpenAI-compatible server such as llama.cpp,
+or a deterministic fake for benchmarking. HTTP backends share one pool of
+keep-alive connections instead of spawning a process per prompt.
+
+The transport is native asyncio and runs on a single background event loop.
+The async API (aquery, agenerate, achat, astream_generate) can be awaited
+from any event loop and supports per-call deadlines; cancelling a call
+closes its connection, which makes the server stop generating. The sync API
+(query, generate, chat, stream_generate) is a thin wrapper over it, so
+Ctrl-C during a sync call cancels the generation too.
+"""
+import asyncio
+import hashlib
+import json
+import queue
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import admission
+import backends
+import config
+import latency
+import llm_cache
+import memory
+import residency
+import routing
+
+from backends import BackendError
+
+MODEL = config.MODEL
+OllamaError = BackendError  # former name, kept for existing callers
+
+
+class _SingleFlight:
+    """
+    Coalesces identical in-flight requests on the LLM loop.
+    Later callers for a key that is already being generated wait for that
+    generation instead of starting another one. The shared generation is
+    cancelled only once every waiter has gone away.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, factory):
+        call = self._calls.get(key)
+        if call is None:
+            call = [asyncio.ensure_future(factory()), 0]
+            self._calls[key] = call
+            call[0].add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                call[0].cancel()
+
+
+def _flight_key(kind, model, options, body):
+    raw = json.dumps([_backend.name, kind, model, options or {}, body], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _DeadlineExceeded(TimeoutError):
+    """The caller's own deadline ran out; not a backend failure."""
+
+
+class _CallTimer:
+    """Timing and token counts of one backend call, for the llm_calls table."""
+
+    def __init__(self, caller, model, prompt, queue_wait=0.0):
+        self.caller = caller or "unknown"
+        self.model = model
+        self.prompt = prompt
+        self.queue_wait = queue_wait
+        self.started = time.monotonic()
+        self.ttft = None
+        self.tokens_seen = 0
+        self.info = {}
+        self.outcome = "error"
+
+    def token(self):
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.started
+        self.tokens_seen += 1
+
+    def row(self):
+        total = time.monotonic() - self.started
+        info = self.info
+        prompt_tokens = info.get("prompt_eval_count") or len(self.prompt) // 4
+        completion_tokens = info.get("eval_count") or self.tokens_seen or None
+        ttft = self.ttft
+        if ttft is None and "prompt_eval_duration" in info:
+            ttft = (info.get("load_duration", 0) + info["prompt_eval_duration"]) / 1e9
+        tps = None
+        if info.get("eval_count") and info.get("eval_duration"):
+            tps = info["eval_count"] / (info["eval_duration"] / 1e9)
+        elif completion_tokens and ttft is not None and total > ttft:
+            tps = completion_tokens / (total - ttft)
+        return (self.caller, self.model, prompt_tokens, completion_tokens,
+                ttft, total, tps, self.outcome, self.queue_wait)
+
+
+class Conversation:
+    """
+    Backend state carried across the turns of one multi-turn session, so
+    each turn prefills only its new text instead of the whole history.
+
+    With Ollama the `context` returned by a turn is sent with the next one,
+    and the server continues from it without evaluating it again. Other
+    backends are sent the full transcript so far; it only ever grows at the
+    end, so the server's prompt cache serves everything but the new turn.
+    Pass one to stream_generate() / print_stream() as `conversation=`.
+    """
+
+    def __init__(self):
+        self.use_context = _backend.supports_context
+        self.context = None
+        self.transcript = ""
+        self.turns = []  # (prompt tokens prefilled, prompt tokens reused) per turn
+
+    def prompt_for(self, text):
+        """What to send to the backend for a turn whose new text is `text`."""
+        return text if self.use_context else self.transcript + text
+
+    def carried_tokens(self):
+        """Approximate tokens of earlier turns the next turn builds on."""
+        if self.use_context:
+            return len(self.context or ())
+        return len(self.transcript) // 4
+
+    def record(self, text, reply, info):
+        self.transcript += text + reply + "\n\n"
+        if self.use_context:
+            self.context = info.get("context")
+            if not self.context:
+                self.use_context = False  # server gave no state back: fall back to the transcript
+        self.turns.append((info.get("prompt_eval_count") or 0, info.get("prompt_reused") or 0))
+
+    def reset(self):
+        """Forget earlier turns (e.g. when they no longer fit the context window)."""
+        self.use_context = _backend.supports_context
+        self.context = None
+        self.transcript = ""
+
+    @staticmethod
+    def _savings(prefilled, reused):
+        total = prefilled + reused
+        saved = 100 * reused / total if total else 0
+        return f"{prefilled} new prompt tokens, {reused} reused ({saved:.0f}% saved)"
+
+    def report(self):
+        """One line describing the last turn's prefill savings."""
+        if not self.turns:
+            return ""
+        return f"[prefill: {self._savings(*self.turns[-1])}]"
+
+    def summary(self):
+        """One line with the prefill savings over every turn so far."""
+        prefilled = sum(p for p, _ in self.turns)
+        reused = sum(r for _, r in self.turns)
+        return f"[{len(self.turns)} turns, prefill: {self._savings(prefilled, reused)}]"
+
+
+_telemetry_ready = False
+
+
+def _record_call(row):
+    global _telemetry_ready
+    try:
+        if not _telemetry_ready:
+            memory.init()
+            _telemetry_ready = True
+        memory.record_llm_call(*row)
+    except sqlite3.Error:
+        pass
+
+
+@asynccontextmanager
+async def _timed(caller, model, prompt, queue_wait=0.0):
+    """Record one backend call in brain.db's llm_calls table, whatever its outcome."""
+    timer = _CallTimer(caller, model, prompt, queue_wait)
+    try:
+        yield timer
+        timer.outcome = "ok"
+    except (_DeadlineExceeded, asyncio.CancelledError, GeneratorExit):
+        # The caller stopped waiting; the backend did nothing wrong
+        timer.outcome = "cancelled"
+        raise
+    except (TimeoutError, socket.timeout):
+        timer.outcome = "timeout"
+        raise
     finally:
+        if timer.caller not in latency.UNCOUNTED_CALLERS:
+            latency.breaker.record(timer.outcome)
+        row = timer.row()
         try:
-            os.unlink(temp_path)
-        except:
-            pass
+            await asyncio.get_running_loop().run_in_executor(None, _record_call, row)
+        except RuntimeError:
+            # Executor already shut down (interpreter exiting): write inline
+            _record_call(row)
+
+
+_backend = backends.create()
+_inflight = _SingleFlight()
+_loop = None
+_loop_lock = threading.Lock()
+_DONE = object()
+
+
+def _llm_loop():
+    """The background event loop that owns the backend's connections."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="localmind-llm", daemon=True).start()
+    return _loop
+
+
+async def _on_llm_loop(coro):
+    """Await a coroutine on the background loop from any event loop."""
+    loop = _llm_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def _run(coro):
+    """Run a coroutine on the background loop and block until it finishes."""
+    future = asyncio.run_coroutine_threadsafe(coro, _llm_loop())
+    try:
+        return future.result()
+    finally:
+        # No-op once finished; on Ctrl-C this cancels the generation
+        future.cancel()
+
+
+async def _with_deadline(coro, deadline):
+    if deadline is None:
+        return await coro
+    try:
+        return await asyncio.wait_for(coro, deadline)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"deadline of {deadline:.0f}s exceeded") from None
+
+
+async def _timed_call(op, body, model, options, timeout, caller, prompt):
+    """
+    Run one backend generate/chat call once admitted, and record it in the
+    telemetry. The call may take as long as recent calls of a similar size
+    suggest (see latency.py), not counting time spent queued for admission.
+    """
+    limit = await asyncio.get_running_loop().run_in_executor(None, latency.timeout_for, prompt)
+    async with admission.admitted() as queue_wait:
+        async with _timed(caller, model, prompt, queue_wait) as timer:
+            call = op(body, model, options, timeout, residency.keep_alive())
+            text, timer.info = await _with_deadline(call, limit)
+    return text
+
+
+async def agenerate(prompt, model=None, options=None, timeout=None, deadline=None, caller=None):
+    """
+    Run a single completion on the configured backend and return the text.
+    `timeout` bounds each wait for data; `deadline` bounds the whole call.
+    `caller` names the mode or panel: it picks the model and generation
+    options from routing.py (explicit arguments win) and labels the call in
+    the llm_calls telemetry.
+    Identical requests already in flight are shared rather than repeated.
+    Raises TimeoutError or BackendError (CircuitOpenError while the backend
+    keeps failing); use aquery() for the forgiving version.
+    """
+    latency.breaker.check()
+    return await _agenerate(prompt, model, options, timeout, deadline, caller)
+
+
+async def _agenerate(prompt, model, options, timeout, deadline, caller):
+    """agenerate() once the circuit breaker has let the call through."""
+    model, options = routing.resolve(caller, model, options)
+    coro = _inflight.do(
+        _flight_key("generate", model, options, prompt),
+        lambda: _timed_call(_backend.generate, prompt, model, options,
+                            timeout or config.TIMEOUT, caller, prompt)
+    )
+    return await _on_llm_loop(_with_deadline(coro, deadline))
+
+
+async def achat(messages, model=None, options=None, timeout=None, deadline=None, caller=None):
+    """
+    Run a chat completion on the configured backend.
+    `messages` is a list of {"role": ..., "content": ...} dicts.
+    """
+    latency.breaker.check()
+    model, options = routing.resolve(caller, model, options)
+    text = "\n".join(m.get("content", "") for m in messages)
+    coro = _inflight.do(
+        _flight_key("chat", model, options, messages),
+        lambda: _timed_call(_backend.chat, messages, model, options,
+                            timeout or config.TIMEOUT, caller, text)
+    )
+    return await _on_llm_loop(_with_deadline(coro, deadline))
+
+
+async def _atokens(prompt, model, options, timeout, deadline, caller, conversation=None):
+    latency.breaker.check()
+    model, options = routing.resolve(caller, model, options)
+    sent, context = prompt, None
+    if conversation is not None:
+        sent, context = conversation.prompt_for(prompt), conversation.context
+    parts = []
+    started = time.monotonic()
+    async with admission.admitted() as queue_wait:
+        async with _timed(caller, model, sent, queue_wait) as timer:
+            stream = _backend.stream(sent, model, options, timeout or config.TIMEOUT,
+                                     residency.keep_alive(), context)
+            try:
+                while True:
+                    # The deadline bounds every wait, not only the gaps before
+                    # tokens that do arrive; timing out closes the stream
+                    next_item = stream.__anext__()
+                    if deadline is not None:
+                        next_item = asyncio.wait_for(next_item, max(deadline - (time.monotonic() - started), 0))
+                    try:
+                        token, info = await next_item
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise _DeadlineExceeded(f"deadline of {deadline:.0f}s exceeded") from None
+                    if info is not None:
+                        timer.info = info
+                        continue
+                    timer.token()
+                    parts.append(token)
+                    yield token
+            finally:
+                await stream.aclose()
+            if conversation is not None:
+                conversation.record(prompt, "".join(parts), timer.info)
+
+
+async def astream_generate(prompt, model=None, options=None, timeout=None, deadline=None, caller=None,
+                           conversation=None):
+    """
+    Async generator of completion tokens from the configured backend.
+    Closing or cancelling it drops the connection, which stops generation.
+    With a Conversation, the prompt continues that conversation's earlier turns.
+    """
+    loop = asyncio.get_running_loop()
+    if loop is _llm_loop():
+        async for token in _atokens(prompt, model, options, timeout, deadline, caller, conversation):
+            yield token
+        return
+
+    tokens = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for token in _atokens(prompt, model, options, timeout, deadline, caller, conversation):
+                loop.call_soon_threadsafe(tokens.put_nowait, token)
+        except Exception as e:
+            loop.call_soon_threadsafe(tokens.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(tokens.put_nowait, _DONE)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _llm_loop())
+    try:
+        while True:
+            item = await tokens.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+def generate(prompt, model=None, options=None, timeout=None, deadline=None, caller=None):
+    """
+    Run a single completion on the configured backend and return the text.
+    Raises TimeoutError or BackendError; use query() for the forgiving version.
+    """
+    return _run(agenerate(prompt, model, options, timeout, deadline, caller))
+
+
+def chat(messages, model=None, options=None, timeout=None, deadline=None, caller=None):
+    """
+    Run a chat completion on the configured backend.
+    `messages` is a list of {"role": ..., "content": ...} dicts.
+    """
+    return _run(achat(messages, model, options, timeout, deadline, caller))
+
+
+def stream_generate(prompt, model=None, options=None, timeout=None, deadline=None, caller=None,
+                    conversation=None):
+    """
+    Yield completion tokens as the model produces them.
+    With a Conversation, the prompt continues that conversation's earlier turns.
+    Raises TimeoutError or BackendError; use query_stream() for the forgiving version.
+    Closing the generator early drops the connection, which stops generation.
+    """
+    tokens = queue.Queue()
+
+    async def pump():
+        try:
+            async for token in _atokens(prompt, model, options, timeout, deadline, caller, conversation):
+                tokens.put(token)
+        except Exception as e:
+            tokens.put(e)
+        finally:
+            tokens.put(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), _llm_loop())
+    try:
+        while True:
+            item = tokens.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+def embed(texts, model=None, timeout=None):
+    """
+    Embed texts with the backend's embedding model (LOCALMIND_EMBED_MODEL).
+    Returns one list of floats per text; raises BackendError if the backend
+    or model cannot embed.
+    """
+    model = model or config.EMBED_MODEL
+
+    async def run():
+        async with admission.admitted():
+            return await _backend.embed(texts, model, timeout or config.TIMEOUT)
+
+    return _run(run())
+
+
+def loaded_models():
+    """
+    Models currently held in memory by the backend (Ollama's /api/ps), as a
+    list of dicts with at least "name".
+    """
+    return _run(_backend.loaded_models(10))
+
+
+def preload(model=None, keep_alive=None, wait=True):
+    """
+    Load a model into memory without generating anything.
+    With wait=False the load runs in the background and a Future is returned,
+    so callers can do other work while the weights are read.
+    """
+    model = model or MODEL
+
+    async def load():
+        async with _timed("residency.preload", model, "") as timer:
+            timer.info = await _backend.preload(model, keep_alive, config.TIMEOUT)
+        return timer.info
+
+    coro = load()
+    future = asyncio.run_coroutine_threadsafe(coro, _llm_loop())
+    return future.result() if wait else future
+
+
+def query_stream(prompt, caller=None, conversation=None):
+    """
+    Streaming variant of query(): yields tokens as they arrive.
+    Errors are yielded as the same bracketed markers query() returns.
+    """
+    try:
+        yield from stream_generate(prompt, caller=caller, conversation=conversation)
+    except (TimeoutError, socket.timeout):
+        yield "[Response timed out]"
+    except Exception as e:
+        yield f"[Error: {str(e)[:100]}]"
+
+
+def print_stream(prompt, caller=None, conversation=None):
+    """
+    Print a completion token by token and return the full text.
+    Set LOCALMIND_SHOW_TIMING=1 to print time-to-first-token afterwards.
+    """
+    start = time.monotonic()
+    first_token = None
+    parts = []
+    for token in query_stream(prompt, caller, conversation):
+        if first_token is None:
+            first_token = time.monotonic() - start
+        print(token, end="", flush=True)
+        parts.append(token)
+    print()
+    if config.SHOW_TIMING and first_token is not None:
+        print(f"[first token {first_token:.1f}s, total {time.monotonic() - start:.1f}s]")
+    return "".join(parts)
+
+
+def _cache_get(key):
+    try:
+        return llm_cache.get(key)
+    except sqlite3.Error:
+        return None
+
+
+def _cache_put(key, model, response):
+    try:
+        llm_cache.put(key, model, response)
+    except sqlite3.Error:
+        pass
+
+
+async def _claim(key, limit):
+    """
+    Wait until no other process is generating key, then claim it.
+    Returns the response another process produced meanwhile, if any.
+    Raises TimeoutError if the other process still holds the claim after
+    `limit` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    give_up = time.monotonic() + limit
+    waited = False
+    while not llm_cache.try_claim(key):
+        if time.monotonic() >= give_up:
+            raise TimeoutError(f"another process is still generating this prompt after {limit:.0f}s")
+        waited = True
+        await asyncio.sleep(0.25)
+    if waited:
+        try:
+            return await loop.run_in_executor(None, lambda: llm_cache.get(key, count=False))
+        except sqlite3.Error:
+            return None
+    return None
+
+
+async def aquery(prompt, cache=True, deadline=None, caller=None, fallback=None, model=None):
+    """
+    Async query with an optional deadline (seconds for the whole call).
+    `caller` names the mode or panel in the llm_calls telemetry and picks
+    the route; an explicit `model` overrides the route's model.
+    Identical prompts are answered from the response cache; pass cache=False
+    to force a fresh generation. Cancelling the awaiting task stops the
+    generation on the server.
+    If the call times out or fails (including while the circuit breaker is
+    open) `fallback` is returned when given, else a bracketed error marker.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    model, options = routing.resolve(caller, model)
+    use_cache = cache and config.CACHE_ENABLED
+    key = llm_cache.make_key(model, prompt, dict(options or {}, backend=_backend.name)) if use_cache else None
+    if use_cache:
+        cached = await loop.run_in_executor(None, _cache_get, key)
+        if cached is not None:
+            return cached
+    claimed = False
+    try:
+        latency.breaker.check()
+        if use_cache:
+            # Another CLI process may be generating the same prompt right now;
+            # wait for it no longer than this call may take itself
+            limit = await loop.run_in_executor(None, latency.timeout_for, prompt)
+            if deadline is not None:
+                limit = min(limit, deadline)
+            cached = await _claim(key, limit)
+            claimed = True
+            if cached is not None:
+                latency.breaker.record("ok")  # the peer's answer shows the backend is up
+                return cached
+        remaining = None if deadline is None else max(deadline - (time.monotonic() - started), 0.001)
+        response = await _agenerate(prompt, model, options, None, remaining, caller)
+        if use_cache and response:
+            await loop.run_in_executor(None, _cache_put, key, model, response)
+        return response
+    except (TimeoutError, socket.timeout):
+        return "[Response timed out]" if fallback is None else fallback
+    except Exception as e:
+        return f"[Error: {str(e)[:100]}]" if fallback is None else fallback
+    finally:
+        if claimed:
+            llm_cache.release_claim(key)
+
+
+def query(prompt, cache=True, deadline=None, caller=None, fallback=None, model=None):
+    """
+    Query the local model with a prompt over the configured backend.
+    Thin sync wrapper around aquery().
+    """
+    return _run(aquery(prompt, cache, deadline, caller, fallback, model))
+
+
+def query_many(prompts, cache=True, deadline=None, caller=None, fallback=None, model=None):
+    """Run several independent queries concurrently; results keep prompt order."""
+    async def gather():
+        return await asyncio.gather(*(aquery(p, cache, deadline, caller, fallback, model) for p in prompts))
+    return _run(gather())
+
+
+def query_all(calls):
+    """
+    Like query_many() for queries that differ in more than the prompt:
+    `calls` are dicts of query() keyword arguments (at least "prompt").
+    Results keep the order of calls.
+    """
+    async def gather():
+        return await asyncio.gather(*(aquery(**call) for call in calls))
+    return _run(gather())
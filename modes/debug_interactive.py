@@ -2,13 +2,27 @@
 Interactive debugging mode - allows multi-turn conversation.
 Auto-loads files, provides solutions, and can apply fixes.
 """
-from model import query
+from model import Conversation, print_stream, query
+import config
+import patching
+import prompt_budget
+import residency
+import routing
 import json
 from datetime import datetime
 import os
 import re
 import shutil
 
+# How the model is asked to present fixes. Diffs cost a few dozen output
+# tokens per change instead of a full copy of the file.
+if config.PATCH_FIXES:
+    FIX_FORMAT = ("When fixing a loaded file, do NOT repeat the whole file: give a unified diff in a ```diff block "
+                  "(--- a/FILE, +++ b/FILE, @@ hunks with 3 unchanged context lines) so it can be auto-applied.")
+else:
+    FIX_FORMAT = ("When showing fixed code, ALWAYS wrap it in the correct language block "
+                  "(```python, ```javascript, ```cpp, etc.) so it can be auto-applied.")
+
 def extract_and_read_files(text, work_dir="/home/diti/storage/localmind"):
     """
     Extract filenames from text and read their contents if they exist.
@@ -40,7 +54,8 @@ def extract_and_read_files(text, work_dir="/home/diti/storage/localmind"):
 def apply_file_fix(filename, fixed_content, work_dir="/home/diti/storage/localmind", detect_language=True):
     """
     Apply a fix to a file by writing the corrected content.
-    Creates a backup first.
+    Creates a backup first, refuses content that no longer parses, and
+    replaces the file atomically.
     """
     full_path = os.path.join(work_dir, filename)
     
@@ -48,6 +63,11 @@ def apply_file_fix(filename, fixed_content, work_dir="/home/diti/storage/localmi
         print(f" File not found: {full_path}")
         return False
     
+    ok, message = patching.verify(filename, fixed_content)
+    if not ok:
+        print(f" Fix not applied: the fixed {filename} {message}")
+        return False
+    
     try:
         #  backup!!!
         backup_path = f"{full_path}.backup"
@@ -55,8 +75,7 @@ def apply_file_fix(filename, fixed_content, work_dir="/home/diti/storage/localmi
         print(f"Backup created: {backup_path}")
         
         # Write fixed content
-        with open(full_path, 'w') as f:
-            f.write(fixed_content)
+        patching.atomic_write(full_path, fixed_content)
         
         print(f" Fixed: {filename}")
         return True
@@ -96,30 +115,106 @@ def get_file_language(filename):
     _, ext = os.path.splitext(filename)
     return ext_to_lang.get(ext, 'plaintext')
 
+def patched_content(filename, diff_blocks, file_contents):
+    """
+    Apply the model's diff hunks for filename to its loaded content.
+    Returns the patched text, or None if the diff does not apply or the
+    result does not parse.
+    """
+    original = file_contents.get(filename)
+    if original is None:
+        return None
+    for diff in diff_blocks:
+        try:
+            hunks = patching.hunks_for(patching.parse(diff), filename)
+            if not hunks:
+                continue
+            patched = patching.apply(original, hunks)
+        except patching.PatchError as e:
+            print(f"⚠ Diff for {filename} did not apply: {e}")
+            continue
+        ok, message = patching.verify(filename, patched)
+        if ok:
+            return patched
+        print(f"⚠ Patched {filename} {message}")
+    return None
+
+def regenerate_full_file(filename, ai_response, file_contents):
+    """
+    Fallback: ask the model for the complete corrected file.
+    The file goes in verbatim and comes back whole, so it must fit the
+    context window twice; a condensed file cannot be rewritten faithfully,
+    so larger files are not regenerated. The fix description is condensed
+    to fit around it.
+    """
+    language = get_file_language(filename)
+    model = routing.model_for("debug-interactive")
+    source = file_contents[filename]
+    render = lambda fix: f"""Apply the fix described below to this file and return the COMPLETE corrected file in one ```{language} block, nothing else.
+
+FIX:
+{fix}
+
+{filename}:
+```{language}
+{source}
+```"""
+    # The reply repeats the whole file, so it takes the room usually kept for output
+    room = (prompt_budget.context_size(model) - prompt_budget.estimate_tokens(render(""))
+            - prompt_budget.estimate_tokens(source))
+    if room < 256:
+        print(f"\n⚠ {filename} is too large to regenerate in full; apply the suggested patch by hand.")
+        return None
+    print(f"\n Regenerating the full corrected {filename}...\n")
+    prompt = render(prompt_budget.fit(ai_response, room, purpose=f"a fix to {filename}"))
+    blocks = extract_code_blocks(query(prompt, caller="debug-interactive", cache=False), language)
+    if not blocks or not patching.covers_file(source, blocks[0]):
+        print(f"\n⚠ The model did not return the complete {filename}; apply the suggested fix by hand.")
+        return None
+    return blocks[0]
+
 def prompt_to_apply_fix(filename, ai_response, file_contents):
     """
     Ask user if they want to apply the fix suggested by AI.
+    Diff hunks are applied to the loaded file; a code block is used as is
+    only if it is clearly the whole corrected file. Otherwise (a diff that
+    does not apply, or a snippet) the full file is regenerated.
     Supports any code language.
     """
+    if filename not in file_contents:
+        return False
     language = get_file_language(filename)
+    diff_blocks = extract_code_blocks(ai_response, 'diff') + extract_code_blocks(ai_response, 'patch')
     code_blocks = extract_code_blocks(ai_response, language)
     
-    if not code_blocks:
+    fixed_content = preview = None
+    if diff_blocks:
+        fixed_content = patched_content(filename, diff_blocks, file_contents)
+        preview = diff_blocks[0]
+    if fixed_content is None:
+        # A snippet written over the file would delete everything else in it
+        whole = [b for b in code_blocks if patching.covers_file(file_contents[filename], b)]
+        if whole:
+            fixed_content = preview = whole[0]
+    if fixed_content is None and (diff_blocks or code_blocks):
+        fixed_content = preview = regenerate_full_file(filename, ai_response, file_contents)
+    
+    if not fixed_content:
         return False
     
     print("\n" + "="*70)
     print("🔧 FIX AVAILABLE")
     print("="*70)
     print(f"\nFile: {filename}")
-    print(f"Fixed code preview:\n")
-    print(code_blocks[0][:500])
-    if len(code_blocks[0]) > 500:
+    print(f"{'Patch' if preview is not fixed_content else 'Fixed code'} preview:\n")
+    print(preview[:500])
+    if len(preview) > 500:
         print("...[truncated]...\n")
     
     response = input("\n✋ Apply this fix to the file? (yes/no): ").strip().lower()
     
     if response in ['yes', 'y']:
-        if apply_file_fix(filename, code_blocks[0]):
+        if apply_file_fix(filename, fixed_content):
             print("\n✨ File updated successfully!")
             return True
     else:
@@ -128,6 +223,49 @@ def prompt_to_apply_fix(filename, ai_response, file_contents):
     
     return False
 
+def file_blocks(file_contents, header):
+    """Render loaded files as fenced code blocks under a header."""
+    if not file_contents:
+        return ""
+    refs = f"\n\n{header}\n" + "-"*50 + "\n"
+    for filename, content in file_contents.items():
+        language = get_file_language(filename)
+        refs += f"\n{filename}:\n```{language}\n{content}\n```\n"
+    return refs
+
+def rebuilt_prompt(conversation_history, user_input, file_contents, initial_problem, model=None):
+    """
+    A self-contained turn prompt: recent history plus every loaded file.
+    Used when the earlier turns no longer fit the context window.
+    """
+    # Build context from conversation
+    context = "\n".join([
+        f"{'Assistant' if msg['role'] == 'assistant' else 'User'}: {msg['content'][:300]}..."
+        for msg in conversation_history[-4:]  # Last 4 messages for context
+    ])
+    
+    # Include file contents for reference
+    file_ref = file_blocks(file_contents, " FILE REFERENCES (for context):")
+    
+    # Continue debugging with context - FOCUS ON SOLVING
+    render_continue = lambda refs: f"""Continue debugging and PROVIDE SOLUTIONS:
+
+CONVERSATION SO FAR:
+{context}
+
+USER'S NEW INPUT: {user_input}{refs}
+
+IMPORTANT: Now that you have more information, provide CONCRETE SOLUTIONS:
+1. Diagnose the root cause based on all information
+2. Provide step-by-step FIX (not just explanation)
+3. {FIX_FORMAT}
+4. Include code examples and explain WHY this fix works
+5. List ways to prevent this in future
+6. Ask what else they want to debug or if this resolved it
+
+If you have enough info to solve it, SOLVE IT. Don't just ask more questions."""
+    return prompt_budget.build(render_continue, file_ref, purpose=f"debugging: {initial_problem[:200]}", model=model)
+
 def run_debug_session(initial_problem):
     """
     Start an interactive debugging session that keeps conversation open.
@@ -137,6 +275,8 @@ def run_debug_session(initial_problem):
     print(" INTERACTIVE DEBUG SESSION")
     print("="*70)
     print(f"\nInitial Problem: {initial_problem}")
+    # Load the model in the background while files are scanned
+    residency.warm_up()
     
     # Auto-detecting files
     print("\n Scanning for referenced files...")
@@ -156,9 +296,9 @@ def run_debug_session(initial_problem):
             language = get_file_language(filename)
             file_context += f"\n📄 {filename}:\n```{language}\n{content}\n```\n"
     
-    initial_prompt = f"""You are debugging this problem:
+    render_initial = lambda context: f"""You are debugging this problem:
 
-{initial_problem}{file_context}
+{initial_problem}{context}
 
 STRATEGY:
 1. Based on what you know, provide initial diagnosis (what's likely wrong)
@@ -167,15 +307,22 @@ STRATEGY:
 4. Format as:
    - ROOT CAUSE HYPOTHESIS (what you think it is)
    - IMMEDIATE ACTION ITEMS (what user should check/provide)
-   - PRELIMINARY FIX (if you can guess the solution, provide with correct language syntax: ```python, ```js, ```cpp, etc.)
+   - PRELIMINARY FIX (if you can guess the solution)
    - CRITICAL QUESTIONS (numbered 1-3)
 
-IMPORTANT: When showing fixed code, wrap it in the correct language block (```python, ```javascript, ```cpp, etc.) so it can be auto-applied.
+IMPORTANT: {FIX_FORMAT}
 Support any programming language. Be ready to provide actual solutions once you have more info. Don't be vague."""
+    # Large files are condensed (map-reduce) so the prompt fits the context window
+    model = routing.model_for("debug-interactive")
+    initial_prompt = prompt_budget.build(render_initial, file_context, purpose=f"debugging: {initial_problem[:200]}", model=model)
     
+    # Later turns continue this conversation on the backend, so the files
+    # and history are prefilled once rather than on every turn
+    conversation = Conversation()
+
     print(" Analyzing problem & gathering details...\n")
-    analysis = query(initial_prompt)
-    print(analysis)
+    analysis = print_stream(initial_prompt, caller="debug-interactive", conversation=conversation)
+    print(conversation.report())
     print("\n" + "-"*70 + "\n")
     
     # keeping the agent convo alive
@@ -186,6 +333,7 @@ Support any programming language. Be ready to provide actual solutions once you
     
     turn = 0
     max_turns = 10
+    updated_files = ""  # files changed by an applied fix, sent with the next turn
     
     while turn < max_turns:
         turn += 1
@@ -208,44 +356,38 @@ Support any programming language. Be ready to provide actual solutions once you
         # Add to history
         conversation_history.append({"role": "user", "content": user_input})
         
-        # Build context from conversation
-        context = "\n".join([
-            f"{'Assistant' if msg['role'] == 'assistant' else 'User'}: {msg['content'][:300]}..."
-            for msg in conversation_history[-4:]  # Last 4 messages for context
-        ])
-        
-        # Include file contents in every prompt for reference
-        file_ref = ""
-        if file_contents:
-            file_ref = "\n\n FILE REFERENCES (for context):\n" + "-"*50 + "\n"
-            for filename, content in file_contents.items():
-                # Show relevant lines around the issue if possible
-                language = get_file_language(filename)
-                file_ref += f"\n{filename}:\n```{language}\n{content}\n```\n"
-        
-        # Continue debugging with context - FOCUS ON SOLVING
-        continue_prompt = f"""Continue debugging and PROVIDE SOLUTIONS:
+        # Only the new input goes to the backend; earlier turns are reused
+        render_turn = lambda refs: f"""USER'S NEW INPUT: {user_input}{refs}
 
-CONVERSATION SO FAR:
-{context}
-
-USER'S NEW INPUT: {user_input}{file_ref}
-
-IMPORTANT: Now that you have more information, provide CONCRETE SOLUTIONS:
+Continue debugging with everything above in mind and PROVIDE CONCRETE SOLUTIONS:
 1. Diagnose the root cause based on all information
 2. Provide step-by-step FIX (not just explanation)
-3. When showing fixed code, ALWAYS wrap in ```python CODE ``` blocks (user can auto-apply)
+3. {FIX_FORMAT}
 4. Include code examples and explain WHY this fix works
 5. List ways to prevent this in future
 6. Ask what else they want to debug or if this resolved it
 
 If you have enough info to solve it, SOLVE IT. Don't just ask more questions."""
+        continue_prompt = render_turn(updated_files)
+        room = prompt_budget.input_budget(model) - conversation.carried_tokens()
+        if prompt_budget.estimate_tokens(continue_prompt) > room:
+            # Earlier turns no longer fit the context window: start over
+            # from a rebuilt prompt with recent history and the files
+            conversation.reset()
+            continue_prompt = rebuilt_prompt(conversation_history, user_input, file_contents, initial_problem, model)
         
         print("\n Analyzing...\n")
-        response = query(continue_prompt)
-        print(response)
+        try:
+            response = print_stream(continue_prompt, caller="debug-interactive", conversation=conversation)
+            print(conversation.report())
+        except KeyboardInterrupt:
+            # Ctrl-C drops the connection, so the model stops generating too
+            print("\n[Generation cancelled]\n")
+            conversation_history.pop()
+            continue
         
         conversation_history.append({"role": "assistant", "content": response})
+        updated_files = ""
         
         # Check if there's a fix to apply
         if file_contents:
@@ -253,9 +395,12 @@ If you have enough info to solve it, SOLVE IT. Don't just ask more questions."""
                 # Check if this file is mentioned and there's a code block
                 if filename in response and '```' in response:
                     print()
-                    prompt_to_apply_fix(filename, response, file_contents)
+                    applied = prompt_to_apply_fix(filename, response, file_contents)
                     # Reload file contents after potential fix
                     file_contents = extract_and_read_files(f"debug {filename}")
+                    if applied:
+                        # The backend still holds the old version: send the new one next turn
+                        updated_files = file_blocks(file_contents, " UPDATED FILE (fix applied):")
                     break
         
         # Check if user wants to continue
@@ -266,5 +411,5 @@ If you have enough info to solve it, SOLVE IT. Don't just ask more questions."""
             break
     
     print("\n" + "="*70)
-    print("Debug session complete. Session saved to memory.")
+    print(f"Debug session complete. Session saved to memory. {conversation.summary()}")
     print("="*70 + "\n")
@@ -1,65 +1,38 @@
 """
 Intelligent mode helpers with better AI interaction.
 """
-import subprocess
-import sys
-import time
+from latency import CircuitOpenError
+from model import generate
 
-def smart_query(prompt, timeout=45, max_retries=2):
+def smart_query(prompt, timeout=None, max_retries=2, caller="helpers"):
     """
-    Call ollama with better error handling and retry logic.
+    Call the local model with better error handling and retry logic.
+    Each attempt gets an adaptive timeout from recent latencies of similar
+    prompts (see latency.py); `timeout` caps each wait for data. Retries
+    are immediate and stop as soon as the circuit breaker reports the
+    backend down, instead of sleeping blindly between attempts.
     """
     for attempt in range(max_retries):
         try:
-            # Using direct shell command to avoid  subprocess hanging
-            import tempfile
-            import os
-            
-            # Write prompt to temp file
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt') as f:
-                f.write(prompt)
-                temp_path = f.name
-            
-            try:
-                # Run ollama with file input
-                result = subprocess.run(
-                    f"cat {temp_path} | ollama run qwen-lite 2>&1",
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout
-                )
-                
-                os.unlink(temp_path)
-                
-                if result.stdout:
-                    return result.stdout.strip()
-                else:
-                    return f"[No response - attempt {attempt + 1}]"
-                    
-            except subprocess.TimeoutExpired:
-                os.unlink(temp_path)
-                if attempt < max_retries - 1:
-                    print(f"⏱ Timeout on attempt {attempt + 1}, retrying...")
-                    time.sleep(2)
-                else:
-                    return "[Response timed out]"
-            except Exception as e:
-                try:
-                    os.unlink(temp_path)
-                except:
-                    pass
-                return f"[Error: {str(e)[:50]}]"
-                
-        except Exception as e:
+            response = generate(prompt, timeout=timeout, caller=caller)
+            if response:
+                return response.strip()
+            else:
+                return f"[No response - attempt {attempt + 1}]"
+
+        except CircuitOpenError as e:
+            return f"[Error: {str(e)[:50]}]"
+        except TimeoutError:
             if attempt < max_retries - 1:
-                time.sleep(2)
+                print(f"⏱ Timeout on attempt {attempt + 1}, retrying...")
             else:
-                return f"[Fatal error: {str(e)[:50]}]"
+                return "[Response timed out]"
+        except Exception as e:
+            if attempt >= max_retries - 1:
+                return f"[Error: {str(e)[:50]}]"
     
     return "[Failed to get response after retries]"
 
-
 def ask_clarifying_questions(topic, initial_info):
     """
     Ask 3-4 smart clarifying questions relevant to the topic.
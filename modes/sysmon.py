@@ -112,6 +112,23 @@ def list_old_kernels(max_keep=3):
     except Exception:
         return []
 
+def fallback_recommendations(root_usage, caches):
+    """Rule-based recommendations used when the LLM is unavailable."""
+    lines = []
+    percent = root_usage.get('percent_used', 0) if root_usage else 0
+    if percent > 90:
+        lines.append(" Root partition >90% used — investigate large files and caches.")
+    elif percent > 80:
+        lines.append(" Root partition >80% used — consider cleaning caches or logs.")
+    else:
+        lines.append(" Disk usage looks healthy.")
+
+    if caches and any(e['size_bytes'] > 500*1024*1024 for e in caches):
+        lines.append(" Large cache directories found (over 500MB). Consider cleanup.")
+    else:
+        lines.append("Cache sizes are modest.")
+    return "\n".join(lines)
+
 def run_sysmon():
     """Run all checks and print a concise report. Read-only by design."""
     print("\n🔎 SYSTEM MONITOR REPORT (read-only)\n")
@@ -197,21 +214,9 @@ def run_sysmon():
         "Include bash commands if applicable."
     )
     
-    try:
-        llm_recommendation = query(llm_prompt).strip()
-        print(llm_recommendation)
-    except:
-        # Fallback hopefully na use krna pade
-        if root_usage and 'percent_used' in root_usage and root_usage['percent_used'] > 90:
-            print(" Root partition >90% used — investigate large files and caches.")
-        elif root_usage and root_usage['percent_used'] > 80:
-            print(" Root partition >80% used — consider cleaning caches or logs.")
-        else:
-            print(" Disk usage looks healthy.")
-        
-        if caches and any(e['size_bytes'] > 500*1024*1024 for e in caches):
-            print(" Large cache directories found (over 500MB). Consider cleanup.")
-        else:
-            print("Cache sizes are modest.")
+    # Rule-based advice is shown instead when the model times out or is unavailable
+    llm_recommendation = query(llm_prompt, caller="sysmon",
+                               fallback=fallback_recommendations(root_usage, caches)).strip()
+    print(llm_recommendation)
 
     print("\nNote: This tool only inspects and reports. It will not modify anything without your explicit permission.")
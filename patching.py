@@ -0,0 +1,236 @@
+"""
+Unified-diff fixes: parse the hunks a model writes, apply them to a file
+with fuzzy context matching, verify the result parses, and write it
+atomically.
+
+Models rarely get @@ line numbers right and often mangle whitespace in
+context lines, so hunks are located by their content: an exact match
+first, then ignoring whitespace, then by similarity, trimming context
+lines from the edges like patch's fuzz factor.
+"""
+import ast
+import difflib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+try:
+    import yaml
+except ImportError:  # YAML files are not verified without PyYAML
+    yaml = None
+
+# ElementTree.ParseError is a SyntaxError
+_PARSE_ERRORS = (SyntaxError, ValueError) + ((yaml.YAMLError,) if yaml else ())
+
+# A hunk's context lines must be at least this similar to the file to match
+MIN_SIMILARITY = 0.85
+MAX_FUZZ = 2  # context lines that may be dropped from each end of a hunk
+# Share of the file's lines a code block must keep to count as the whole file
+MIN_COVERAGE = 0.6
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+class PatchError(Exception):
+    """Raised when a diff cannot be parsed or applied."""
+
+
+class Hunk:
+    """One @@ block: (op, text) lines where op is ' ', '-' or '+'."""
+
+    def __init__(self, start=None):
+        self.start = start  # 1-based line number from the header, if any
+        self.lines = []
+
+
+def parse(diff_text):
+    """
+    Parse unified diff text into {filename: [Hunk, ...]}.
+    Hunks that come before any ---/+++ header are filed under None.
+    """
+    files = {}
+    current = None
+    hunk = None
+    lines = diff_text.splitlines()
+    for i, line in enumerate(lines):
+        following = lines[i + 1] if i + 1 < len(lines) else ""
+        if line.startswith("--- ") and following.startswith("+++ "):
+            hunk = None  # file header; the name is taken from the +++ line
+        elif line.startswith("+++ ") and hunk is None:
+            name = line[4:].split("\t")[0].strip()
+            current = name[2:] if name.startswith(("a/", "b/")) else name
+            files.setdefault(current, [])
+        elif line.startswith("@@"):
+            match = _HUNK_HEADER.match(line)
+            hunk = Hunk(int(match.group(1)) if match else None)
+            files.setdefault(current, []).append(hunk)
+        elif hunk is not None and line[:1] in (" ", "-", "+"):
+            hunk.lines.append((line[0], line[1:]))
+        elif hunk is not None and line == "":
+            hunk.lines.append((" ", ""))  # blank context line with its space stripped
+    files = {name: [h for h in hunks if h.lines] for name, hunks in files.items()}
+    if not any(files.values()):
+        raise PatchError("no diff hunks found")
+    return files
+
+
+def hunks_for(files, filename):
+    """Pick the hunks meant for filename (matching by path suffix)."""
+    for name, hunks in files.items():
+        if name and (name == filename or name.endswith("/" + filename) or filename.endswith("/" + name)):
+            return hunks
+    return files.get(None, [])
+
+
+def _similarity(a, b):
+    return difflib.SequenceMatcher(None, "\n".join(a), "\n".join(b), autojunk=False).ratio()
+
+
+def _find(lines, old, hint):
+    """Index where `old` starts in `lines`, preferring matches nearest the hint."""
+    n = len(old)
+    starts = range(len(lines) - n + 1)
+    by_distance = sorted(starts, key=lambda i: abs(i - hint))
+
+    for i in by_distance:
+        if lines[i:i + n] == old:
+            return i
+    stripped = [l.strip() for l in old]
+    for i in by_distance:
+        if [l.strip() for l in lines[i:i + n]] == stripped:
+            return i
+
+    best, best_score = None, MIN_SIMILARITY
+    for i in by_distance:
+        score = _similarity(lines[i:i + n], old)
+        if score > best_score:
+            best, best_score = i, score
+    return best
+
+
+def _locate(lines, hunk, hint):
+    """Return (index, old_lines, new_lines) for a hunk, trimming context if needed."""
+    ops = hunk.lines
+    for fuzz in range(MAX_FUZZ + 1):
+        # Drop up to `fuzz` pure context lines from each end
+        head = 0
+        while head < fuzz and head < len(ops) and ops[head][0] == " ":
+            head += 1
+        tail = 0
+        while tail < fuzz and tail < len(ops) - head and ops[len(ops) - 1 - tail][0] == " ":
+            tail += 1
+        trimmed = ops[head:len(ops) - tail]
+        old = [t for op, t in trimmed if op in " -"]
+        if not old:
+            # Pure insertion with no context left: use the header position
+            return min(max(hint, 0), len(lines)), old, [t for op, t in trimmed]
+        index = _find(lines, old, hint)
+        if index is not None:
+            # Context lines keep the file's own text, not the model's copy
+            new, pos = [], index
+            for op, text in trimmed:
+                if op == " ":
+                    new.append(lines[pos])
+                if op in " -":
+                    pos += 1
+                if op == "+":
+                    new.append(text)
+            return index, old, new
+    raise PatchError(f"hunk at line {hunk.start or '?'} does not match the file")
+
+
+def apply(text, hunks):
+    """Apply hunks to text and return the patched text. Raises PatchError."""
+    lines = text.splitlines()
+    trailing_newline = text.endswith("\n")
+    offset = 0  # line shift caused by earlier hunks
+    for hunk in hunks:
+        hint = (hunk.start - 1 + offset) if hunk.start else 0
+        index, old, new = _locate(lines, hunk, hint)
+        lines[index:index + len(old)] = new
+        offset += len(new) - len(old)
+    result = "\n".join(lines)
+    return result + "\n" if trailing_newline or not text else result
+
+
+def covers_file(original, candidate):
+    """
+    True if candidate looks like a complete copy of original rather than a
+    snippet of it: it keeps at least MIN_COVERAGE of the original's
+    non-blank lines and is at least that share of its length.
+    """
+    lines = [l.strip() for l in original.splitlines() if l.strip()]
+    if not lines:
+        return True
+    kept = set(l.strip() for l in candidate.splitlines())
+    coverage = sum(l in kept for l in lines) / len(lines)
+    return coverage >= MIN_COVERAGE and len(candidate) >= MIN_COVERAGE * len(original)
+
+
+def _check_with(command, content, suffix):
+    """Run a syntax-only checker on content; (None, message) if it is not installed."""
+    if not shutil.which(command[0]):
+        return None, f"{command[0]} not found; not verified"
+    fd, tmp = tempfile.mkstemp(prefix=".localmind-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        result = subprocess.run(command + [tmp], capture_output=True, text=True, timeout=30)
+    finally:
+        os.unlink(tmp)
+    if result.returncode != 0:
+        error = (result.stderr or result.stdout).strip().splitlines()
+        return False, f"does not parse: {error[-1] if error else 'syntax error'}"
+    return True, "parses cleanly"
+
+
+def verify(filename, content):
+    """
+    Check that content still parses for languages we can check locally:
+    Python, JSON and XML always, YAML with PyYAML, shell scripts with
+    bash -n and JavaScript with node --check when those are installed.
+    Returns (ok, message).
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    try:
+        if ext == ".py":
+            ast.parse(content, filename)
+        elif ext == ".json":
+            json.loads(content)
+        elif ext == ".xml":
+            ElementTree.fromstring(content)
+        elif ext in (".yaml", ".yml") and yaml is not None:
+            yaml.safe_load(content)
+        elif ext in (".sh", ".bash"):
+            ok, message = _check_with(["bash", "-n"], content, ext)
+            return ok is not False, message
+        elif ext in (".js", ".mjs", ".cjs"):
+            ok, message = _check_with(["node", "--check"], content, ext)
+            return ok is not False, message
+        else:
+            return True, "no parser for this file type; not verified"
+    except _PARSE_ERRORS as e:
+        return False, f"does not parse: {e}"
+    return True, "parses cleanly"
+
+
+def atomic_write(path, content):
+    """Replace path with content so readers never see a half-written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".localmind-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
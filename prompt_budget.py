@@ -0,0 +1,135 @@
+"""
+Token budgeting for prompts that embed user content.
+
+Estimates token counts locally, knows each model's context window and, when
+content would not fit, condenses it with a map-reduce pass: the content is
+split into chunks that are summarised in parallel (map) and the summaries
+are combined (reduce) until the result fits.
+"""
+import math
+import re
+
+import config
+import routing
+from model import MODEL, query_many
+
+# Context windows of the models we serve. Ollama truncates prompts to its
+# num_ctx setting whatever the model supports, so list the size the model is
+# actually served with. LOCALMIND_NUM_CTX overrides all of these.
+DEFAULT_CONTEXT = 2048
+CONTEXT_SIZES = {
+    "qwen-lite": 2048,
+}
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Rough local token count: words cost one token per ~4 characters and
+    every punctuation mark costs one. Errs on the high side for code.
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(p) / 4) if p[0].isalnum() or p[0] == "_" else 1
+               for p in _PIECES.findall(text))
+
+
+def context_size(model=None):
+    return config.NUM_CTX or CONTEXT_SIZES.get(model or MODEL, DEFAULT_CONTEXT)
+
+
+def input_budget(model=None):
+    """Tokens available for the prompt once room for the reply is reserved."""
+    return context_size(model) - config.OUTPUT_RESERVE
+
+
+def split_chunks(text, max_tokens):
+    """Split text on line boundaries into chunks of at most max_tokens each."""
+    chunks, current, used = [], [], 0
+    for line in text.splitlines(keepends=True):
+        cost = estimate_tokens(line)
+        if cost > max_tokens:
+            # A single huge line (minified code, logs): cut it by characters
+            step = max_tokens * 2
+            pieces = [line[i:i + step] for i in range(0, len(line), step)]
+        else:
+            pieces = [line]
+        for piece in pieces:
+            cost = estimate_tokens(piece)
+            if current and used + cost > max_tokens:
+                chunks.append("".join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += cost
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _map_prompt(chunk, index, total, purpose):
+    return f"""This is part {index} of {total} of a larger input, needed for {purpose}.
+
+Summarise it so the full task can still be done from your summary alone:
+- keep names of files, functions, classes and variables
+- keep error messages, numbers and anything that looks like a bug verbatim
+- drop boilerplate and repetition
+
+Return only the summary.
+
+PART {index}/{total}:
+{chunk}"""
+
+
+def condense(content, max_tokens, purpose):
+    """
+    Map-reduce content down to at most max_tokens.
+    Chunks are sized for and summarised by the map route's model (usually
+    smaller and faster than the model the content is budgeted for); the
+    summaries are joined and, if they still do not fit, condensed again.
+    A chunk whose summary fails (timeout, backend error) is kept as it is
+    rather than replaced by the error.
+    """
+    overhead = estimate_tokens(_map_prompt("", 0, 0, purpose))
+    chunk_tokens = max(256, input_budget(routing.model_for("prompt_budget.map")) - overhead)
+    failed = object()
+
+    rounds = 0
+    while estimate_tokens(content) > max_tokens and rounds < 3:
+        chunks = split_chunks(content, chunk_tokens)
+        rounds += 1
+        print(f"[Input too large (~{estimate_tokens(content)} tokens); "
+              f"condensing {len(chunks)} chunks in parallel]")
+        summaries = query_many([
+            _map_prompt(chunk, i, len(chunks), purpose)
+            for i, chunk in enumerate(chunks, 1)
+        ], caller="prompt_budget.map", fallback=failed)
+        if all(summary is failed for summary in summaries):
+            print("[Could not condense the input; truncating it]")
+            break
+        content = "\n\n".join(
+            chunk if summary is failed else f"[Part {i}/{len(chunks)} summary]\n{summary.strip()}"
+            for i, (chunk, summary) in enumerate(zip(chunks, summaries), 1)
+        )
+
+    if estimate_tokens(content) > max_tokens:
+        # Still too large after several rounds: keep what fits
+        content = split_chunks(content, max_tokens)[0] + "\n[...truncated to fit the context window...]"
+    return content
+
+
+def fit(content, max_tokens, purpose="the task below"):
+    """Return content unchanged if it fits in max_tokens, else condense it."""
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    return condense(content, max_tokens, purpose)
+
+
+def build(render, content, purpose="the task below", model=None):
+    """
+    Render a prompt around user content, condensing the content if the
+    full prompt would not fit in the model's context window.
+    `render` is a callable that takes the content and returns the prompt.
+    """
+    room = input_budget(model) - estimate_tokens(render(""))
+    return render(fit(content, max(room, 256), purpose))
@@ -0,0 +1,114 @@
+"""
+Model residency: keeps the local model loaded so interactive use never pays
+the cold-load cost.
+
+- every request asks Ollama to keep the model loaded for LOCALMIND_KEEP_ALIVE
+- during LOCALMIND_PIN_HOURS (e.g. "9-18") the model is pinned indefinitely
+- dashboard and debug sessions call warm_up() on start, so the weights load
+  while they collect system data or wait for the user
+- `scheduler.py --keep-warm` (from cron) pins/unpins around working hours
+"""
+from datetime import datetime, timedelta, timezone
+
+import config
+
+
+def pin_hours():
+    """Return (start, end) hours from LOCALMIND_PIN_HOURS, or None if unset/invalid."""
+    try:
+        start, end = (int(h) for h in config.PIN_HOURS.split("-"))
+    except ValueError:
+        return None
+    return start, end
+
+
+def is_pinned_time(now=None):
+    hours = pin_hours()
+    if hours is None:
+        return False
+    hour = (now or datetime.now()).hour
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end  # window wraps past midnight
+
+
+def keep_alive(now=None):
+    """keep_alive value to send with requests: -1 (forever) while pinned."""
+    return -1 if is_pinned_time(now) else config.KEEP_ALIVE
+
+
+def _matches(name, model):
+    return name == model or (":" not in model and name.split(":", 1)[0] == model)
+
+
+def resident(model=None):
+    """Return Ollama's /api/ps entry for the model, or None if it is not loaded."""
+    import model as llm
+    target = model or llm.MODEL
+    for entry in llm.loaded_models():
+        if _matches(entry.get("name", ""), target):
+            return entry
+    return None
+
+
+def is_loaded(model=None):
+    try:
+        return resident(model) is not None
+    except Exception:
+        return False
+
+
+def warm_up(model=None, wait=False):
+    """
+    Make sure the model is loaded, starting the load in the background unless
+    wait=True. Returns True if it was already resident. Never raises: a
+    missing server just means the first query reports the error.
+    """
+    import model as llm
+    try:
+        if is_loaded(model):
+            return True
+        future = llm.preload(model, keep_alive(), wait=False)
+        if wait:
+            future.result()
+    except Exception:
+        pass
+    return False
+
+
+def _expires_at(entry):
+    raw = entry.get("expires_at", "")
+    # Go timestamps carry nanoseconds; trim to microseconds for fromisoformat
+    if "." in raw:
+        head, tail = raw.split(".", 1)
+        digits = len(tail) - len(tail.lstrip("0123456789"))
+        raw = head + "." + tail[:digits][:6].ljust(6, "0") + tail[digits:]
+    raw = raw.replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+
+
+def maintain(model=None):
+    """
+    Scheduler hook: pin the model during working hours, and outside them
+    hand a still-pinned model back to the normal keep-alive expiry.
+    Returns a short description of what was done.
+    """
+    import model as llm
+    if is_pinned_time():
+        if is_loaded(model):
+            return "model resident (pinned)"
+        llm.preload(model, -1)
+        return "model loaded and pinned"
+
+    entry = resident(model)
+    if entry is None:
+        return "model not loaded (outside pin hours)"
+    expires = _expires_at(entry)
+    if expires is not None and expires - datetime.now(timezone.utc) > timedelta(days=1):
+        llm.preload(model, config.KEEP_ALIVE)
+        return f"pin released; model unloads after {config.KEEP_ALIVE} idle"
+    return "model resident (normal keep-alive)"
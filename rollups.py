@@ -0,0 +1,125 @@
+"""
+Pre-aggregated activity for summaries and the dashboard.
+
+rollup_daily holds, per local day and mode, the entry count, the sums and
+counts of focus/clarity/stress and the total response size; rollup_hourly
+holds entry counts per day, hour and mode. A trigger on logs keeps both
+current on every insert (see memory._rollups), so a week or a month is a
+few dozen rows to read instead of every log.
+
+Archiving does not touch the rollups, so they keep covering archived
+history. `brain rollups` rebuilds them from logs and the archive.
+
+Windows are whole local days: "the last 7 days" is today and the 6 before.
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import archive
+import db
+import memory
+
+METRICS = ("focus", "clarity", "stress")
+
+
+def since_day(days):
+    """ISO date of the first day of a window of `days` days ending today."""
+    return (date.today() - timedelta(days=days - 1)).isoformat()
+
+
+def _merge(totals, day, mode, entries, metrics, response_bytes):
+    row = totals.setdefault((day, mode), [0] * (2 + 2 * len(METRICS)))
+    row[0] += entries
+    for i, (value_sum, value_n) in enumerate(metrics):
+        row[1 + 2 * i] += value_sum
+        row[2 + 2 * i] += value_n
+    row[-1] += response_bytes
+
+
+def _archived():
+    """Daily totals keyed by (day, mode) and hourly rows of the archived records."""
+    daily, hourly, hourly_bytes = {}, Counter(), Counter()
+    for record in archive.rows():
+        if not record.get("ts"):
+            continue
+        when = datetime.fromtimestamp(record["ts"])
+        day, mode = when.date().isoformat(), record["mode"] or ""
+        size = len((record["response"] or "").encode("utf-8"))
+        metrics = [(record[m] or 0, record[m] is not None) for m in METRICS]
+        _merge(daily, day, mode, 1, metrics, size)
+        hourly[(day, when.hour, mode)] += 1
+        hourly_bytes[(day, when.hour, mode)] += size
+    return daily, [key + (count, hourly_bytes[key]) for key, count in hourly.items()]
+
+
+def rebuild():
+    """Recompute both rollup tables from logs and the archive; returns the days covered."""
+    memory.flush()
+    daily, hourly = _archived()
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM rollup_daily")
+        conn.execute("DELETE FROM rollup_hourly")
+        memory.fill_rollups(conn)
+        conn.executemany("""
+            INSERT INTO rollup_daily (day, mode, entries, focus_sum, focus_n, clarity_sum, clarity_n,
+                                      stress_sum, stress_n, response_bytes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, mode) DO UPDATE SET
+                entries = entries + excluded.entries,
+                focus_sum = focus_sum + excluded.focus_sum, focus_n = focus_n + excluded.focus_n,
+                clarity_sum = clarity_sum + excluded.clarity_sum, clarity_n = clarity_n + excluded.clarity_n,
+                stress_sum = stress_sum + excluded.stress_sum, stress_n = stress_n + excluded.stress_n,
+                response_bytes = response_bytes + excluded.response_bytes
+        """, [key + tuple(values) for key, values in daily.items()])
+        conn.executemany("""
+            INSERT INTO rollup_hourly (day, hour, mode, entries, response_bytes) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (day, hour, mode) DO UPDATE SET
+                entries = entries + excluded.entries,
+                response_bytes = response_bytes + excluded.response_bytes
+        """, hourly)
+        return conn.execute("SELECT COUNT(DISTINCT day) FROM rollup_daily").fetchone()[0]
+
+
+def totals(since):
+    """
+    Activity from the day `since` (ISO date) on: a dict with entries,
+    modes (Counter), avg_focus/avg_clarity/avg_stress (None without data)
+    and avg_response_length.
+    """
+    memory.flush()
+    conn = db.connect()
+    row = conn.execute("""
+        SELECT TOTAL(entries), TOTAL(focus_sum), TOTAL(focus_n), TOTAL(clarity_sum), TOTAL(clarity_n),
+               TOTAL(stress_sum), TOTAL(stress_n), TOTAL(response_bytes)
+        FROM rollup_daily WHERE day >= ?
+    """, (since,)).fetchone()
+    entries = int(row[0])
+    result = {"entries": entries}
+    for i, name in enumerate(METRICS):
+        value_sum, value_n = row[1 + 2 * i], row[2 + 2 * i]
+        result[f"avg_{name}"] = value_sum / value_n if value_n else None
+    result["avg_response_length"] = row[7] / entries if entries else 0
+    result["modes"] = Counter(dict(conn.execute(
+        "SELECT mode, SUM(entries) FROM rollup_daily WHERE day >= ? GROUP BY mode", (since,)
+    ).fetchall()))
+    return result
+
+
+def daily(since):
+    """Per-day averages from `since` on, oldest first, as (day, entries, focus, clarity, stress)."""
+    memory.flush()
+    return db.connect().execute("""
+        SELECT day, SUM(entries),
+               SUM(focus_sum) / NULLIF(SUM(focus_n), 0),
+               SUM(clarity_sum) / NULLIF(SUM(clarity_n), 0),
+               SUM(stress_sum) / NULLIF(SUM(stress_n), 0)
+        FROM rollup_daily WHERE day >= ? GROUP BY day ORDER BY day
+    """, (since,)).fetchall()
+
+
+def hours(since):
+    """Entries per local hour of day from `since` on, as a Counter."""
+    memory.flush()
+    return Counter(dict(db.connect().execute(
+        "SELECT hour, SUM(entries) FROM rollup_hourly WHERE day >= ? GROUP BY hour", (since,)
+    ).fetchall()))
@@ -0,0 +1,87 @@
+"""
+Task-aware routing: which model and generation settings each caller gets.
+
+Callers are the names passed as `caller=` (modes such as "code", dashboard
+panels such as "dashboard.topics"). Short summarisation jobs run on
+LOCALMIND_SMALL_MODEL with tight output caps; code review and debugging
+keep LOCALMIND_MODEL with no cap.
+
+Routes can be overridden without editing this file: point
+LOCALMIND_ROUTES at a JSON file such as
+    {"dashboard.alert": {"model": "qwen2.5:0.5b", "num_predict": 64}}
+"""
+import json
+
+import config
+
+# Generation options carried by a route (Ollama option names, plus
+# "format": "json" to constrain the reply to JSON)
+OPTION_KEYS = ("num_predict", "temperature", "stop", "format")
+
+SMALL = {"model": config.SMALL_MODEL, "temperature": 0.2}
+LARGE = {"model": config.MODEL}
+
+ROUTES = {
+    # One-line or one-paragraph dashboard jobs
+    "dashboard.topics": dict(SMALL, num_predict=32, stop=["\n\n"]),
+    "dashboard.pattern": dict(SMALL, num_predict=64, stop=["\n\n"]),
+    "dashboard.alert": dict(SMALL, num_predict=96),
+    "dashboard.timeline": dict(SMALL, num_predict=96),
+    "dashboard.insights": dict(SMALL, num_predict=160),
+    "dashboard.trends": dict(SMALL, num_predict=200),
+    "dashboard.fused": dict(SMALL, num_predict=768, format="json"),
+    "prompt_budget.map": dict(SMALL, num_predict=config.OUTPUT_RESERVE),
+    "sysmon": dict(SMALL, num_predict=300),
+    "journal": dict(SMALL, num_predict=256),
+    # Full reasoning and code: the large model, uncapped
+    "code": dict(LARGE, temperature=0.2),
+    "codefile": dict(LARGE, temperature=0.2),
+    "debug": LARGE,
+    "debug-interactive": LARGE,
+    "plan": LARGE,
+    "reflect": LARGE,
+    "agent": LARGE,
+}
+
+_overrides = None
+
+
+def _load_overrides():
+    global _overrides
+    if _overrides is None:
+        _overrides = {}
+        if config.ROUTES_FILE:
+            try:
+                with open(config.ROUTES_FILE) as f:
+                    _overrides = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[Ignoring {config.ROUTES_FILE}: {e}]")
+    return _overrides
+
+
+def route(caller):
+    """
+    Return the route dict for a caller: its own entry, else the entry for
+    its prefix ("dashboard" for "dashboard.foo"), else the default model.
+    """
+    overrides = _load_overrides()
+    result = {}
+    for name in ((caller or "").split(".", 1)[0], caller):
+        result.update(ROUTES.get(name, {}))
+        result.update(overrides.get(name, {}))
+    return result
+
+
+def model_for(caller):
+    return route(caller).get("model") or config.MODEL
+
+
+def resolve(caller, model=None, options=None):
+    """
+    Return (model, options) for one call. Explicit arguments win over the
+    route; options is None when nothing is set.
+    """
+    selected = route(caller)
+    merged = {k: selected[k] for k in OPTION_KEYS if selected.get(k) is not None}
+    merged.update(options or {})
+    return model or selected.get("model") or config.MODEL, merged or None
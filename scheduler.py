@@ -4,6 +4,7 @@ Scheduler for automatic cleanup of old brain logs.
 This can be run as a cron job or background service.
 """
 
+import os
 import subprocess
 import sys
 from datetime import datetime
@@ -29,9 +30,13 @@ def run_cleanup():
         result = subprocess.run(
             ["python", str(BRAIN_DIR / "brain.py"), "cleanup", str(KEEP_DAYS)],
             cwd=str(BRAIN_DIR),
+            # Scheduled jobs queue behind interactive and dashboard use of the model
+            env={**os.environ, "LOCALMIND_PRIORITY": os.environ.get("LOCALMIND_PRIORITY") or "background"},
+            # Archiving runs in short batches; lower CPU priority keeps the CLI responsive
+            preexec_fn=(lambda: os.nice(10)) if hasattr(os, "nice") else None,
             capture_output=True,
             text=True,
-            timeout=60
+            timeout=600
         )
         
         if result.returncode == 0:
@@ -52,6 +57,17 @@ def run_cleanup():
         log_message(f"✗ Error during cleanup: {e}")
         return False
 
+def keep_warm():
+    """Pin the model during LOCALMIND_PIN_HOURS and release it afterwards"""
+    sys.path.insert(0, str(BRAIN_DIR))
+    try:
+        import residency
+        log_message(f"Model residency: {residency.maintain()}")
+        return True
+    except Exception as e:
+        log_message(f"✗ Model residency check failed: {e}")
+        return False
+
 def setup_cron():
     """Print instructions for setting up cron job"""
     print("\n" + "="*60)
@@ -64,11 +80,15 @@ def setup_cron():
     print("\nOr for other frequencies:")
     print(f"  # Daily at 3 AM:     0 3 * * * python {BRAIN_DIR}/scheduler.py")
     print(f"  # Every Monday 1 AM: 0 1 * * 1 python {BRAIN_DIR}/scheduler.py")
+    print("\nTo keep the model loaded during working hours (set LOCALMIND_PIN_HOURS, e.g. 9-18):")
+    print(f"\n  */10 * * * * python {BRAIN_DIR}/scheduler.py --keep-warm")
     print("\n" + "="*60 + "\n")
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "--setup":
         setup_cron()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--keep-warm":
+        keep_warm()
     else:
         run_cleanup()
 #the most useless feature of this system till now.
\ No newline at end of file
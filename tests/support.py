@@ -0,0 +1,38 @@
+"""
+Shared test setup: points LocalMind at a throwaway data directory and the
+fake backend before any module reads config. Import it first in every
+test module, ahead of any LocalMind module.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+DATA_DIR = tempfile.mkdtemp(prefix="localmind-tests-")
+
+os.environ.update({
+    "LOCALMIND_DB": os.path.join(DATA_DIR, "brain.db"),
+    "LOCALMIND_BACKEND": "fake",
+    "LOCALMIND_FAKE_LATENCY": "0",
+    "LOCALMIND_FAKE_TOKEN_LATENCY": "0",
+    "LOCALMIND_VECTOR_MEMORY": "0",
+    "LOCALMIND_CACHE": "0",
+})
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def reset_brain_db():
+    """Bring brain.db to the latest schema and empty its tables and the archive."""
+    import shutil
+
+    import config
+    import db
+    import memory
+
+    memory.init()
+    memory.flush()
+    with db.transaction() as conn:
+        for table in ("logs", "blobs", "llm_calls", "rollup_daily", "rollup_hourly"):
+            conn.execute(f"DELETE FROM {table}")
+    shutil.rmtree(config.ARCHIVE_DIR, ignore_errors=True)
@@ -0,0 +1,98 @@
+"""Tests for archive.py: segment reading, crash recovery and archiving logs rows."""
+import gzip
+import json
+import os
+import unittest
+from datetime import datetime, timedelta
+
+import support
+import archive
+import config
+import db
+import memory
+
+MONTH = "2024-01"
+
+
+def record(i):
+    return {"id": i, "timestamp": f"{MONTH}-0{i}T10:00:00", "ts": 1704103200 + i * 86400,
+            "mode": "journal", "prompt": f"prompt {i}", "response": f"response {i}",
+            "focus": None, "clarity": None, "stress": None}
+
+
+def torn_member(records):
+    """A batch whose append was cut short by a crash."""
+    data = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+    member = gzip.compress(data)
+    return member[:len(member) // 2]
+
+
+class SegmentTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_brain_db()
+        os.makedirs(config.ARCHIVE_DIR)
+        self.path = archive._segment_path(MONTH)
+
+    def ids(self):
+        return [r["id"] for r in archive.rows()]
+
+    def test_batches_after_a_torn_member_stay_readable(self):
+        archive._append(MONTH, [record(1)])
+        with open(self.path, "ab") as f:
+            f.write(torn_member([record(2)]))
+        archive._append(MONTH, [record(3)])
+        self.assertEqual(self.ids(), [1, 3])
+
+    def test_torn_tail_is_cut_before_the_next_append(self):
+        archive._append(MONTH, [record(1)])
+        intact = os.path.getsize(self.path)
+        with open(self.path, "ab") as f:
+            f.write(torn_member([record(2)]))
+        archive._truncate_torn(self.path)
+        self.assertEqual(os.path.getsize(self.path), intact)
+        archive._append(MONTH, [record(2), record(3)])
+        self.assertEqual(self.ids(), [1, 2, 3])
+
+    def test_repeated_ids_are_read_once(self):
+        archive._append(MONTH, [record(1), record(2)])
+        archive._append(MONTH, [record(2), record(3)])
+        self.assertEqual(self.ids(), [1, 2, 3])
+
+
+class ArchiveOlderThanTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_brain_db()
+
+    def add_log(self, when, text):
+        with db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO logs (timestamp, ts, mode, prompt, response) VALUES (?, ?, ?, ?, ?)",
+                (when.isoformat(), memory.epoch(when), "journal", text, text)
+            )
+
+    def test_old_rows_move_to_the_archive(self):
+        now = datetime.now()
+        self.add_log(now - timedelta(days=400), "old entry")
+        self.add_log(now, "new entry")
+        self.assertEqual(archive.archive_older_than(30, pause=0), 1)
+
+        remaining = db.connect().execute("SELECT prompt FROM log_entries").fetchall()
+        self.assertEqual(remaining, [("new entry",)])
+        self.assertEqual([r["prompt"] for r in archive.rows()], ["old entry"])
+        self.assertEqual(len(list(archive.search("old"))), 1)
+
+    def test_archiving_recovers_a_torn_segment(self):
+        old = datetime.now() - timedelta(days=400)
+        month = old.strftime("%Y-%m")
+        os.makedirs(config.ARCHIVE_DIR)
+        with open(archive._segment_path(month), "wb") as f:
+            f.write(torn_member([record(99)]))
+        self.add_log(old, "old entry")
+        archive.archive_older_than(30, pause=0)
+        self.assertEqual([r["prompt"] for r in archive.rows()], ["old entry"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+"""
+Tests for the pooled keep-alive HTTP client, against a local stand-in for
+Ollama's REST API, so no model or server is needed.
+
+Covers connection reuse, the pool's concurrency bound, streaming,
+cancellation (closing the connection stops generation) and recovery from
+a server dropping an idle keep-alive connection.
+
+Run:        python -m pytest tests   (or python -m unittest discover tests)
+Benchmark:  python tests/test_backends.py bench [requests]
+"""
+import asyncio
+import json
+import sys
+import time
+import unittest
+
+import support  # noqa: F401  (must come before LocalMind modules)
+from backends import AsyncConnectionPool, OllamaBackend  # noqa: E402
+
+
+class StandInServer:
+    """
+    Minimal HTTP/1.1 keep-alive server answering /api/generate like Ollama.
+    Streams one JSON line per token, `token_delay` seconds apart, and counts
+    connections, concurrent requests and streams the client aborted.
+    """
+
+    def __init__(self, tokens=8, token_delay=0.0, close_idle_after=None):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.close_idle_after = close_idle_after  # requests served before dropping the connection
+        self.connections = 0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.tokens_sent = 0
+        self.aborted = asyncio.Event()
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.host = f"127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        served = 0
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                payload = json.loads(body) if body else {}
+                self.requests += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                try:
+                    if payload.get("stream"):
+                        await self._stream(reader, writer, payload)
+                    else:
+                        await self._reply(writer, payload)
+                finally:
+                    self.active -= 1
+                served += 1
+                if self.close_idle_after and served >= self.close_idle_after:
+                    return  # drop the keep-alive connection without saying so
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.aborted.set()
+        except asyncio.CancelledError:
+            pass  # event loop shutting down with the connection still open
+        finally:
+            writer.close()
+
+    def _words(self, payload):
+        return [f"w{i} " for i in range(self.tokens)]
+
+    async def _reply(self, writer, payload):
+        await asyncio.sleep(self.token_delay * self.tokens)
+        data = json.dumps({"response": "".join(self._words(payload)), "done": True,
+                           "eval_count": self.tokens}).encode("utf-8")
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def _stream(self, reader, writer, payload):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        lines = [{"response": word, "done": False} for word in self._words(payload)]
+        lines.append({"response": "", "done": True, "eval_count": self.tokens})
+        for line in lines:
+            await asyncio.sleep(self.token_delay)
+            if reader.at_eof():
+                raise ConnectionResetError("client went away")  # like Ollama, stop generating
+            chunk = (json.dumps(line) + "\n").encode("utf-8")
+            writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+            await writer.drain()
+            self.tokens_sent += 1
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def test_sequential_requests_reuse_one_connection(self):
+        async def scenario():
+            async with StandInServer() as server:
+                backend = OllamaBackend(server.host, 4)
+                for _ in range(20):
+                    text, info = await backend.generate("hi", "m", None, 5, None)
+                    self.assertEqual(text, "".join(f"w{i} " for i in range(8)))
+                    self.assertTrue(info["done"])
+                backend.pool.close()
+                return server.connections, server.requests
+
+        self.assertEqual(run(scenario()), (1, 20))
+
+    def test_concurrency_is_bounded_by_pool_size(self):
+        async def scenario():
+            async with StandInServer(token_delay=0.005) as server:
+                backend = OllamaBackend(server.host, 2)
+                await asyncio.gather(*(backend.generate("hi", "m", None, 5, None) for _ in range(10)))
+                backend.pool.close()
+                return server.connections, server.max_active
+
+        connections, max_active = run(scenario())
+        self.assertLessEqual(connections, 2)
+        self.assertEqual(max_active, 2)
+
+    def test_stale_keep_alive_connection_is_replaced(self):
+        async def scenario():
+            async with StandInServer(close_idle_after=1) as server:
+                backend = OllamaBackend(server.host, 1)
+                texts = [(await backend.generate("hi", "m", None, 5, None))[0] for _ in range(3)]
+                backend.pool.close()
+                return texts, server.connections
+
+        texts, connections = run(scenario())
+        self.assertEqual(len(set(texts)), 1)
+        self.assertEqual(connections, 3)
+
+
+class StreamingTest(unittest.TestCase):
+
+    def test_tokens_arrive_as_they_are_generated(self):
+        async def scenario():
+            async with StandInServer(tokens=10, token_delay=0.02) as server:
+                backend = OllamaBackend(server.host, 1)
+                started = time.monotonic()
+                arrivals, tokens, info = [], [], None
+                async for token, meta in backend.stream("hi", "m", None, 5, None):
+                    if meta is not None:
+                        info = meta
+                        continue
+                    arrivals.append(time.monotonic() - started)
+                    tokens.append(token)
+                # The connection went back to the pool for the next request
+                await backend.generate("again", "m", None, 5, None)
+                backend.pool.close()
+                return arrivals, tokens, info, server.connections
+
+        arrivals, tokens, info, connections = run(scenario())
+        self.assertEqual(len(tokens), 10)
+        self.assertTrue(info["done"])
+        # The first token is seen long before the last one is generated
+        self.assertLess(arrivals[0], arrivals[-1] / 2)
+        self.assertEqual(connections, 1)
+
+    def test_cancelling_a_stream_closes_its_connection(self):
+        async def scenario():
+            async with StandInServer(tokens=200, token_delay=0.01) as server:
+                backend = OllamaBackend(server.host, 1)
+                received = []
+
+                async def consume():
+                    async for token, meta in backend.stream("hi", "m", None, 5, None):
+                        if meta is None:
+                            received.append(token)
+
+                task = asyncio.ensure_future(consume())
+                while len(received) < 3:
+                    await asyncio.sleep(0.005)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                await asyncio.wait_for(server.aborted.wait(), 2)
+                sent_at_abort = server.tokens_sent
+                await asyncio.sleep(0.1)
+                # The pool recovers with a fresh connection
+                text, _ = await backend.generate("next", "m", None, 5, None)
+                backend.pool.close()
+                return sent_at_abort, server.tokens_sent, text, server.connections
+
+        sent_at_abort, sent_later, text, connections = run(scenario())
+        self.assertLess(sent_at_abort, 200)          # generation stopped early
+        self.assertEqual(sent_later, sent_at_abort)  # and did not resume
+        self.assertTrue(text)
+        self.assertEqual(connections, 2)
+
+
+def benchmark(n=500):
+    """Requests/sec with one pooled keep-alive connection versus a new connection per request."""
+    async def measure():
+        async with StandInServer(tokens=4) as server:
+            results = {}
+            start = time.perf_counter()
+            for _ in range(n):
+                pool = AsyncConnectionPool(server.host, 1)
+                async with pool.post("/api/generate", {"prompt": "hi"}, 5) as resp:
+                    await resp.read()
+                pool.close()
+            results["new connection per request"] = n / (time.perf_counter() - start)
+
+            backend = OllamaBackend(server.host, 4)
+            start = time.perf_counter()
+            for _ in range(n):
+                await backend.generate("hi", "m", None, 5, None)
+            results["pooled keep-alive"] = n / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(backend.generate("hi", "m", None, 5, None) for _ in range(n)))
+            results["pooled, 4 concurrent"] = n / (time.perf_counter() - start)
+            backend.pool.close()
+            return results
+
+    return asyncio.run(measure())
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["bench"]:
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+        for name, rate in benchmark(count).items():
+            print(f"{name:27} {rate:10.0f} requests/sec")
+    else:
+        unittest.main()
@@ -0,0 +1,115 @@
+"""Tests for db.py: the write-behind queue and new-database settings."""
+import os
+import sqlite3
+import time
+import unittest
+
+import support
+import db
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, v TEXT)"
+
+
+def committed(path):
+    """Rows visible to another connection, i.e. actually committed."""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(support.DATA_DIR, f"{self.id()}.db")
+        db.register_setup(self.path, lambda c: c.execute(SCHEMA))
+        db.connect(self.path)
+
+    def wait_for(self, count, timeout):
+        give_up = time.monotonic() + timeout
+        while time.monotonic() < give_up:
+            if committed(self.path) >= count:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def test_every_group_commits_within_delay(self):
+        writer = db.WriteBehind(self.path, batch=64, delay=0.1)
+        writer.write("INSERT INTO t (v) VALUES (?)", ("first",))
+        self.assertTrue(self.wait_for(1, 1.0))
+        # The writer is idle now; a later row must not wait for a full batch
+        time.sleep(0.2)
+        writer.write("INSERT INTO t (v) VALUES (?)", ("second",))
+        self.assertTrue(self.wait_for(2, 1.0))
+        self.assertEqual(writer.pending, 0)
+
+    def test_rows_are_grouped_until_delay(self):
+        writer = db.WriteBehind(self.path, batch=64, delay=0.3)
+        for i in range(5):
+            writer.write("INSERT INTO t (v) VALUES (?)", (str(i),))
+        time.sleep(0.1)
+        self.assertEqual(committed(self.path), 0)
+        self.assertTrue(self.wait_for(5, 2.0))
+
+    def test_full_batch_commits_at_once(self):
+        writer = db.WriteBehind(self.path, batch=10, delay=30)
+        for i in range(10):
+            writer.write("INSERT INTO t (v) VALUES (?)", (str(i),))
+        self.assertTrue(self.wait_for(10, 1.0))
+
+    def test_sync_write_commits_before_returning(self):
+        writer = db.WriteBehind(self.path, batch=64, delay=30)
+        writer.write("INSERT INTO t (v) VALUES (?)", ("a",))
+        writer.write("INSERT INTO t (v) VALUES (?)", ("b",), sync=True)
+        self.assertEqual(committed(self.path), 2)
+
+    def test_failed_group_is_kept_and_retried(self):
+        writer = db.WriteBehind(self.path, batch=64, delay=0.05, retries=100)
+        blocker = sqlite3.connect(self.path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        old_timeout = db.config.DB_BUSY_TIMEOUT
+        db.config.DB_BUSY_TIMEOUT = 0.05  # for the writer thread's connection
+        try:
+            writer.write("INSERT INTO t (v) VALUES (?)", ("x",))
+            time.sleep(0.5)  # "database is locked" a few times over
+            self.assertEqual(writer.pending, 1)
+        finally:
+            blocker.execute("COMMIT")
+            blocker.close()
+            db.config.DB_BUSY_TIMEOUT = old_timeout
+        self.assertTrue(self.wait_for(1, 3.0))
+
+    def test_write_many_commits_together_or_not_at_all(self):
+        writer = db.WriteBehind(self.path, batch=64, delay=0.01, retries=2)
+        writer.write_many([
+            ("INSERT INTO t (v) VALUES (?)", ("partial",)),
+            ("INSERT INTO missing (v) VALUES (?)", ("x",)),
+        ])
+        writer.write_many([
+            ("INSERT INTO t (v) VALUES (?)", ("a",)),
+            ("INSERT INTO t (v) VALUES (?)", ("b",)),
+        ])
+        self.assertTrue(self.wait_for(2, 5.0))
+        conn = sqlite3.connect(self.path)
+        self.assertEqual(conn.execute("SELECT v FROM t ORDER BY id").fetchall(), [("a",), ("b",)])
+        conn.close()
+
+    def test_bad_statement_is_dropped_alone(self):
+        writer = db.WriteBehind(self.path, batch=64, delay=0.01, retries=2)
+        writer.write("INSERT INTO missing (v) VALUES (?)", ("x",))
+        writer.write("INSERT INTO t (v) VALUES (?)", ("kept",))
+        self.assertTrue(self.wait_for(1, 5.0))
+
+
+class NewDatabaseTest(unittest.TestCase):
+
+    def test_new_database_uses_incremental_auto_vacuum_and_wal(self):
+        path = os.path.join(support.DATA_DIR, "fresh.db")
+        conn = db.connect(path)
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+
+
+if __name__ == "__main__":
+    unittest.main()
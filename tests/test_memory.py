@@ -0,0 +1,157 @@
+"""Tests for memory.py: schema migrations and large bodies stored in blobs."""
+import os
+import sqlite3
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import support
+import config
+import db
+import memory
+
+LARGE = "A long response that repeats itself. " * 100
+
+
+def blobs():
+    return db.connect().execute("SELECT hash, length(data), size FROM blobs").fetchall()
+
+
+class BlobBodiesTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_brain_db()
+
+    def entries(self):
+        return db.connect().execute("SELECT prompt, response FROM log_entries ORDER BY id").fetchall()
+
+    def test_small_bodies_stay_inline(self):
+        memory.save("journal", "short prompt", "short response", sync=True)
+        row = db.connect().execute("SELECT prompt, response, prompt_hash, response_hash FROM logs").fetchone()
+        self.assertEqual(row, ("short prompt", "short response", None, None))
+        self.assertEqual(blobs(), [])
+
+    def test_large_bodies_are_compressed_into_blobs(self):
+        memory.save("journal", "short prompt", LARGE, sync=True)
+        row = db.connect().execute("SELECT response, response_hash FROM logs").fetchone()
+        self.assertIsNone(row[0])
+        [(digest, stored, size)] = blobs()
+        self.assertEqual(digest, row[1])
+        self.assertEqual(size, len(LARGE.encode("utf-8")))
+        self.assertLess(stored, size // 4)
+        self.assertEqual(self.entries(), [("short prompt", LARGE)])
+
+    def test_identical_bodies_are_stored_once(self):
+        memory.save("journal", LARGE, "first", sync=True)
+        memory.save("journal", "second", LARGE, sync=True)
+        self.assertEqual(len(blobs()), 1)
+        self.assertEqual(self.entries(), [(LARGE, "first"), ("second", LARGE)])
+
+    def test_blob_bodies_are_searchable(self):
+        memory.save("journal", "short prompt", LARGE + " zanzibar", sync=True)
+        self.assertEqual(len(list(memory.search("zanzibar"))), 1)
+
+    def test_orphans_are_collected_but_shared_blobs_kept(self):
+        memory.save("journal", "one", LARGE, sync=True)
+        memory.save("journal", "two", LARGE, sync=True)
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM logs WHERE prompt = 'one'")
+            self.assertEqual(memory.delete_orphan_blobs(conn), 0)
+            conn.execute("DELETE FROM logs")
+            self.assertEqual(memory.delete_orphan_blobs(conn), 1)
+
+    def test_blob_and_logs_row_are_queued_as_one_write(self):
+        memory.save("journal", "one", LARGE, sync=True)
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM logs")
+        writer, memory._writer = memory._writer, db.WriteBehind(delay=30)
+        try:
+            # The body is already in blobs, so this save reuses it...
+            memory.save("journal", "two", LARGE, sync=False)
+            self.assertEqual(memory._writer.pending, 1)
+            # ...while cleanup runs before the queued row is committed
+            with db.transaction() as conn:
+                memory.delete_orphan_blobs(conn)
+            memory.flush()
+        finally:
+            memory._writer = writer
+        self.assertEqual(self.entries(), [("two", LARGE)])
+
+    def test_blob_threshold_is_configurable(self):
+        old = config.BLOB_MIN_BYTES
+        config.BLOB_MIN_BYTES = 10
+        try:
+            memory.save("journal", "a prompt over ten bytes", "tiny", sync=True)
+        finally:
+            config.BLOB_MIN_BYTES = old
+        row = db.connect().execute("SELECT prompt, prompt_hash, response FROM logs").fetchone()
+        self.assertIsNone(row[0])
+        self.assertIsNotNone(row[1])
+        self.assertEqual(row[2], "tiny")
+
+
+
+class MigrationTest(unittest.TestCase):
+    """init() on a brain.db from before the first migration."""
+
+    def setUp(self):
+        self.path = os.path.join(support.DATA_DIR, f"{self.id()}.db")
+        legacy = sqlite3.connect(self.path)
+        legacy.executescript("""
+            CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, mode TEXT,
+                               prompt TEXT, response TEXT, focus INTEGER, clarity INTEGER, stress INTEGER);
+            CREATE TABLE llm_calls (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, caller TEXT,
+                                    model TEXT, prompt_tokens INTEGER, completion_tokens INTEGER, ttft REAL,
+                                    latency REAL, tokens_per_sec REAL, outcome TEXT);
+        """)
+        legacy.executemany(
+            "INSERT INTO logs (timestamp, mode, prompt, response, focus) VALUES (?, ?, ?, ?, ?)", [
+                ("2024-03-01T09:15:00", "journal", "how was the standup", "fine", 7),
+                ("2024-03-01T21:40:00", "code", "refactor the parser", LARGE, None),
+                ("not a date", "journal", "broken timestamp", "kept anyway", None),
+            ])
+        legacy.execute("INSERT INTO llm_calls (timestamp, caller, outcome) VALUES ('2024-03-01T09:15:01', 'journal', 'ok')")
+        legacy.commit()
+        legacy.close()
+        db.register_setup(self.path, memory._register_functions)
+        with mock.patch.object(config, "DB", self.path):
+            memory.init()
+        self.conn = db.connect(self.path)
+
+    def test_reaches_the_latest_version(self):
+        self.assertEqual(memory.schema_version(self.conn), len(memory.MIGRATIONS))
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(llm_calls)")]
+        self.assertIn("queue_wait", columns)
+
+    def test_iso_timestamps_become_epoch_ts(self):
+        rows = self.conn.execute("SELECT timestamp, ts FROM logs ORDER BY id").fetchall()
+        self.assertEqual(rows[0][1], memory.epoch(datetime.fromisoformat(rows[0][0])))
+        self.assertIsNone(rows[2][1])
+        self.assertIsNotNone(self.conn.execute("SELECT ts FROM llm_calls").fetchone()[0])
+
+    def test_large_bodies_move_to_blobs(self):
+        row = self.conn.execute("SELECT response, response_hash FROM logs WHERE mode = 'code'").fetchone()
+        self.assertIsNone(row[0])
+        self.assertEqual(
+            self.conn.execute("SELECT response FROM log_entries WHERE mode = 'code'").fetchone()[0], LARGE)
+
+    def test_full_text_index_covers_old_rows(self):
+        def match(text):
+            return self.conn.execute(
+                "SELECT rowid FROM logs_fts WHERE logs_fts MATCH ? ORDER BY rowid", (text,)).fetchall()
+        self.assertEqual(match("standup"), [(1,)])
+        self.assertEqual(match("repeats"), [(2,)])  # in the blob body
+
+    def test_rollups_cover_rows_with_a_timestamp(self):
+        entries = self.conn.execute("SELECT TOTAL(entries) FROM rollup_daily").fetchone()[0]
+        self.assertEqual(entries, 2)
+
+    def test_running_again_changes_nothing(self):
+        with mock.patch.object(config, "DB", self.path):
+            memory.init()
+        self.assertEqual(memory.schema_version(self.conn), len(memory.MIGRATIONS))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM logs").fetchone()[0], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
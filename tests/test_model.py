@@ -0,0 +1,55 @@
+"""Tests for model.py against the in-process fake backend."""
+import time
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (must come before LocalMind modules)
+import model
+from backends import FakeBackend
+
+
+class StreamDeadlineTest(unittest.TestCase):
+
+    def stream(self, backend, deadline):
+        with mock.patch.object(model, "_backend", backend):
+            return list(model.stream_generate("hello", deadline=deadline, caller="test"))
+
+    def test_deadline_ends_a_stream_waiting_for_its_first_token(self):
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.stream(FakeBackend(latency=10), deadline=0.3)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_deadline_ends_a_stream_that_stalls(self):
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.stream(FakeBackend(token_latency=3, tokens=20), deadline=0.3)
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_stream_within_its_deadline_is_complete(self):
+        tokens = self.stream(FakeBackend(token_latency=0.001, tokens=8), deadline=5)
+        self.assertEqual(len(tokens), 8)
+
+    def test_query_returns_fallback_when_the_deadline_passes(self):
+        with mock.patch.object(model, "_backend", FakeBackend(latency=10)):
+            started = time.monotonic()
+            self.assertEqual(model.query("hello", deadline=0.3, fallback="late"), "late")
+        self.assertLess(time.monotonic() - started, 2)
+
+
+
+class QueryAllTest(unittest.TestCase):
+
+    def test_queries_run_together_and_keep_their_order(self):
+        calls = [dict(prompt=f"question {i}", caller=caller, cache=False)
+                 for i, caller in enumerate(("dashboard.topics", "dashboard.pattern", "dashboard.topics"))]
+        with mock.patch.object(model, "_backend", FakeBackend(latency=0.3)):
+            started = time.monotonic()
+            answers = model.query_all(calls)
+            elapsed = time.monotonic() - started
+            self.assertEqual(answers, [model.query(**call) for call in calls])
+        self.assertLess(elapsed, 0.8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+"""Tests for patching.py and how debug_interactive picks a fix to apply."""
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (must come before LocalMind modules)
+import patching
+from modes import debug_interactive
+
+SOURCE = """import os
+
+
+def load(path):
+    with open(path) as f:
+        return f.read()
+
+
+def save(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def remove(path):
+    os.remove(path)
+"""
+
+
+def patch(diff):
+    return patching.apply(SOURCE, patching.hunks_for(patching.parse(diff), "files.py"))
+
+
+class ApplyTest(unittest.TestCase):
+
+    def test_exact_hunk(self):
+        result = patch("""--- a/files.py
++++ b/files.py
+@@ -9,3 +9,3 @@
+ def save(path, text):
+-    with open(path, "w") as f:
++    with open(path, "w", encoding="utf-8") as f:
+         f.write(text)
+""")
+        self.assertIn('open(path, "w", encoding="utf-8")', result)
+        self.assertEqual(len(result.splitlines()), len(SOURCE.splitlines()))
+
+    def test_wrong_line_numbers_are_found_by_content(self):
+        result = patch("""@@ -1,2 +1,3 @@
+ def remove(path):
+-    os.remove(path)
++    if os.path.exists(path):
++        os.remove(path)
+""")
+        self.assertTrue(result.endswith("    if os.path.exists(path):\n        os.remove(path)\n"))
+
+    def test_mangled_whitespace_keeps_the_files_own_context(self):
+        result = patch("""@@ -4,3 +4,3 @@
+ def load(path):
+-  with open(path) as f:
++    with open(path, encoding="utf-8") as f:
+       return f.read()
+""")
+        self.assertIn('    with open(path, encoding="utf-8") as f:\n        return f.read()\n', result)
+
+    def test_similar_context_matches(self):
+        result = patch("""@@ -9,3 +9,3 @@
+ def save(path, txt):
+-    with open(path, "w") as f:
++    with open(path, "x") as f:
+         f.write(text)
+""")
+        self.assertIn('def save(path, text):\n    with open(path, "x") as f:', result)
+
+    def test_fuzz_drops_wrong_outer_context(self):
+        result = patch("""@@ -14,4 +14,4 @@
+ # a comment the file does not have
+ def remove(path):
+-    os.remove(path)
++    os.unlink(path)
+""")
+        self.assertIn("def remove(path):\n    os.unlink(path)\n", result)
+
+    def test_hunk_that_does_not_match_raises(self):
+        with self.assertRaises(patching.PatchError):
+            patch("""@@ -1,2 +1,2 @@
+ class Storage:
+-    pass
++    root = None
+""")
+
+    def test_text_without_hunks_raises(self):
+        with self.assertRaises(patching.PatchError):
+            patching.parse("just some prose")
+
+
+class VerifyTest(unittest.TestCase):
+
+    def test_python(self):
+        self.assertTrue(patching.verify("a.py", SOURCE)[0])
+        self.assertFalse(patching.verify("a.py", "def broken(:\n")[0])
+
+    def test_json_and_xml(self):
+        self.assertFalse(patching.verify("a.json", '{"a": }')[0])
+        self.assertTrue(patching.verify("a.xml", "<a><b/></a>")[0])
+        self.assertFalse(patching.verify("a.xml", "<a><b></a>")[0])
+
+    def test_shell_when_bash_is_installed(self):
+        ok, message = patching.verify("a.sh", "if true; then\n  echo hi\n")
+        if "not found" in message:
+            self.skipTest(message)
+        self.assertFalse(ok)
+        self.assertTrue(patching.verify("a.sh", "if true; then\n  echo hi\nfi\n")[0])
+
+    def test_unknown_types_pass_unverified(self):
+        ok, message = patching.verify("a.unknown", "anything")
+        self.assertTrue(ok)
+        self.assertIn("not verified", message)
+
+
+class CoversFileTest(unittest.TestCase):
+
+    def test_whole_file_with_a_fix(self):
+        self.assertTrue(patching.covers_file(SOURCE, SOURCE.replace('"w"', '"x"')))
+
+    def test_snippet(self):
+        self.assertFalse(patching.covers_file(SOURCE, 'def save(path, text):\n    with open(path, "x") as f:\n'))
+
+
+class ApplyFixTest(unittest.TestCase):
+    """prompt_to_apply_fix: which content is offered for the file."""
+
+    def offered(self, response):
+        with mock.patch.object(debug_interactive, "apply_file_fix", return_value=True) as apply_fix, \
+                mock.patch.object(debug_interactive, "regenerate_full_file", return_value=None) as regenerate, \
+                mock.patch("builtins.input", return_value="y"), mock.patch("builtins.print"):
+            debug_interactive.prompt_to_apply_fix("files.py", response, {"files.py": SOURCE})
+        return (apply_fix.call_args[0][1] if apply_fix.called else None), regenerate.called
+
+    def test_diff_is_applied(self):
+        content, regenerated = self.offered("""```diff
+--- a/files.py
++++ b/files.py
+@@ -14,2 +14,2 @@
+ def remove(path):
+-    os.remove(path)
++    os.unlink(path)
+```""")
+        self.assertIn("os.unlink(path)", content)
+        self.assertIn("def load(path):", content)
+        self.assertFalse(regenerated)
+
+    def test_diff_that_does_not_apply_regenerates(self):
+        content, regenerated = self.offered("""```diff
+@@ -1,2 +1,2 @@
+ class Storage:
+-    pass
++    root = None
+```""")
+        self.assertIsNone(content)
+        self.assertTrue(regenerated)
+
+    def test_full_file_block_is_used(self):
+        fixed = SOURCE.replace("os.remove(path)", "os.unlink(path)")
+        content, regenerated = self.offered(f"Here it is:\n```python\n{fixed}```")
+        self.assertEqual(content.strip(), fixed.strip())
+        self.assertFalse(regenerated)
+
+    def test_snippet_is_never_written_as_the_whole_file(self):
+        content, regenerated = self.offered("""Change save():
+```python
+def save(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+```""")
+        self.assertIsNone(content)
+        self.assertTrue(regenerated)
+
+
+if __name__ == "__main__":
+    unittest.main()
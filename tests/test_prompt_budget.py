@@ -0,0 +1,54 @@
+"""Tests for prompt_budget.py: chunking and map-reduce condensing."""
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (must come before LocalMind modules)
+import prompt_budget
+
+LINE = "def handler(request): return process(request.body, retries=3)\n"
+
+
+class CondenseTest(unittest.TestCase):
+
+    def condense(self, content, answer):
+        calls = []
+
+        def query_many(prompts, **kwargs):
+            calls.append((prompts, kwargs))
+            return [answer(i, kwargs["fallback"]) for i in range(len(prompts))]
+
+        with mock.patch.object(prompt_budget, "query_many", query_many), \
+                mock.patch("builtins.print"):
+            return prompt_budget.condense(content, 500, "a test"), calls
+
+    def test_chunks_are_summarised_on_the_map_route(self):
+        content = LINE * 400
+        result, calls = self.condense(content, lambda i, failed: f"summary {i}")
+        prompts, kwargs = calls[0]
+        self.assertEqual(kwargs["caller"], "prompt_budget.map")
+        self.assertNotIn("model", kwargs)
+        budget = prompt_budget.input_budget(prompt_budget.routing.model_for("prompt_budget.map"))
+        for prompt in prompts:
+            self.assertLessEqual(prompt_budget.estimate_tokens(prompt), budget)
+        self.assertIn("[Part 1/", result)
+        self.assertLessEqual(prompt_budget.estimate_tokens(result), 500)
+
+    def test_failed_summaries_keep_the_original_chunk(self):
+        content = "".join(f"line {n}: {LINE}" for n in range(400))
+        result, _ = self.condense(content, lambda i, failed: failed if i == 0 else "short")
+        self.assertNotIn("[Error", result)
+        self.assertNotIn("timed out", result)
+        self.assertTrue(result.startswith("line 0: "))
+
+    def test_gives_up_when_every_summary_fails(self):
+        result, calls = self.condense(LINE * 400, lambda i, failed: failed)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(result.endswith("[...truncated to fit the context window...]"))
+        self.assertTrue(result.startswith(LINE))
+
+    def test_content_that_fits_is_unchanged(self):
+        self.assertEqual(prompt_budget.fit("short text", 500), "short text")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Tests for rollups.py and the trigger that keeps the rollup tables current."""
+import unittest
+from datetime import datetime, timedelta
+
+import support
+import archive
+import db
+import memory
+import rollups
+
+LARGE = "A long response that repeats itself. " * 100
+
+
+def tables():
+    conn = db.connect()
+    return (conn.execute("SELECT * FROM rollup_daily ORDER BY day, mode").fetchall(),
+            conn.execute("SELECT * FROM rollup_hourly ORDER BY day, hour, mode").fetchall())
+
+
+class RollupTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_brain_db()
+        self.now = datetime.now().replace(minute=30)
+
+    def add_log(self, when, mode, response, focus=None):
+        with db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO logs (timestamp, ts, mode, prompt, response, focus) VALUES (?, ?, ?, ?, ?, ?)",
+                (when.isoformat(), memory.epoch(when), mode, "a prompt", response, focus)
+            )
+
+    def test_trigger_counts_each_save(self):
+        memory.save("journal", "first", "four", focus=6, sync=True)
+        memory.save("journal", "second", LARGE, focus=8, sync=True)
+        memory.save("code", "third", "x", sync=True)
+        result = rollups.totals(rollups.since_day(1))
+        self.assertEqual(result["entries"], 3)
+        self.assertEqual(result["modes"], {"journal": 2, "code": 1})
+        self.assertEqual(result["avg_focus"], 7)
+        self.assertIsNone(result["avg_stress"])
+        # Blob bodies count with their uncompressed size
+        self.assertEqual(result["avg_response_length"], (4 + len(LARGE) + 1) / 3)
+        self.assertEqual(sum(rollups.hours(rollups.since_day(1)).values()), 3)
+
+    def test_windows_are_whole_local_days(self):
+        self.add_log(self.now, "journal", "today")
+        self.add_log(self.now - timedelta(days=3), "journal", "three days ago")
+        self.add_log(self.now - timedelta(days=10), "journal", "ten days ago")
+        self.assertEqual(rollups.totals(rollups.since_day(1))["entries"], 1)
+        self.assertEqual(rollups.totals(rollups.since_day(7))["entries"], 2)
+        self.assertEqual([row[1] for row in rollups.daily(rollups.since_day(30))], [1, 1, 1])
+        self.assertEqual(rollups.hours(rollups.since_day(1)), {self.now.hour: 1})
+
+    def test_rows_without_ts_are_left_out(self):
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO logs (timestamp, mode, response) VALUES ('not a date', 'journal', 'x')")
+        self.assertEqual(tables(), ([], []))
+
+    def test_rebuild_matches_the_trigger(self):
+        self.add_log(self.now, "journal", "today", focus=5)
+        self.add_log(self.now - timedelta(days=2), "code", LARGE)
+        self.add_log(self.now.replace(minute=5) - timedelta(days=2), "code", "short", focus=9)
+        before = tables()
+        self.assertEqual(rollups.rebuild(), 2)
+        self.assertEqual(tables(), before)
+
+    def test_archiving_keeps_history_and_rebuild_reads_the_archive(self):
+        self.add_log(self.now, "journal", "today")
+        self.add_log(self.now - timedelta(days=400), "journal", "last year", focus=4)
+        self.add_log(self.now - timedelta(days=401), "code", LARGE)
+        before = tables()
+        self.assertEqual(archive.archive_older_than(30, pause=0), 2)
+        self.assertEqual(tables(), before)
+        rollups.rebuild()
+        self.assertEqual(tables(), before)
+        self.assertEqual(rollups.totals(rollups.since_day(500))["entries"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,280 @@
+"""
+Vector memory: semantic recall over past prompts and responses.
+
+Every logs row is embedded once and appended to a matrix on disk
+(LOCALMIND_VECTOR_DIR), stored as int8 or float16 unit vectors and
+memory-mapped for search, so recall is one vectorised dot product over
+the history instead of a model call.
+
+Embeddings come from the backend's embedding model when
+LOCALMIND_EMBED_MODEL is set, else from hashed TF-IDF: words are hashed
+into HASH_DIM signed buckets with sublinear term frequency, and inverse
+document frequencies (kept per bucket) weight the query. The index
+records which embedder built it and is rebuilt when that changes.
+
+The index catches up with logs by id: memory.save() indexes interactive
+saves right away, and recall indexes anything still missing first.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # vector memory is unavailable without numpy
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; cross-process locking is skipped
+    fcntl = None
+
+import config
+import db
+import memory
+from backends import BackendError
+
+HASH_DIM = 1024
+_BATCH = 128          # rows embedded per backend call / metadata save
+_TEXT_CHARS = 2000    # response characters embedded per row
+_CHUNK = 512          # matrix rows converted and scored at a time (stays in CPU cache)
+_WORD = re.compile(r"[a-z0-9_]{2,}")
+
+
+def available():
+    return np is not None and config.VECTOR_MEMORY
+
+
+def _document(prompt, response):
+    return f"{prompt or ''}\n\n{(response or '')[:_TEXT_CHARS]}"
+
+
+@lru_cache(maxsize=65536)
+def _bucket(word):
+    """(bucket, sign) of a word; blake2b so buckets are stable across runs."""
+    h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % HASH_DIM, 1.0 if h >> 63 else -1.0
+
+
+def _hashed_vectors(texts):
+    vectors = np.zeros((len(texts), HASH_DIM), np.float32)
+    for row, text in enumerate(texts):
+        for word, count in Counter(_WORD.findall(text.lower())).items():
+            bucket, sign = _bucket(word)
+            vectors[row, bucket] += sign * (1.0 + math.log(count))
+    return vectors
+
+
+def _normalise(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class VectorIndex:
+    """Append-only embedding matrix plus the logs ids of its rows."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @property
+    def embedder(self):
+        return f"backend:{config.EMBED_MODEL}" if config.EMBED_MODEL else "hashed"
+
+    @property
+    def dtype(self):
+        return np.float16 if config.VECTOR_DTYPE == "float16" else np.int8
+
+    def meta(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_meta(self, meta):
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path("meta.json"))
+
+    def _reset(self, dim):
+        for name in ("vectors.bin", "ids.bin", "df.bin"):
+            if os.path.exists(self._path(name)):
+                os.unlink(self._path(name))
+        meta = {"embedder": self.embedder, "dtype": config.VECTOR_DTYPE, "dim": dim, "count": 0, "last_id": 0, "docs": 0}
+        self._save_meta(meta)
+        return meta
+
+    def _embed(self, texts):
+        if self.embedder == "hashed":
+            return _hashed_vectors(texts)
+        from model import embed
+        return np.asarray(embed(texts), dtype=np.float32)
+
+    def _quantise(self, vectors):
+        vectors = _normalise(vectors)
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * 127), -127, 127).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def _file_lock(self):
+        """Exclusive lock so only one process appends at a time (released on close)."""
+        fd = os.open(self._path("lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def update(self, rebuild=False):
+        """Embed logs rows not yet in the index; returns how many were added."""
+        memory.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            fd = self._file_lock()
+            try:
+                return self._update(rebuild)
+            finally:
+                os.close(fd)
+
+    def _update(self, rebuild):
+        meta = self.meta()
+        if rebuild or not meta or meta["embedder"] != self.embedder or meta["dtype"] != config.VECTOR_DTYPE:
+            meta = None
+        else:
+            # Drop rows appended by a run that died before saving the metadata
+            itemsize = np.dtype(self.dtype).itemsize
+            for name, size in (("vectors.bin", meta["count"] * meta["dim"] * itemsize), ("ids.bin", meta["count"] * 8)):
+                if os.path.exists(self._path(name)) and os.path.getsize(self._path(name)) > size:
+                    os.truncate(self._path(name), size)
+
+        added = 0
+        conn = db.connect()
+        while True:
+            rows = conn.execute(
+                "SELECT id, prompt, response FROM log_entries WHERE id > ? ORDER BY id LIMIT ?",
+                (meta["last_id"] if meta else 0, _BATCH)
+            ).fetchall()
+            if not rows:
+                return added
+            try:
+                vectors = self._embed([_document(p, r) for _, p, r in rows])
+            except (BackendError, TimeoutError, OSError) as e:
+                print(f"[Vector memory not updated: {e}]")
+                return added
+            if meta is None:
+                meta = self._reset(vectors.shape[1])
+            if vectors.shape[1] != meta["dim"]:
+                meta = self._reset(vectors.shape[1])
+                continue  # the embedding model changed size: start over
+
+            with open(self._path("vectors.bin"), "ab") as f:
+                f.write(self._quantise(vectors).tobytes())
+            with open(self._path("ids.bin"), "ab") as f:
+                f.write(np.asarray([row[0] for row in rows], np.int64).tobytes())
+            if self.embedder == "hashed":
+                df = self._df(meta) + (vectors != 0).sum(axis=0)
+                df.astype(np.float64).tofile(self._path("df.bin"))
+                meta["docs"] += len(rows)
+            meta["count"] += len(rows)
+            meta["last_id"] = rows[-1][0]
+            self._save_meta(meta)
+            added += len(rows)
+
+    def _df(self, meta):
+        if os.path.exists(self._path("df.bin")):
+            return np.fromfile(self._path("df.bin"), np.float64)
+        return np.zeros(meta["dim"], np.float64)
+
+    def _query_vector(self, text, meta):
+        query = self._embed([text])[0]
+        if self.embedder == "hashed":
+            # Documents hold plain term frequencies; weighting the query by
+            # idf^2 scores as if both sides carried idf
+            idf = np.log((meta["docs"] + 1) / (self._df(meta) + 1)) + 1.0
+            query = query * (idf ** 2).astype(np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def search(self, text, k=5):
+        """Return [(logs id, cosine similarity)] of the k nearest rows, best first."""
+        meta = self.meta()
+        if not meta or not meta["count"] or meta["embedder"] != self.embedder:
+            return []
+        query = self._query_vector(text, meta)
+        if query.shape[0] != meta["dim"]:
+            return []
+        count = meta["count"]
+        matrix = np.memmap(self._path("vectors.bin"), dtype=self.dtype, mode="r", shape=(count, meta["dim"]))
+        ids = np.memmap(self._path("ids.bin"), dtype=np.int64, mode="r", shape=(count,))
+        scale = 127.0 if self.dtype == np.int8 else 1.0
+
+        scores = np.empty(count, np.float32)
+        buffer = np.empty((_CHUNK, meta["dim"]), np.float32)
+        for start in range(0, count, _CHUNK):
+            part = matrix[start:start + _CHUNK]
+            block = buffer[:len(part)]
+            block[...] = part
+            np.dot(block, query, out=scores[start:start + len(part)])
+        scores /= scale
+        top = min(k, count)
+        rows = np.argpartition(-scores, top - 1)[:top]
+        rows = rows[np.argsort(-scores[rows])]
+        return [(int(ids[i]), min(float(scores[i]), 1.0)) for i in rows]
+
+
+index = VectorIndex(config.VECTOR_DIR)
+
+
+def update(rebuild=False):
+    """Bring the index up to date with logs (no-op without numpy)."""
+    return index.update(rebuild) if available() else 0
+
+
+def recall(text, k=5, mode=None):
+    """
+    Past interactions most similar to text, best first, as
+    (id, timestamp, mode, prompt, response, score). Rows deleted from logs
+    since they were indexed are skipped.
+    """
+    if not available():
+        return []
+    update()
+    # Over-fetch so mode filtering and deleted rows still leave k results
+    hits = index.search(text, k * 4 if mode else k * 2)
+    if not hits:
+        return []
+    scores = dict(hits)
+    marks = ",".join("?" * len(scores))
+    rows = db.connect().execute(
+        f"SELECT id, timestamp, mode, prompt, response FROM log_entries WHERE id IN ({marks})", list(scores)
+    ).fetchall()
+    results = [row + (scores[row[0]],) for row in rows if not mode or row[2] == mode]
+    results.sort(key=lambda r: r[-1], reverse=True)
+    return results[:k]
+
+
+def context_block(text, k=3):
+    """
+    A prompt section quoting the most relevant past answers, or "" when
+    nothing scores at least LOCALMIND_RECALL_MIN_SCORE.
+    """
+    try:
+        hits = [r for r in recall(text, k) if r[-1] >= config.RECALL_MIN_SCORE]
+    except (BackendError, TimeoutError, OSError, ValueError) as e:
+        print(f"[Vector memory unavailable: {e}]")
+        return ""
+    if not hits:
+        return ""
+    lines = ["", "Relevant past interactions (use them if they help; do not repeat them verbatim):"]
+    for _, timestamp, mode, prompt, response, _ in hits:
+        lines.append(f"[{timestamp[:10]} {mode}] Q: {(prompt or '')[:200]}")
+        lines.append(f"A: {(response or '')[:600]}")
+    return "\n".join(lines) + "\n"